@@ -1,88 +1,302 @@
 #!/usr/bin/env python
 
 import rospy
-import PyKDL
+import numpy
 from sensor_msgs.msg import Imu
 from pr2_mechanism_controllers.msg import Odometer
 from threading import Lock
-from math import fabs, pi
 from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from pr2_computer_monitor.clock import monotonic
+
+from imu_stats import quaternion_to_yaw, yaw_drift, SampleRing, AllanAccumulator, noise_stats, sample_period
+from imu_stats import MIN_NOISE_TIME, YAW, GYRO, ACCEL, AXES
 
 EPS = 0.0001
+MEASURE_TIME = 10.0 # seconds stationary before drift is measured
 
-class ImuMonitor:
+# Lock that keeps track of how long callers wait for it
+class TimedLock:
     def __init__(self):
         self.lock = Lock()
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self.count = 0
+
+    def __enter__(self):
+        start = monotonic()
+        self.lock.acquire()
+        wait = monotonic() - start
+        self.max_wait = max(self.max_wait, wait)
+        self.total_wait += wait
+        self.count += 1
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+    # (max, mean) wait in seconds since the last call
+    def reset_stats(self):
+        with self:
+            stats = (self.max_wait, self.total_wait / self.count)
+            self.max_wait = 0.0
+            self.total_wait = 0.0
+            self.count = 0
+        return stats
+
+# Defaults for each IMU, overridden by the entries of ~imus
+IMU_DEFAULTS = {
+    'name': 'imu_node',
+    'buffer_size': 30000,
+    'drift_warn': 0.5, # deg/s
+    'drift_error': 1.0, # deg/s
+    'gyro_bias_warn': 0.02, # rad/s
+    'gyro_noise_warn': 0.005, # rad/s/sqrt(Hz)
+    'accel_noise_warn': 0.01, # m/s^2/sqrt(Hz)
+}
+
+# Age of a measurement as text
+def format_age(age):
+    if age < 60:
+        return '%f seconds ago'%age
+    elif age < 3600:
+        return '%f minutes ago'%(age/60)
+    else:
+        return '%f hours ago'%(age/3600)
+
+# State of one IMU. Samples and start_time are shared with the callbacks
+# under the monitor's lock, the rest is only touched by the timer.
+class ImuState(object):
+    __slots__ = [ 'topic', 'name', 'config', 'samples', 'start_time', 'drift', 'last_measured',
+                  'allan', 'allan_generation', 'allan_total', 'dt', 'noise', 'sub' ]
+
+    def __init__(self, topic, config):
+        self.topic = topic
+        self.name = config['name']
+        self.config = config
+        # yaw, angular velocity and linear acceleration while stationary
+        self.samples = SampleRing(config['buffer_size'], 7)
+        self.start_time = rospy.Time.now()
+        self.drift = -1.0
+        self.last_measured = None
+
+        # noise and bias
+        self.allan = AllanAccumulator(7)
+        self.allan_generation = self.samples.generation
+        self.allan_total = 0
+        self.dt = None
+        self.noise = None
+        self.sub = None
+
+    # drift in deg/sec from the yaw samples since the base stopped
+    def measure_drift(self, lock):
+        with lock:
+            if self.samples.count < 3:
+                return None
+            times, data = self.samples.samples()
+        return yaw_drift(times, data[:, YAW])
+
+    def update_drift(self, lock):
+        with lock:
+            start_time = self.start_time
+        if rospy.Time.now() > start_time + rospy.Duration(MEASURE_TIME):
+            drift = self.measure_drift(lock)
+            with lock:
+                # skip the result if the base moved while measuring
+                if drift is not None and self.start_time == start_time:
+                    self.drift = drift
+                    self.start_time = rospy.Time.now()
+                    self.last_measured = rospy.Time.now()
+
+    # adds the samples since the last call to the Allan variance, starting
+    # over if the base moved in between
+    def update_noise(self, lock, odom_running):
+        with lock:
+            restart = self.samples.generation != self.allan_generation
+            if restart:
+                self.allan_generation = self.samples.generation
+                self.allan_total = 0
+            times, data = self.samples.samples(self.samples.total - self.allan_total)
+            self.allan_total = self.samples.total
+
+        if restart or not odom_running:
+            self.allan.reset()
+            self.noise = None
+        if not odom_running:
+            return
+        # keep the last good period if the timestamps didn't advance
+        dt = sample_period(times)
+        if dt is not None:
+            self.dt = dt
+        self.allan.add(data)
+        if self.dt:
+            self.noise = noise_stats(self.allan, self.dt)
+
+    def drift_status(self, lock):
+        with lock:
+            drift = self.drift
+            last_measured = self.last_measured
+
+        ds = DiagnosticStatus()
+        ds.name = "%s: Imu Drift Monitor" % self.name
+        ds.hardware_id = self.topic
+        if drift < self.config['drift_warn']:
+            ds.level = DiagnosticStatus.OK
+            ds.message = 'OK'
+        elif drift < self.config['drift_error']:
+            ds.level = DiagnosticStatus.WARN
+            ds.message = 'Drifting'
+        else:
+            ds.level = DiagnosticStatus.ERROR
+            ds.message = 'Drifting'
+        if drift < 0:
+            last_measured = 'No measurements yet, waiting for base to stop moving before measuring'
+            drift = 'N/A'
+        else:
+            last_measured = format_age((rospy.Time.now() - last_measured).to_sec())
+        ds.values = [
+            KeyValue('Topic', self.topic),
+            KeyValue('Last measured', last_measured),
+            KeyValue('Drift (deg/sec)', str(drift)) ]
+        return ds
+
+    def noise_status(self):
+        ds = DiagnosticStatus()
+        ds.name = "%s: Imu Noise Monitor" % self.name
+        ds.hardware_id = self.topic
+        ds.level = DiagnosticStatus.OK
+        ds.message = 'OK'
+        noise = self.noise
+        if noise is None:
+            ds.message = 'No measurements yet'
+            ds.values = [ KeyValue('Status', 'Waiting for %.0f seconds of samples with the base stopped' % MIN_NOISE_TIME) ]
+            return ds
+
+        problems = []
+        if (numpy.abs(noise['mean'][GYRO]) > self.config['gyro_bias_warn']).any():
+            problems.append('Gyro Bias')
+        if (noise['density'][GYRO] > self.config['gyro_noise_warn']).any():
+            problems.append('Gyro Noise')
+        if (noise['density'][ACCEL] > self.config['accel_noise_warn']).any():
+            problems.append('Accel Noise')
+        if problems:
+            ds.level = DiagnosticStatus.WARN
+            ds.message = 'High ' + ', '.join(problems)
+
+        ds.values = [ KeyValue('Sample time (sec)', '%.1f' % (self.allan.count * self.dt)),
+                      KeyValue('Sample rate (Hz)', '%.1f' % (1.0 / self.dt)) ]
+        for name, cols, unit in [ ('Gyro', GYRO, 'rad/s'), ('Accel', ACCEL, 'm/s^2') ]:
+            for i, axis in enumerate(AXES):
+                col = cols.start + i
+                ds.values.append(KeyValue('%s %s mean (%s)' % (name, axis, unit), '%.5f' % noise['mean'][col]))
+                ds.values.append(KeyValue('%s %s noise density (%s/sqrt(Hz))' % (name, axis, unit), '%.6f' % noise['density'][col]))
+                ds.values.append(KeyValue('%s %s bias instability (%s)' % (name, axis, unit), '%.6f' % noise['floor'][col]))
+                ds.values.append(KeyValue('%s %s Allan deviation' % (name, axis),
+                                          ' '.join('%.3gs:%.3g' % (tau, dev[col]) for tau, dev in zip(noise['taus'], noise['devs']))))
+        return ds
+
+# Status name for an IMU topic, torso_lift_imu/data -> torso_lift_imu
+def imu_name(topic):
+    name = topic.strip('/')
+    if name.endswith('/data'):
+        name = name[:-len('/data')]
+    return name
+
+# ~imus is a list of IMUs to monitor, each a topic name or a dict with a
+# 'topic' and any of the IMU_DEFAULTS keys. Without it, only the torso IMU
+# is monitored, with the original status names.
+def load_imu_configs():
+    defaults = dict(IMU_DEFAULTS)
+    for key in [ 'buffer_size', 'gyro_bias_warn', 'gyro_noise_warn', 'accel_noise_warn' ]:
+        defaults[key] = rospy.get_param('~' + key, defaults[key])
+
+    if not rospy.has_param('~imus'):
+        defaults['topic'] = 'torso_lift_imu/data'
+        return [ defaults ]
+
+    configs = []
+    for entry in rospy.get_param('~imus'):
+        if not isinstance(entry, dict):
+            entry = { 'topic': entry }
+        config = dict(defaults)
+        config['name'] = imu_name(entry['topic'])
+        config.update(entry)
+        configs.append(config)
+    return configs
+
+class ImuMonitor:
+    def __init__(self):
+        self.lock = TimedLock()
 
         # reset state
         self.dist = 0.0
-        self.drift = -1.0
-        self.last_angle = 0.0
-        self.start_angle = 0.0
-        self.start_time = rospy.Time.now()
+        self.last_odom = None
+
+        # one entry per IMU, all sharing the odometer and publisher
+        self.imus = [ ImuState(config['topic'], config) for config in load_imu_configs() ]
 
         # subscribe to topics
-        self.imu_sub = rospy.Subscriber('torso_lift_imu/data', Imu, self.imu_cb)
+        for imu in self.imus:
+            imu.sub = rospy.Subscriber(imu.topic, Imu, self.imu_cb, imu)
         self.odom_sub = rospy.Subscriber('base_odometry/odometer', Odometer, self.odom_cb)
 
-        # diagnostics
+        # diagnostics, published at a fixed rate instead of on every odometer message
         self.pub_diag = rospy.Publisher('/diagnostics', DiagnosticArray)
+        self.diag_timer = rospy.Timer(rospy.Duration(1.0 / rospy.get_param('~diag_rate', 1.0)),
+                                      self.diag_cb)
 
 
-    def imu_cb(self, msg):
+    def imu_cb(self, msg, imu):
+        w = msg.angular_velocity
+        a = msg.linear_acceleration
+        row = (quaternion_to_yaw(msg.orientation), w.x, w.y, w.z, a.x, a.y, a.z)
+        stamp = msg.header.stamp
+        if stamp.is_zero():
+            stamp = rospy.Time.now()
         with self.lock:
-            rot = PyKDL.Rotation.Quaternion(msg.orientation.x, msg.orientation.y,
-                                            msg.orientation.z, msg.orientation.w)
-            (r, p, self.last_angle) = rot.GetRPY()
+            imu.samples.add(stamp.to_sec(), row)
 
     def odom_cb(self, msg):
-        with self.lock:
-            dist = msg.distance + (msg.angle * 0.25)
+        dist = msg.distance + (msg.angle * 0.25)
 
-            # check if base moved
+        # check if base moved, samples from while it moved don't count
+        with self.lock:
+            self.last_odom = rospy.Time.now()
             if dist > self.dist + EPS:
-                self.start_time = rospy.Time.now()
-                self.start_angle = self.last_angle
                 self.dist = dist
-        
-            # do imu test if possible
-            if rospy.Time.now() > self.start_time + rospy.Duration(10.0):
-                self.drift = fabs(self.start_angle - self.last_angle)*180/(pi*10)
-                self.start_time = rospy.Time.now()
-                self.start_angle = self.last_angle
-                self.last_measured = rospy.Time.now()
-                
-            # publish diagnostics
-            d = DiagnosticArray()
-            d.header.stamp = rospy.Time.now()
-            ds = DiagnosticStatus()
-            ds.name = "imu_node: Imu Drift Monitor"
-            if self.drift < 0.5:
-                ds.level = DiagnosticStatus.OK
-                ds.message = 'OK'
-            elif self.drift < 1.0:
-                ds.level = DiagnosticStatus.WARN
-                ds.message = 'Drifting'
-            else:
-                ds.level = DiagnosticStatus.ERROR
-                ds.message = 'Drifting'
-            drift = self.drift
-            if self.drift < 0:
-                last_measured = 'No measurements yet, waiting for base to stop moving before measuring'
-                drift = 'N/A'
-            else:
-                age = (rospy.Time.now() - self.last_measured).to_sec()
-                if age < 60:
-                    last_measured = '%f seconds ago'%age
-                elif age < 3600:
-                    last_measured = '%f minutes ago'%(age/60)
-                else:
-                    last_measured = '%f hours ago'%(age/3600)                    
-            ds.values = [
-                KeyValue('Last measured', last_measured),
-                KeyValue('Drift (deg/sec)', str(drift)) ]
-            d.status = [ds]
-            self.pub_diag.publish(d)
+                for imu in self.imus:
+                    imu.start_time = rospy.Time.now()
+                    imu.samples.clear()
+
+    def diag_cb(self, event):
+        # do imu tests if possible, the odometer has to be running to know
+        # the base is stationary
+        with self.lock:
+            odom_running = (self.last_odom is not None and
+                            rospy.Time.now() < self.last_odom + rospy.Duration(MEASURE_TIME))
+        drift_statuses = []
+        noise_statuses = []
+        for imu in self.imus:
+            if odom_running:
+                imu.update_drift(self.lock)
+            imu.update_noise(self.lock, odom_running)
+            drift_statuses.append(imu.drift_status(self.lock))
+            noise_statuses.append(imu.noise_status())
+        max_wait, mean_wait = self.lock.reset_stats()
+
+        if event.last_real is not None:
+            rate = '%.2f' % (1.0 / max((event.current_real - event.last_real).to_sec(), 1e-6))
+        else:
+            rate = 'N/A'
+        for ds in drift_statuses:
+            ds.values += [
+                KeyValue('Publish rate (Hz)', rate),
+                KeyValue('Max lock wait (ms)', '%.3f' % (max_wait * 1000)),
+                KeyValue('Mean lock wait (ms)', '%.3f' % (mean_wait * 1000)) ]
+
+        # publish diagnostics
+        d = DiagnosticArray()
+        d.header.stamp = rospy.Time.now()
+        d.status = drift_statuses + noise_statuses
+        self.pub_diag.publish(d)
 
 def main():
     rospy.init_node('imu_monitor')
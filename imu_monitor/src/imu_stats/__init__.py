@@ -0,0 +1,3 @@
+from drift import quaternion_to_yaw, robust_slope, yaw_drift, SampleRing
+from drift import YAW, GYRO, ACCEL, AXES
+from noise import AllanAccumulator, noise_stats, sample_period, MIN_NOISE_TIME
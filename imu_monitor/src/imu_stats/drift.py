@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Yaw drift fit over a buffer of stationary IMU samples
+
+import numpy
+from math import atan2, pi
+
+MAX_FIT_SAMPLES = 200 # samples used in the slope fit
+
+# Columns of the sample buffer
+YAW = 0
+GYRO = slice(1, 4)
+ACCEL = slice(4, 7)
+AXES = [ 'X', 'Y', 'Z' ]
+
+def quaternion_to_yaw(q):
+    # Same as the yaw of KDL's GetRPY, rotation about z
+    return atan2(2.0 * (q.w * q.z + q.x * q.y), 1.0 - 2.0 * (q.y * q.y + q.z * q.z))
+
+# Theil-Sen slope, the median of the slopes between all pairs of samples.
+# One bad sample can't skew it like it would a least squares fit.
+def robust_slope(t, y):
+    if len(t) > MAX_FIT_SAMPLES:
+        idx = numpy.linspace(0, len(t) - 1, MAX_FIT_SAMPLES).astype(int)
+        t, y = t[idx], y[idx]
+    i, j = numpy.triu_indices(len(t), 1)
+    dt = t[j] - t[i]
+    ok = dt > 0
+    if not ok.any():
+        return None
+    return numpy.median((y[j] - y[i])[ok] / dt[ok])
+
+# Drift in deg/sec of yaw samples in radians, or None if they all have the
+# same time
+def yaw_drift(times, yaw):
+    # Yaw wraps at +-pi
+    slope = robust_slope(times - times[0], numpy.unwrap(yaw))
+    if slope is None:
+        return None
+    return float(abs(slope) * 180 / pi)
+
+# Preallocated ring buffer of timestamped rows of samples
+class SampleRing:
+    def __init__(self, size, width):
+        self.times = numpy.zeros(size)
+        self.data = numpy.zeros((size, width))
+        self.size = size
+        self.count = 0
+        self.next = 0
+        self.total = 0 # samples added since the last clear
+        self.generation = 0
+
+    def clear(self):
+        self.count = 0
+        self.next = 0
+        self.total = 0
+        self.generation += 1
+
+    def add(self, t, row):
+        self.times[self.next] = t
+        self.data[self.next] = row
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.total += 1
+
+    # copies of the last n samples in time order
+    def samples(self, n = None):
+        if n is None or n > self.count:
+            n = self.count
+        idx = (numpy.arange(n) + self.next - n) % self.size
+        return self.times[idx], self.data[idx]
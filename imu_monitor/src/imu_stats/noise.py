@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Allan variance, noise density and bias instability of IMU samples
+
+import numpy
+
+ALLAN_LEVELS = 12 # Allan deviation at 1, 2, 4 ... 2048 sample clusters
+MIN_ALLAN_DIFFS = 8 # cluster pairs needed before a deviation is reported
+MIN_NOISE_TIME = 10.0 # seconds of stationary samples before noise is checked
+
+# Non-overlapping Allan variance of each column, updated a batch of samples
+# at a time. For every cluster size, only the unfinished cluster and the
+# mean of the last cluster are kept, so memory doesn't grow with the data.
+class AllanAccumulator:
+    def __init__(self, width, levels = ALLAN_LEVELS):
+        self.width = width
+        self.levels = levels
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = numpy.zeros(self.width)
+        self.partial = [ numpy.zeros((0, self.width)) for k in range(self.levels) ]
+        self.last_mean = [ None ] * self.levels
+        self.sum_sq = numpy.zeros((self.levels, self.width))
+        self.diffs = numpy.zeros(self.levels, int)
+
+    def add(self, data):
+        if not len(data):
+            return
+        self.count += len(data)
+        self.total += data.sum(axis = 0)
+        for k in range(self.levels):
+            m = 2 ** k
+            rows = numpy.vstack((self.partial[k], data))
+            n = len(rows) // m
+            if n:
+                means = rows[:n * m].reshape(n, m, self.width).mean(axis = 1)
+                if self.last_mean[k] is not None:
+                    d = numpy.diff(numpy.vstack((self.last_mean[k], means)), axis = 0)
+                else:
+                    d = numpy.diff(means, axis = 0)
+                self.sum_sq[k] += (d ** 2).sum(axis = 0)
+                self.diffs[k] += len(d)
+                self.last_mean[k] = means[-1]
+            self.partial[k] = rows[n * m:]
+
+    def mean(self):
+        return self.total / max(self.count, 1)
+
+    # [ (cluster size, Allan deviation of each column) ] for the cluster
+    # sizes with enough data
+    def deviations(self):
+        return [ (2 ** k, numpy.sqrt(0.5 * self.sum_sq[k] / self.diffs[k]))
+                 for k in range(self.levels) if self.diffs[k] >= MIN_ALLAN_DIFFS ]
+
+# Typical time between samples, or None if the times don't advance, as
+# when a driver repeats a timestamp
+def sample_period(times):
+    if len(times) < 2:
+        return None
+    dt = numpy.median(numpy.diff(times))
+    if not dt > 0:
+        return None
+    return dt
+
+# Bias, noise density and bias instability of the gyros and accelerometers,
+# or None if there isn't enough data. dt is the sample period.
+def noise_stats(allan, dt):
+    devs = allan.deviations()
+    if not devs or allan.count * dt < MIN_NOISE_TIME:
+        return None
+    # White noise has ADEV(tau) = N / sqrt(tau), so the shortest cluster
+    # gives the noise density N. Bias instability is the bottom of the curve.
+    m, dev = devs[0]
+    density = dev * numpy.sqrt(m * dt)
+    floor = numpy.min([ d for m, d in devs ], axis = 0)
+    return { 'mean': allan.mean(), 'density': density, 'floor': floor,
+             'taus': [ m * dt for m, d in devs ], 'devs': [ d for m, d in devs ] }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+PKG = 'imu_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from imu_stats import quaternion_to_yaw, robust_slope, yaw_drift, SampleRing
+import imu_stats.drift
+
+import math
+import numpy
+import random
+import sys
+
+class Quaternion:
+    def __init__(self, yaw):
+        self.x = 0.0
+        self.y = 0.0
+        self.z = math.sin(yaw / 2)
+        self.w = math.cos(yaw / 2)
+
+##\brief Yaw as an IMU reports it, wrapped to +-pi
+def wrap(yaw):
+    return numpy.arctan2(numpy.sin(yaw), numpy.cos(yaw))
+
+class TestDrift(unittest.TestCase):
+    def test_quaternion_to_yaw(self):
+        for yaw in [ 0.0, 1.0, -2.5, 3.1 ]:
+            self.assertAlmostEqual(quaternion_to_yaw(Quaternion(yaw)), yaw, 9)
+
+    def test_linear_drift(self):
+        # 0.01 rad/s at 100 Hz, more samples than are used in the fit
+        times = 1000.0 + numpy.arange(3000) * 0.01
+        yaw = 0.2 + 0.01 * (times - times[0])
+        self.assert_(len(times) > imu_stats.drift.MAX_FIT_SAMPLES)
+        self.assertAlmostEqual(robust_slope(times, yaw), 0.01, 9)
+        self.assertAlmostEqual(yaw_drift(times, yaw), 0.01 * 180 / math.pi, 6)
+        self.assertAlmostEqual(yaw_drift(times, -yaw), 0.01 * 180 / math.pi, 6)
+
+    def test_downsampled_fit_keeps_ends(self):
+        # The fit spans the whole buffer even when it is downsampled
+        times = numpy.arange(1000, dtype = float)
+        yaw = numpy.where(times < 999, 0.0, 1.0)
+        slope = robust_slope(times, yaw)
+        self.assert_(slope is not None)
+        self.assertEqual(slope, 0.0) # A step in the last sample is an outlier
+
+    def test_outliers(self):
+        rand = random.Random(1)
+        times = numpy.arange(500) * 0.01
+        yaw = 0.002 * times + numpy.array([ rand.gauss(0, 1e-4) for t in times ])
+        for i in [ 10, 200, 450 ]:
+            yaw[i] += 1.0
+        self.assert_(abs(robust_slope(times, yaw) - 0.002) < 1e-4)
+
+    def test_wrapped_yaw(self):
+        # Turning through +-pi in both directions doesn't look like a jump
+        times = numpy.arange(2000) * 0.05
+        for start, rate in [ (3.0, 0.05), (-3.0, -0.05) ]:
+            yaw = wrap(start + rate * times)
+            self.assert_(numpy.abs(numpy.diff(yaw)).max() > math.pi) # It did wrap
+            self.assertAlmostEqual(yaw_drift(times, yaw), 0.05 * 180 / math.pi, 6)
+
+    def test_no_time_span(self):
+        times = numpy.zeros(5)
+        self.assertEqual(robust_slope(times, numpy.arange(5.0)), None)
+        self.assertEqual(yaw_drift(times, numpy.arange(5.0)), None)
+
+class TestSampleRing(unittest.TestCase):
+    def fill(self, ring, n):
+        for i in range(n):
+            ring.add(float(i), (i, -i))
+
+    def test_partial(self):
+        ring = SampleRing(5, 2)
+        self.fill(ring, 3)
+        times, data = ring.samples()
+        self.assertEqual(list(times), [ 0.0, 1.0, 2.0 ])
+        self.assertEqual(data.tolist(), [ [ 0, 0 ], [ 1, -1 ], [ 2, -2 ] ])
+
+    def test_wraparound(self):
+        ring = SampleRing(5, 2)
+        self.fill(ring, 12)
+        self.assertEqual(ring.count, 5)
+        self.assertEqual(ring.total, 12)
+        times, data = ring.samples()
+        self.assertEqual(list(times), [ 7.0, 8.0, 9.0, 10.0, 11.0 ])
+        self.assertEqual(list(data[:, 1]), [ -7, -8, -9, -10, -11 ])
+        times, data = ring.samples(2)
+        self.assertEqual(list(times), [ 10.0, 11.0 ])
+        self.assertEqual(len(ring.samples(20)[0]), 5)
+
+    def test_samples_are_copies(self):
+        ring = SampleRing(3, 2)
+        self.fill(ring, 3)
+        times, data = ring.samples()
+        ring.add(5.0, (5, -5))
+        self.assertEqual(list(times), [ 0.0, 1.0, 2.0 ])
+
+    def test_clear(self):
+        ring = SampleRing(5, 2)
+        self.fill(ring, 7)
+        generation = ring.generation
+        ring.clear()
+        self.assertEqual(len(ring.samples()[0]), 0)
+        self.assertEqual(ring.total, 0)
+        self.assertEqual(ring.generation, generation + 1)
+        ring.add(20.0, (1, 1))
+        self.assertEqual(list(ring.samples()[0]), [ 20.0 ])
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        for test in [ TestDrift, TestSampleRing ]:
+            suite = unittest.TestLoader().loadTestsFromTestCase(test)
+            unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'drift', TestDrift)
+        rostest.unitrun(PKG, 'sample_ring', TestSampleRing)
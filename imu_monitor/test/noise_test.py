@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+PKG = 'imu_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from imu_stats import AllanAccumulator, noise_stats, sample_period
+from imu_stats import MIN_NOISE_TIME
+
+import math
+import numpy
+import sys
+
+DT = 0.01 # 100 Hz
+
+def white_noise(sigma, n, width = 2, seed = 1):
+    return numpy.random.RandomState(seed).normal(0, sigma, (n, width))
+
+##\brief Slope of log(ADEV) against log(cluster size) between two cluster sizes
+def adev_slope(allan, m1, m2):
+    devs = dict(allan.deviations())
+    return numpy.log(devs[m2] / devs[m1]) / math.log(float(m2) / m1)
+
+class TestNoise(unittest.TestCase):
+    def test_white_noise_density(self):
+        sigma = 0.02
+        allan = AllanAccumulator(2)
+        allan.add(0.5 + white_noise(sigma, 20000))
+        stats = noise_stats(allan, DT)
+        for col in range(2):
+            self.assert_(abs(stats['density'][col] / (sigma * math.sqrt(DT)) - 1) < 0.05,
+                         "Wrong noise density: %g" % stats['density'][col])
+            self.assertAlmostEqual(stats['mean'][col], 0.5, 3)
+        self.assertEqual(stats['taus'][0], DT)
+
+    def test_white_noise_slope(self):
+        # ADEV of white noise falls as tau^-1/2, so the floor is at the
+        # longest cluster
+        allan = AllanAccumulator(2)
+        allan.add(white_noise(1.0, 50000))
+        slope = adev_slope(allan, 1, 64)
+        self.assert_((abs(slope + 0.5) < 0.1).all(), "Wrong ADEV slope: %s" % slope)
+        stats = noise_stats(allan, DT)
+        self.assertEqual(stats['floor'].tolist(), stats['devs'][-1].tolist())
+
+    def test_random_walk(self):
+        # Integrated white noise rises as tau^+1/2, the floor is at the
+        # shortest cluster
+        allan = AllanAccumulator(2)
+        allan.add(numpy.cumsum(white_noise(1e-3, 50000), axis = 0))
+        slope = adev_slope(allan, 4, 64)
+        self.assert_((abs(slope - 0.5) < 0.15).all(), "Wrong ADEV slope: %s" % slope)
+        stats = noise_stats(allan, DT)
+        self.assertEqual(stats['floor'].tolist(), stats['devs'][0].tolist())
+
+    def test_incremental(self):
+        data = white_noise(1.0, 5000, seed = 2)
+        batch = AllanAccumulator(2)
+        batch.add(data)
+        chunked = AllanAccumulator(2)
+        for start, end in [ (0, 1), (1, 7), (7, 7), (7, 1000), (1000, 1003), (1003, 5000) ]:
+            chunked.add(data[start:end])
+        self.assertEqual(chunked.count, batch.count)
+        self.assertEqual(chunked.diffs.tolist(), batch.diffs.tolist())
+        numpy.testing.assert_allclose(chunked.sum_sq, batch.sum_sq, rtol = 1e-9)
+        numpy.testing.assert_allclose(chunked.mean(), batch.mean(), rtol = 1e-9)
+
+    def test_not_enough_data(self):
+        allan = AllanAccumulator(2)
+        n = int(MIN_NOISE_TIME / DT) - 10
+        allan.add(white_noise(1.0, n))
+        self.assertEqual(noise_stats(allan, DT), None)
+        allan.add(white_noise(1.0, 20))
+        self.assert_(noise_stats(allan, DT) is not None)
+        allan.reset()
+        self.assertEqual(allan.count, 0)
+        self.assertEqual(allan.deviations(), [])
+
+    def test_sample_period(self):
+        self.assertEqual(sample_period(numpy.array([ 1.0 ])), None)
+        self.assertAlmostEqual(sample_period(numpy.arange(10) * DT), DT, 9)
+        # A driver repeating its timestamps doesn't give a zero period
+        self.assertEqual(sample_period(numpy.array([ 5.0, 5.0, 5.0 ])), None)
+        self.assertEqual(sample_period(numpy.array([ 5.0, 4.0, 3.0 ])), None)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestNoise)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'noise', TestNoise)
@@ -43,13 +43,18 @@ import pr2_camera_synchronizer.cfg.CameraSynchronizerConfig as Config
 import wge100_camera.cfg.WGE100CameraConfig as WGEConfig
 
 import rospy
+import rosgraph.masterapi
 import time
 import math
 import threading
 import signal
+import hashlib
 
 from pr2_camera_synchronizer.cfg import CameraSynchronizerConfig as ConfigType
 from pr2_camera_synchronizer.levels import *
+from pr2_camera_synchronizer.update_executor import UpdateExecutor
+from pr2_camera_synchronizer.update_transaction import UpdateTransaction
+import pr2_camera_synchronizer.update_transaction as update_transaction
 from diagnostic_msgs.msg import DiagnosticStatus, KeyValue, DiagnosticArray
 
 ETHERCAT_INTERVAL = 0.001
@@ -60,67 +65,77 @@ camera_parameters = [ param_rate, param_trig_mode ]
 
 param_proj_rate = "projector_rate"
 
+# Longest a camera or controller update may wait for its node to show up.
+DEFAULT_UPDATE_TIMEOUT = 10.0
+# An update that only starts after its transaction's deadline still gets
+# this long to land, so the latest configuration isn't thrown away.
+MIN_UPDATE_WAIT = 0.5
+# A controller that doesn't publish its waveform is checked for a new
+# service provider, a master round-trip, once every this many refreshes.
+URI_CHECK_REFRESHES = 6
+
 def roundToEthercat(val):
     return ETHERCAT_INTERVAL * round(val / ETHERCAT_INTERVAL)
 
+# Content hash of a waveform. Times are rounded so that a waveform echoed
+# back by the controller hashes the same as the one that was sent.
+def waveformHash(period, zero_offset, transitions):
+    key = (round(period, 6), round(zero_offset, 6),
+           tuple((round(t.time, 6), t.value, t.topic) for t in transitions))
+    return hashlib.sha1(repr(key)).hexdigest()
+
+# One pool of workers runs the updates of every controller and camera,
+# instead of a thread per updater that spends its life blocked.
+update_executor = UpdateExecutor()
+
+# How long a blocking call made by an update may wait.
+def updateWaitTimeout(transaction):
+    if transaction is None:
+        return DEFAULT_UPDATE_TIMEOUT
+    return max(transaction.remaining(), MIN_UPDATE_WAIT)
+
 asynchronous_updaters = []
-def killAsynchronousUpdaters():
-    for updater in asynchronous_updaters:
-        updater.kill()
-class AsynchronousUpdater(threading.Thread):
+def killAsynchronousUpdaters(timeout = 5.0):
+    return update_executor.shutdown(timeout)
+class AsynchronousUpdater:
     def __init__(self, f, name):
-        threading.Thread.__init__(self)
         self.name = name
         self.f = f
-        self.allargs = None
-        self.cv = threading.Condition()
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.transaction = None
+        self.transaction_seq = 0
         asynchronous_updaters.append(self)
-        self.exiting = False
-        self.idle = True
-        self.start()
+        update_executor.add_target(self, name)
 
+    # f gets the transaction as a keyword argument, and reports failure by
+    # raising.
     def update(self, *args, **nargs):
-        with self.cv:
-            self.allargs = (args, nargs)
-            self.cv.notify()
-            #print "update", self.allargs
-
-    def run(self):
-        #print "run"
-        while True:
-            #print "Starting loop on", self.name
-            with self.cv:
-                if self.exiting:
-                    break
-                if self.allargs == None:
-                  #print "start wait"
-                   self.idle = True
-                   self.cv.wait()
-                   self.idle_end_time = rospy.get_time()
-                   self.idle = False
-                  #print "end wait"
-                allargs = self.allargs
-                self.allargs = None
-            if allargs != None:
-                try:
-                    self.f(*allargs[0], **allargs[1])
-                except Exception, e:
-                    rospy.logerr("AsynchronousUpdater failed with exception: %s"%str(e))
-                    pass
-
-    def kill(self):
-        #print "kill"
-        #print "Killing", self.name
-        with self.cv:
-            self.exiting = True
-            self.allargs = None
-            self.cv.notify()
-
-    def getStatus(self): # For diagnostics
-        if self.idle:
-            return self.name, 0
-        interval = rospy.get_time() - self.idle_end_time
-        return self.name, interval
+        transaction = nargs.pop('transaction', None)
+        with self.lock:
+            self.submitted += 1
+            if transaction is not None:
+                transaction.add_target(self.name)
+                self.transaction = transaction
+                self.transaction_seq = self.submitted
+            update_executor.submit(self, self.run, self.submitted, args, nargs)
+
+    def run(self, seq, args, nargs):
+        # A refresh that replaces a waiting update also lands that update's
+        # transaction, so it reports in its place.
+        with self.lock:
+            transaction = None
+            if self.transaction is not None and seq >= self.transaction_seq:
+                transaction = self.transaction
+                self.transaction = None
+        try:
+            self.f(transaction = transaction, *args, **nargs)
+        except Exception, e:
+            if transaction is not None:
+                transaction.complete(self.name, False, str(e))
+            raise
+        if transaction is not None:
+            transaction.complete(self.name, True)
 
 class MultiTriggerController:
   def __init__(self, name):
@@ -131,6 +146,41 @@ class MultiTriggerController:
     self.async = AsynchronousUpdater(self.async_update, "Controller "+name)
     self.service = None
     self.transitions = []
+    # What the controller is known to have, to skip refreshes that would
+    # not change anything.
+    self.applied_hash = None
+    self.reported_hash = None
+    self.service_uri = None
+    self.refreshes_since_uri_check = 0
+    self.sent_count = 0
+    self.refresh_sent_count = 0
+    self.refresh_skipped_count = 0
+    self.restart_count = 0
+    # The controller publishes its current waveform latched, so a
+    # restarted controller shows up here with its default waveform.
+    self.waveform_sub = rospy.Subscriber(name+"/waveform", MultiWaveform, self.waveform_cb)
+
+  def waveform_cb(self, msg):
+    self.reported_hash = waveformHash(msg.period, msg.zero_offset, msg.transitions)
+
+  def lookup_service_uri(self):
+    try:
+        return rosgraph.masterapi.Master(rospy.get_name()).lookupService(self.name+"/set_waveform")
+    except Exception:
+        return None
+
+  # True if the controller may have lost the waveform we last applied.
+  # The latched waveform topic shows a restart without asking the master;
+  # the service provider is only looked up for controllers that are silent.
+  def restart_detected(self):
+    if self.reported_hash is not None:
+        return self.reported_hash != self.applied_hash
+    self.refreshes_since_uri_check += 1
+    if self.refreshes_since_uri_check < URI_CHECK_REFRESHES:
+        return False
+    self.refreshes_since_uri_check = 0
+    uri = self.lookup_service_uri()
+    return uri is not None and self.service_uri is not None and uri != self.service_uri
 
   def clear_waveform(self):
     self.transitions = []
@@ -139,29 +189,47 @@ class MultiTriggerController:
     time = roundToEthercat(time) + 0.5 * ETHERCAT_INTERVAL
     self.transitions.append(MultiWaveformTransition(time, value, topic))
   
-  def async_update(self, period, zero_offset, transitions):
+  def async_update(self, period, zero_offset, transitions, refresh = False, transaction = None):
       try:
+          new_hash = waveformHash(period, zero_offset, transitions)
+          if refresh:
+              if self.applied_hash == new_hash:
+                  if not self.restart_detected():
+                      self.refresh_skipped_count += 1
+                      return
+                  self.restart_count += 1
+              self.refresh_sent_count += 1
+
           if self.service == None:
               service_name = self.name+"/set_waveform"
-              rospy.wait_for_service(service_name)
+              rospy.wait_for_service(service_name, updateWaitTimeout(transaction))
               self.service = rospy.ServiceProxy(service_name, SetMultiWaveform)
               #print "Service", service_name, "exists."
 
           #print "Trigger async_update got proxy on", self.name
           waveform = MultiWaveform(period, zero_offset, transitions)
           #print "Updating waveform ", self.name, waveform
+          self.applied_hash = None
           rslt = self.service(waveform)
+          self.sent_count += 1
           if not rslt.success:
-              rospy.logerr("Error setting waveform %s: %s"%(self.name, rslt.status_message))
+              raise rospy.ServiceException("Error setting waveform %s: %s"%(self.name, rslt.status_message))
+          self.applied_hash = new_hash
+          self.service_uri = self.lookup_service_uri()
           #print "Done updating waveform ", self.name
       except KeyboardInterrupt: # Handle CTRL+C
           print "Aborted trigger update on", self.name
 
-  def update(self):
+  def update(self, refresh = False, transaction = None):
       # Run the update using an Asynchronous Updater so that if something
       # locks up, the rest of the node can keep working.
       #print "Trigger update on", self.name
-      self.async.update(self.period, self.zero_offset, self.transitions)
+      self.async.update(self.period, self.zero_offset, self.transitions, refresh = refresh, transaction = transaction)
+
+  # Recomputes the waveform and sends it only if it differs from the one
+  # last applied, or the controller seems to have been restarted.
+  def refresh(self):
+      self.update(refresh = True)
 
 class ProsilicaInhibitTriggerController(MultiTriggerController):
     def __init__(self, name, param, true_val, false_val):
@@ -170,19 +238,19 @@ class ProsilicaInhibitTriggerController(MultiTriggerController):
         self.true_val = true_val
         self.false_val = false_val
 
-    def process_update(self, config, level):
+    def process_update(self, config, level, transaction = None):
         self.period = 1
         self.zero_offset = 0
         self.clear_waveform()
         self.add_sample(0, { True: self.true_val, False: self.false_val}[config[self.param]], '-')
-        MultiTriggerController.update(self)
+        MultiTriggerController.update(self, transaction = transaction)
 
 class ProjectorTriggerController(MultiTriggerController):
     def __init__(self, name, proj):
         MultiTriggerController.__init__(self, name)
         self.proj = proj
 
-    def update(self):
+    def update(self, refresh = False, transaction = None):
         self.period = self.proj.repeat_period
         self.zero_offset = self.proj.zero_offset
         self.clear_waveform()
@@ -193,16 +261,16 @@ class ProjectorTriggerController(MultiTriggerController):
         for i in range(0, len(self.proj.pulse_starts)):
           self.add_sample(self.proj.pulse_starts[i], self.high_val, 'on_time')
           self.add_sample(self.proj.pulse_ends[i], 0xe, 'off_time')
-        MultiTriggerController.update(self)
+        MultiTriggerController.update(self, refresh, transaction)
 
 class SingleCameraTriggerController(MultiTriggerController):
   def __init__(self, name, camera):
     MultiTriggerController.__init__(self, name)
     self.camera = camera
 
-  def update(self):
+  def update(self, refresh = False, transaction = None):
     if self.camera.reset_cameras:
-      self.camera_reset()
+      self.camera_reset(refresh, transaction)
       return
     self.clear_waveform()
     if not self.camera.ext_trig:
@@ -226,23 +294,23 @@ class SingleCameraTriggerController(MultiTriggerController):
       self.camera.trigger_name = self.name+"/"+trigger_name
     
     #print "About to update trigger", self.name
-    MultiTriggerController.update(self)
+    MultiTriggerController.update(self, refresh, transaction)
 
-  def camera_reset(self):
+  def camera_reset(self, refresh = False, transaction = None):
     self.clear_waveform()
     self.period = 1.5
     self.add_sample(0, 0, "-")
     self.add_sample(0.1, 1, "-")
-    MultiTriggerController.update(self)
+    MultiTriggerController.update(self, refresh, transaction)
 
 class DualCameraTriggerController(SingleCameraTriggerController):
   def __init__(self, name, camera1, camera2):
     SingleCameraTriggerController.__init__(self, name, None)
     self.cameras = [camera1, camera2]
 
-  def update(self):
+  def update(self, refresh = False, transaction = None):
     if self.cameras[0].reset_cameras or self.cameras[1].reset_cameras:
-      self.camera_reset()
+      self.camera_reset(refresh, transaction)
       return
     
     if self.cameras[0].period != self.cameras[1].period or \
@@ -253,7 +321,7 @@ class DualCameraTriggerController(SingleCameraTriggerController):
     if self.cameras[0].end_offset == self.cameras[1].end_offset:
         # This works because all cameras have the same imager period.
         self.camera = self.cameras[0]
-        SingleCameraTriggerController.update(self)
+        SingleCameraTriggerController.update(self, refresh, transaction)
         self.cameras[1].trigger_name = self.cameras[0].trigger_name
         self.cameras[1].trig_rising = self.cameras[0].trig_rising
         return
@@ -293,7 +361,7 @@ class DualCameraTriggerController(SingleCameraTriggerController):
       #print self.cameras[i].trigger_name
     
     #print "About to update trigger", self.name
-    MultiTriggerController.update(self)
+    MultiTriggerController.update(self, refresh, transaction)
 
 class Projector:
   def process_update(self, config, level):
@@ -359,6 +427,10 @@ class Camera:
     self.level = level
     self.proj = proj
     self.reconfigure_client = None
+    # The latest request and the last one the camera accepted. A camera
+    # that wasn't up yet gets the latest request on a later refresh.
+    self.last_request = None
+    self.applied_request = None
     self.async = AsynchronousUpdater(self.async_apply_update, "Camera "+node_name)
     self.trig_rising = True
 
@@ -452,21 +524,23 @@ class Camera:
     self.setparam(config, param_rate, 1/self.period)
     self.setparam(config, param_trig_mode, trig_mode)
 
-  def async_apply_update(self, reconfig_request):
+  def async_apply_update(self, reconfig_request, transaction = None):
       try:    
           #print "**** Start", self.name
           if self.reconfigure_client == None:
               #print "**** Making client", self.name
-              self.reconfigure_client = DynamicReconfigureClient(self.name)
+              self.reconfigure_client = DynamicReconfigureClient(self.name, timeout = updateWaitTimeout(transaction))
               #print "**** Made client", self.name
 
+          self.applied_request = None
           self.reconfigure_client.update_configuration(reconfig_request)
+          self.applied_request = reconfig_request
           #print "**** Reconfigured client", self.name
           #print "Done updating camera ", self.name
       except KeyboardInterrupt: # Handle CTRL+C
           print "Aborted camera update on", self.name
       
-  def apply_update(self):
+  def apply_update(self, transaction = None):
       reconfig_request = {
               "ext_trig" : self.ext_trig,
               "trig_rate" : 1.0 / self.period,
@@ -480,7 +554,15 @@ class Camera:
               }
       #print self.name, reconfig_request
 
-      self.async.update(reconfig_request)
+      self.last_request = reconfig_request
+      self.async.update(reconfig_request, transaction = transaction)
+
+  # Resends the latest request if the camera hasn't accepted it, for
+  # instance because the camera node wasn't running yet.
+  def refresh(self):
+      request = self.last_request
+      if request is not None and self.applied_request != request:
+          self.async.update(request)
 
 # Need to set:
 # Global period if synchronized
@@ -532,35 +614,39 @@ class CameraSynchronizer:
           SingleCameraTriggerController('l_forearm_cam_trigger', self.cameras["forearm_l"]),
         ]
 
+    # Enough workers by default for every update of a reconfiguration to
+    # run at once.
+    update_executor.num_workers = rospy.get_param('~update_workers', len(asynchronous_updaters))
+    self.update_timeout = rospy.get_param('~update_timeout', DEFAULT_UPDATE_TIMEOUT)
+    self.transaction_count = 0
+    self.transaction = None
+    self.last_result = None
+    self.transaction_lock = threading.Lock()
+    # Latched, so clients can wait for their reconfiguration to settle.
+    self.result_pub = rospy.Publisher("~update_result", DiagnosticArray, latch = True)
     self.server = DynamicReconfigureServer(ConfigType, self.reconfigure)
 
-  @staticmethod
-  def print_threads():
-    threads = threading.enumerate()
-    n = 0
-    for t in threads:
-        if not t.isDaemon() and t != threading.currentThread():
-            try: 
-               print t.name
-            except:
-                print "Unknown thread ", t
-            n = n + 1
-    return n
-
   def kill(self):
-    print "\nWaiting for all threads to die..."
-    killAsynchronousUpdaters()
-    #time.sleep(1)
-    while self.print_threads() > 0:         
-        print "\nStill waiting for all threads to die..."
-        time.sleep(1)
+    print "\nWaiting for updates to finish..."
+    stuck = killAsynchronousUpdaters()
+    if stuck:
+        print "Abandoning updates still in progress:", ", ".join(stuck)
     print
 
   def reconfigure(self, config, level):
     # print "Reconfigure", config
+    # All the updates below are sent in parallel, and tracked by one
+    # transaction that is published once they have landed or timed out.
+    with self.transaction_lock:
+      if self.transaction is not None:
+        self.transaction.supersede()
+      self.transaction_count += 1
+      transaction = UpdateTransaction(self.transaction_count, self.update_timeout, self.publish_result)
+      transaction.stamp = rospy.get_rostime()
+      self.transaction = transaction
     # Reconfigure the projector.
     self.projector.process_update(config, level)
-    self.prosilica_inhibit.process_update(config, level)
+    self.prosilica_inhibit.process_update(config, level, transaction)
     # Reconfigure the cameras.
     for camera in self.cameras.values():
       camera.process_update(config, level)
@@ -569,28 +655,72 @@ class CameraSynchronizer:
     #for camera in self.cameras.keys():
     #  camera.update()
     for controller in self.controllers:
-        controller.update();
+        controller.update(transaction = transaction);
     for camera in self.cameras.values():
-        camera.apply_update()
+        camera.apply_update(transaction)
+    transaction.dispatched()
     #print config
     self.config = config
     return config
   
+  # Publishes the outcome of a settled transaction.
+  def publish_result(self, transaction):
+    ds = DiagnosticStatus()
+    ds.name = rospy.get_caller_id().lstrip('/') + ": Reconfiguration"
+    ds.hardware_id = "none"
+    ds.level = { update_transaction.APPLIED : DiagnosticStatus.OK,
+                 update_transaction.SUPERSEDED : DiagnosticStatus.OK,
+                 update_transaction.PARTIAL : DiagnosticStatus.WARN,
+                 update_transaction.TIMED_OUT : DiagnosticStatus.ERROR }[transaction.outcome]
+    ds.message = "Reconfiguration %i %s in %.3f s"%(transaction.id, transaction.outcome, transaction.end - transaction.start)
+    ds.values.append(KeyValue("Transaction", str(transaction.id)))
+    ds.values.append(KeyValue("Outcome", transaction.outcome))
+    for (name, success, latency, message) in transaction.status():
+        if success is None:
+            msg = "No response"
+        elif success:
+            msg = "Applied in %.3f s"%latency
+        else:
+            msg = "Failed after %.3f s: %s"%(latency, message)
+        ds.values.append(KeyValue(name, msg))
+    da = DiagnosticArray()
+    # Stamped with the reconfiguration's start, so a client can tell
+    # which result answers its request.
+    da.header.stamp = transaction.stamp
+    da.status.append(ds)
+    self.last_result = ds
+    self.result_pub.publish(da)
+    if transaction.outcome in [ update_transaction.PARTIAL, update_transaction.TIMED_OUT ]:
+        rospy.logwarn(ds.message)
+
   def update_diagnostics(self):
     da = DiagnosticArray()
     ds = DiagnosticStatus()
     ds.name = rospy.get_caller_id().lstrip('/') + ": Tasks"
     in_progress = 0;
     longest_interval = 0;
-    for updater in list(asynchronous_updaters):
-        (name, interval) = updater.getStatus()
+    total_coalesced = 0
+    for (name, interval, coalesced) in update_executor.status():
         if interval == 0:
             msg = "Idle"
         else:
             in_progress = in_progress + 1
             msg = "Update in progress (%i s)"%interval
+        if coalesced:
+            msg = msg + ", %i superseded"%coalesced
         longest_interval = max(interval, longest_interval)
+        total_coalesced = total_coalesced + coalesced
         ds.values.append(KeyValue(name, msg))
+    ds.values.append(KeyValue("Queued updates", str(update_executor.queue_depth())))
+    ds.values.append(KeyValue("Superseded updates", str(total_coalesced)))
+    ds.values.append(KeyValue("Worker threads", "%i of %i"%(len(update_executor.workers), update_executor.num_workers)))
+    if self.last_result is not None:
+        ds.values.append(KeyValue("Last reconfiguration", self.last_result.message))
+    for controller in self.controllers + [ self.prosilica_inhibit ]:
+        ds.values.append(KeyValue("Waveform "+controller.name,
+            "sent %i, refreshes sent %i, unchanged refreshes skipped %i, restarts detected %i"%
+            (controller.sent_count, controller.refresh_sent_count,
+             controller.refresh_skipped_count, controller.restart_count)))
     if in_progress == 0:
         ds.message = "Idle"
     else:
@@ -618,11 +748,14 @@ class CameraSynchronizer:
               reset_count = 0
           self.update_diagnostics()
           # In case the controllers got restarted, refresh their state.
+          # Cameras that missed their last update get it again.
           controller_update_count += 1
           if controller_update_count >= 10:
               controller_update_count = 0
               for controller in self.controllers:
-                  controller.update();
+                  controller.refresh();
+              for camera in self.cameras.values():
+                  camera.refresh()
           rospy.sleep(1)
     finally:
       rospy.signal_shutdown("Main thread exiting")
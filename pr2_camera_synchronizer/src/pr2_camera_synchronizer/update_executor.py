@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+import threading
+import time
+from collections import deque
+
+import rospy
+
+# Runs slow updates (service calls, dynamic_reconfigure) for many targets
+# on a small shared pool of worker threads.
+#
+# Each target runs at most one update at a time, and holds at most one more
+# waiting to run. Submitting to a target that already has an update waiting
+# replaces that update, since only the latest configuration matters; the
+# replaced update is counted as coalesced.
+class UpdateExecutor:
+    def __init__(self, workers = 4):
+        self.num_workers = workers
+        self.cv = threading.Condition()
+        self.ready = deque() # Targets with an update waiting and none running
+        self.pending = {}    # target -> (f, args, nargs)
+        self.started = {}    # target -> start time of the running update
+        self.coalesced = {}  # target -> count of replaced updates
+        self.names = {}
+        self.targets = []    # In the order they were added
+        self.workers = []
+        self.exiting = False
+
+    def add_target(self, target, name):
+        with self.cv:
+            self.names[target] = name
+            self.targets.append(target)
+            self.coalesced[target] = 0
+
+    def submit(self, target, f, *args, **nargs):
+        with self.cv:
+            if self.exiting:
+                return
+            if target in self.pending:
+                self.coalesced[target] = self.coalesced.get(target, 0) + 1
+            elif target not in self.started:
+                self.ready.append(target)
+            self.pending[target] = (f, args, nargs)
+            # Threads are started on demand, so an executor that's never
+            # used doesn't cost anything.
+            if len(self.workers) < min(self.num_workers, len(self.ready) + len(self.started)):
+                self._start_worker()
+            self.cv.notify()
+
+    def _start_worker(self):
+        worker = threading.Thread(target = self._run, name = "UpdateExecutor worker %i"%len(self.workers))
+        # A worker stuck in a call that never returns must not keep the
+        # process alive.
+        worker.setDaemon(True)
+        self.workers.append(worker)
+        worker.start()
+
+    def _run(self):
+        while True:
+            with self.cv:
+                while not self.ready and not self.exiting:
+                    self.cv.wait()
+                if self.exiting:
+                    break
+                target = self.ready.popleft()
+                f, args, nargs = self.pending.pop(target)
+                self.started[target] = time.time()
+            try:
+                f(*args, **nargs)
+            except Exception, e:
+                rospy.logerr("Update of %s failed with exception: %s"%(self.names.get(target, target), str(e)))
+            with self.cv:
+                del self.started[target]
+                if target in self.pending:
+                    self.ready.append(target)
+                    self.cv.notify()
+
+    # Number of targets with an update waiting to run
+    def queue_depth(self):
+        with self.cv:
+            return len(self.pending)
+
+    # (name, seconds the running update has taken or 0 if idle, coalesced
+    # update count) for each target
+    def status(self):
+        now = time.time()
+        with self.cv:
+            return [ (self.names[target],
+                      now - self.started[target] if target in self.started else 0,
+                      self.coalesced[target])
+                     for target in self.targets ]
+
+    def in_flight(self, target):
+        with self.cv:
+            if target not in self.started:
+                return 0
+            return time.time() - self.started[target]
+
+    # Drops waiting updates and stops the workers. Waits up to timeout for
+    # running updates to finish.
+    # Returns the names of targets whose updates were still running.
+    def shutdown(self, timeout = 5.0):
+        with self.cv:
+            self.exiting = True
+            self.pending.clear()
+            self.ready.clear()
+            self.cv.notifyAll()
+            workers = list(self.workers)
+        deadline = time.time() + timeout
+        for worker in workers:
+            worker.join(max(0, deadline - time.time()))
+        with self.cv:
+            return [ self.names[target] for target in self.started ]
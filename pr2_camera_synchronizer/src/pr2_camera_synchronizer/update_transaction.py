@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2008, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+import threading
+import time
+
+APPLIED = "applied"
+PARTIAL = "partial"
+TIMED_OUT = "timed out"
+SUPERSEDED = "superseded"
+
+# Tracks the updates that one reconfiguration sends to cameras and trigger
+# controllers, all of which share a single deadline.
+#
+# Each target reports back with complete(). The transaction is settled
+# once every target has reported, the deadline has passed or a newer
+# transaction has replaced it; done_cb is then called once with the
+# transaction. Reports that arrive after that are ignored.
+class UpdateTransaction:
+    def __init__(self, id, timeout, done_cb = None):
+        self.id = id
+        self.start = time.time()
+        self.deadline = self.start + timeout
+        self.done_cb = done_cb
+        self.cv = threading.Condition()
+        self.targets = []  # In the order they were added
+        self.results = {}  # target -> (success, latency, message)
+        self.outcome = None
+        self.end = None
+        self.timer = None
+        self.sealed = False # No more targets will be added
+
+    def add_target(self, name):
+        with self.cv:
+            if name not in self.targets:
+                self.targets.append(name)
+
+    # Seconds left until the deadline, never negative.
+    def remaining(self):
+        return max(0, self.deadline - time.time())
+
+    # Starts the deadline clock once all the targets have been added.
+    def dispatched(self):
+        with self.cv:
+            self.sealed = True
+            outcome = None
+            if len(self.results) == len(self.targets):
+                outcome = self._outcome()
+            else:
+                self.timer = threading.Timer(self.remaining(), self.expire)
+                self.timer.setDaemon(True)
+                self.timer.start()
+        if outcome is not None:
+            self._settle(outcome)
+
+    def complete(self, name, success, message = ""):
+        with self.cv:
+            if self.outcome is not None or name in self.results:
+                return
+            self.results[name] = (success, time.time() - self.start, message)
+            if not self.sealed or len(self.results) < len(self.targets):
+                return
+            outcome = self._outcome()
+        self._settle(outcome)
+
+    def expire(self):
+        self._settle(TIMED_OUT)
+
+    def supersede(self):
+        self._settle(SUPERSEDED)
+
+    def _outcome(self):
+        for success, latency, message in self.results.values():
+            if not success:
+                return PARTIAL
+        return APPLIED
+
+    def _settle(self, outcome):
+        with self.cv:
+            if self.outcome is not None:
+                return
+            self.outcome = outcome
+            self.end = time.time()
+            if self.timer is not None:
+                self.timer.cancel()
+            self.cv.notifyAll()
+        if self.done_cb is not None:
+            self.done_cb(self)
+
+    # Blocks until the transaction has settled or timeout runs out.
+    # Returns the outcome, or None if it hasn't settled.
+    def wait(self, timeout = None):
+        with self.cv:
+            if self.outcome is None:
+                self.cv.wait(timeout)
+            return self.outcome
+
+    # (name, success or None if it hasn't reported, latency, message) for
+    # each target
+    def status(self):
+        with self.cv:
+            return [ (name,) + self.results.get(name, (None, None, ""))
+                     for name in self.targets ]
@@ -34,7 +34,14 @@
 PKG = "pr2_camera_synchronizer"
 import roslib; roslib.load_manifest(PKG)
 from pr2_camera_synchronizer.synchronizer_classes import *
+from pr2_camera_synchronizer.update_executor import UpdateExecutor
+from pr2_camera_synchronizer.update_transaction import UpdateTransaction
+import pr2_camera_synchronizer.update_transaction as update_transaction
+import pr2_camera_synchronizer.synchronizer_classes as synchronizer_classes
 import unittest
+import rospy
+import threading
+import time
 import pr2_camera_synchronizer.cfg.CameraSynchronizerConfig as Config
                              
 DIGITS = 16
@@ -121,6 +128,313 @@ class TestCamera(unittest.TestCase):
   def testBasicFreeRun(self):
       self.runCase(60, 0.001, 0,   30, Config.CameraSynchronizer_InternalTrigger,   1/30.0, False, 1/30.0,    -1) # Freerun
 
+class FakeReconfigureClient:
+  def __init__(self, requests):
+    self.requests = requests
+
+  def update_configuration(self, request):
+    self.requests.append(request)
+
+class TestCameraRetry(unittest.TestCase):
+  def setUp(self):
+      self.camera_up = False
+      self.requests = []
+      self.saved_client = synchronizer_classes.DynamicReconfigureClient
+      synchronizer_classes.DynamicReconfigureClient = self.makeClient
+
+  def tearDown(self):
+      synchronizer_classes.DynamicReconfigureClient = self.saved_client
+
+  def makeClient(self, name, timeout = None):
+      if not self.camera_up:
+          raise rospy.ROSException("timeout exceeded while waiting for service %s/set_parameters"%name)
+      return FakeReconfigureClient(self.requests)
+
+  def waitFor(self, cond):
+      deadline = time.time() + 5
+      while not cond() and time.time() < deadline:
+          time.sleep(0.01)
+      return cond()
+
+  def apply(self, camera, config, rate):
+      config[param_rate] = rate
+      camera.process_update(config, 1)
+      transaction = UpdateTransaction(1, 5)
+      camera.apply_update(transaction)
+      transaction.dispatched()
+      return transaction.wait(5)
+
+  def testMissingCameraUpdatedLater(self):
+      paramnames = dict((name,name) for name in camera_parameters)
+      config = {
+              param_proj_rate : 60,
+              "projector_pulse_length" : 0.001,
+              "projector_pulse_shift" : 0,
+              "projector_tweak" : 0,
+              "projector_mode" : Config.CameraSynchronizer_ProjectorOn,
+              param_trig_mode : Config.CameraSynchronizer_WithProjector,
+              "camera_reset" : False,
+              }
+      proj = Projector()
+      proj.process_update(config, lvl_projector)
+      camera = Camera("test_retry_cam", proj, 1, **paramnames)
+
+      # Neither update reaches the camera, but both settle.
+      self.assertEqual(self.apply(camera, config, 30), update_transaction.PARTIAL)
+      first = camera.last_request
+      self.assertEqual(self.apply(camera, config, 15), update_transaction.PARTIAL)
+      self.assert_(self.waitFor(lambda: update_executor.in_flight(camera.async) == 0))
+      self.assertEqual(camera.applied_request, None)
+
+      self.camera_up = True
+      camera.refresh()
+      self.assert_(self.waitFor(lambda: len(self.requests) == 1))
+      self.assertEqual(self.requests, [camera.last_request])
+      self.assertNotEqual(self.requests[0]["trig_rate"], first["trig_rate"]) # Only the latest request is sent
+      self.assert_(self.waitFor(lambda: camera.applied_request is camera.last_request))
+
+      camera.refresh() # Already applied, nothing to resend
+      time.sleep(0.05)
+      self.assertEqual(len(self.requests), 1)
+
+class TestWaveformHash(unittest.TestCase):
+  def transitions(self, offset = 0):
+      return [ MultiWaveformTransition(0.0005 + offset, 1, "trigger"), MultiWaveformTransition(0.0165, 0, "-") ]
+
+  def testEqualWaveforms(self):
+      self.assertEqual(waveformHash(0.066, -0.032, self.transitions()),
+                       waveformHash(0.066, -0.032, self.transitions()))
+      # Float noise from a round trip through the controller
+      self.assertEqual(waveformHash(0.066, -0.032, self.transitions()),
+                       waveformHash(0.066 + 1e-12, -0.032, self.transitions(1e-12)))
+
+  def testDifferentWaveforms(self):
+      reference = waveformHash(0.066, -0.032, self.transitions())
+      self.assertNotEqual(reference, waveformHash(0.067, -0.032, self.transitions()))
+      self.assertNotEqual(reference, waveformHash(0.066, -0.031, self.transitions()))
+      self.assertNotEqual(reference, waveformHash(0.066, -0.032, self.transitions(0.001)))
+      self.assertNotEqual(reference, waveformHash(0.066, -0.032, self.transitions()[:1]))
+
+class FakeWaveformService:
+  def __init__(self):
+    self.calls = []
+    self.success = True
+
+  def __call__(self, waveform):
+    self.calls.append(waveform)
+    return SetWaveformResult(self.success)
+
+class SetWaveformResult:
+  def __init__(self, success):
+    self.success = success
+    self.status_message = "" if success else "Controller not running"
+
+class TestMultiTriggerController(unittest.TestCase):
+  def setUp(self):
+    self.controller = MultiTriggerController('test_trigger_controller')
+    self.service = FakeWaveformService()
+    self.controller.service = self.service
+    self.uri = 'rosrpc://c1:1234'
+    self.lookups = 0
+    self.controller.lookup_service_uri = self.lookup
+    self.controller.add_sample(0, 1, 'trigger')
+    self.controller.add_sample(0.01, 0, '-')
+
+  def lookup(self):
+    self.lookups += 1
+    return self.uri
+
+  def send(self, refresh):
+    c = self.controller
+    c.async_update(0.1, 0, c.transitions, refresh = refresh)
+
+  def counts(self):
+    c = self.controller
+    return (c.sent_count, c.refresh_sent_count, c.refresh_skipped_count, c.restart_count)
+
+  def testUnchangedRefreshSkipped(self):
+    self.send(False)
+    self.send(True)
+    self.send(True)
+    self.assertEqual(len(self.service.calls), 1)
+    self.assertEqual(self.counts(), (1, 0, 2, 0))
+    self.assertEqual(self.lookups, 1) # Only after the waveform was sent
+
+  def testChangedWaveformSent(self):
+    self.send(False)
+    self.controller.add_sample(0.05, 1, '-')
+    self.send(True)
+    self.assertEqual(len(self.service.calls), 2)
+    self.assertEqual(self.counts(), (2, 1, 0, 0))
+
+  def testResendAfterFailedApply(self):
+    self.service.success = False
+    self.assertRaises(rospy.ServiceException, self.send, False)
+    self.assertEqual(self.controller.applied_hash, None)
+    self.service.success = True
+    self.send(True)
+    self.assertEqual(len(self.service.calls), 2)
+    self.assertEqual(self.counts(), (2, 1, 0, 0))
+
+  def testResendWhenProviderChanges(self):
+    self.send(False)
+    self.uri = 'rosrpc://c1:5678' # Controller came back on a new port
+    for i in range(URI_CHECK_REFRESHES - 1):
+        self.send(True)
+    self.assertEqual(self.lookups, 1) # The master isn't asked on every refresh
+    self.assertEqual(len(self.service.calls), 1)
+    self.send(True)
+    self.assertEqual(len(self.service.calls), 2)
+    skipped = URI_CHECK_REFRESHES - 1
+    self.assertEqual(self.counts(), (2, 1, skipped, 1))
+    self.send(True)
+    self.assertEqual(self.counts(), (2, 1, skipped + 1, 1))
+
+  def testResendWhenReportedWaveformDiffers(self):
+    c = self.controller
+    self.send(False)
+    c.waveform_cb(MultiWaveform(0.1, 0, c.transitions)) # Echo of what we sent
+    self.send(True)
+    self.assertEqual(self.counts(), (1, 0, 1, 0))
+
+    # The published waveform is enough, the master isn't asked
+    self.uri = 'rosrpc://c1:5678'
+    for i in range(2 * URI_CHECK_REFRESHES):
+        self.send(True)
+    self.assertEqual(self.lookups, 1)
+    self.assertEqual(self.counts(), (1, 0, 1 + 2 * URI_CHECK_REFRESHES, 0))
+
+    c.waveform_cb(MultiWaveform(1, 0, [])) # Restarted with its default waveform
+    self.send(True)
+    self.assertEqual(len(self.service.calls), 2)
+    self.assertEqual(self.counts(), (2, 1, 1 + 2 * URI_CHECK_REFRESHES, 1))
+
+class TestUpdateExecutor(unittest.TestCase):
+  def setUp(self):
+      self.executor = UpdateExecutor(workers = 2)
+      self.calls = []
+      self.gate = threading.Event()
+
+  def tearDown(self):
+      self.gate.set()
+      self.executor.shutdown()
+
+  def record(self, target, value, block = False):
+      if block:
+          self.gate.wait(5)
+      self.calls.append((target, value))
+
+  def waitFor(self, cond):
+      deadline = time.time() + 5
+      while not cond() and time.time() < deadline:
+          time.sleep(0.01)
+      return cond()
+
+  def testLatestWins(self):
+      self.executor.add_target('a', 'a')
+      self.executor.submit('a', self.record, 'a', 0, block = True)
+      self.assert_(self.waitFor(lambda: self.executor.in_flight('a') > 0))
+      for i in range(1, 4):
+          self.executor.submit('a', self.record, 'a', i)
+      self.assertEqual(self.executor.queue_depth(), 1)
+      self.gate.set()
+      self.assert_(self.waitFor(lambda: len(self.calls) == 2))
+      time.sleep(0.05)
+      self.assertEqual(self.calls, [('a', 0), ('a', 3)]) # Updates 1 and 2 were superseded
+      self.assertEqual(self.executor.status(), [('a', 0, 2)])
+
+  def testTargetsIndependent(self):
+      for target in ['a', 'b']:
+          self.executor.add_target(target, target)
+      self.executor.submit('a', self.record, 'a', 0, block = True)
+      self.executor.submit('b', self.record, 'b', 0)
+      self.assert_(self.waitFor(lambda: ('b', 0) in self.calls)) # b isn't held up by a
+      self.assert_(len(self.executor.workers) <= 2)
+      self.gate.set()
+      self.assert_(self.waitFor(lambda: len(self.calls) == 2))
+
+  def testShutdown(self):
+      self.executor.add_target('a', 'a')
+      self.executor.submit('a', self.record, 'a', 0, block = True)
+      self.assert_(self.waitFor(lambda: self.executor.in_flight('a') > 0))
+      self.executor.submit('a', self.record, 'a', 1)
+      self.assertEqual(self.executor.shutdown(timeout = 0.1), ['a'])
+      self.gate.set()
+      time.sleep(0.05)
+      self.assertEqual(self.calls, [('a', 0)]) # The queued update was dropped
+
+class TestUpdateTransaction(unittest.TestCase):
+  def setUp(self):
+      self.settled = []
+
+  def makeTransaction(self, timeout = 5, targets = ['a', 'b']):
+      transaction = UpdateTransaction(1, timeout, self.settled.append)
+      for target in targets:
+          transaction.add_target(target)
+      return transaction
+
+  def testAllApplied(self):
+      transaction = self.makeTransaction()
+      transaction.complete('a', True)
+      transaction.dispatched()
+      self.assertEqual(self.settled, [])
+      transaction.complete('b', True)
+      self.assertEqual(transaction.wait(1), update_transaction.APPLIED)
+      self.assertEqual(self.settled, [transaction])
+      self.assertEqual([ (name, success) for (name, success, latency, message) in transaction.status() ],
+                       [('a', True), ('b', True)])
+
+  def testNoTargets(self):
+      transaction = self.makeTransaction(targets = [])
+      transaction.dispatched()
+      self.assertEqual(transaction.wait(0), update_transaction.APPLIED)
+
+  def testPartial(self):
+      transaction = self.makeTransaction()
+      transaction.dispatched()
+      transaction.complete('a', True)
+      transaction.complete('b', False, "no service")
+      self.assertEqual(transaction.wait(1), update_transaction.PARTIAL)
+      self.assertEqual(transaction.status()[1][3], "no service")
+
+  def testTimeout(self):
+      transaction = self.makeTransaction(timeout = 0.1)
+      transaction.dispatched()
+      transaction.complete('a', True)
+      self.assertEqual(transaction.wait(5), update_transaction.TIMED_OUT)
+      transaction.complete('b', True) # Too late, ignored
+      self.assertEqual(self.settled, [transaction])
+      self.assertEqual(transaction.status()[1][1], None)
+
+  def testSuperseded(self):
+      transaction = self.makeTransaction()
+      transaction.dispatched()
+      transaction.supersede()
+      transaction.complete('a', True)
+      transaction.complete('b', True)
+      self.assertEqual(transaction.outcome, update_transaction.SUPERSEDED)
+      self.assertEqual(len(self.settled), 1)
+
+  def testRefreshReportsForReplacedUpdate(self):
+      gate = threading.Event()
+      calls = []
+      def f(value, transaction = None):
+          if value == 0:
+              gate.wait(5)
+          calls.append((value, transaction))
+      updater = AsynchronousUpdater(f, "test transaction updater")
+      updater.update(0) # Holds the target busy
+      deadline = time.time() + 5
+      while update_executor.in_flight(updater) == 0 and time.time() < deadline:
+          time.sleep(0.01)
+      transaction = self.makeTransaction(targets = [])
+      updater.update(1, transaction = transaction)
+      updater.update(2) # Replaces update 1 before it runs
+      transaction.dispatched()
+      gate.set()
+      self.assertEqual(transaction.wait(5), update_transaction.APPLIED)
+      self.assertEqual(calls, [(0, None), (2, transaction)])
+
 if __name__ == '__main__':
     import rostest
     import rospy
@@ -131,4 +445,9 @@ if __name__ == '__main__':
     
     rostest.rosrun(PKG, 'test_projector', TestProjector)
     rostest.rosrun(PKG, 'test_camera', TestCamera)
+    rostest.rosrun(PKG, 'test_camera_retry', TestCameraRetry)
+    rostest.rosrun(PKG, 'test_waveform_hash', TestWaveformHash)
+    rostest.rosrun(PKG, 'test_multi_trigger_controller', TestMultiTriggerController)
+    rostest.rosrun(PKG, 'test_update_executor', TestUpdateExecutor)
+    rostest.rosrun(PKG, 'test_update_transaction', TestUpdateTransaction)
     killAsynchronousUpdaters()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Passive clock skew monitor using the header stamps of messages
+## published on other hosts
+##
+## For each remote host, subscribes to a few high rate topics published
+## there and compares their header stamps with the local receive time. No
+## packets are sent, and the estimate follows the clocks within a few
+## seconds. Stamps must be wall clock time, so this is meaningless in
+## simulation.
+
+from __future__ import with_statement, division
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+import roslib.message
+
+import traceback
+import threading
+import struct
+import sys, time
+import socket
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from pr2_computer_monitor import SkewEstimator
+from pr2_computer_monitor.clock import monotonic
+
+##### monkey-patch to suppress threading error message in python 2.7.3
+##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
+if sys.version_info[:3] == (2, 7, 3):
+    import threading
+    threading._DummyThread._Thread__stop = lambda x: 42
+#####
+
+# std_msgs/Header starts with seq, stamp.secs, stamp.nsecs
+_HEADER = struct.Struct('<III')
+
+##\brief Stamp of a serialized message, without deserializing it
+##\return Stamp in seconds, or None if the message type has no header
+_has_header = {}
+def header_stamp(msg):
+    msg_type = msg._connection_header['type']
+    if msg_type not in _has_header:
+        cls = roslib.message.get_message_class(msg_type)
+        _has_header[msg_type] = cls is not None and cls._has_header
+    if not _has_header[msg_type] or len(msg._buff) < _HEADER.size:
+        return None
+    seq, secs, nsecs = _HEADER.unpack_from(msg._buff)
+    return secs + nsecs * 1e-9
+
+##\brief Skew estimate and settings for one remote host
+class RemoteHost(object):
+    def __init__(self, name, host, topics, offset_tolerance, error_offset_tolerance,
+                 skew_tolerance, window, bin_size):
+        self.name = name
+        self.host = host
+        self.topics = topics
+        self.offset_tolerance = offset_tolerance
+        self.error_offset_tolerance = error_offset_tolerance
+        self.skew_tolerance = skew_tolerance
+        self.estimator = SkewEstimator(window, bin_size)
+        self.no_header = set()
+        self.lock = threading.Lock()
+        self.subs = []
+
+    def subscribe(self):
+        for topic in self.topics:
+            self.subs.append(rospy.Subscriber(topic, rospy.AnyMsg, self.cb, topic))
+
+    def cb(self, msg, topic):
+        received = time.time()
+        mono = monotonic()
+        stamp = header_stamp(msg)
+        with self.lock:
+            if stamp is None or stamp == 0:
+                self.no_header.add(topic)
+                return
+            self.estimator.add(stamp, received, mono)
+
+    def status(self, hardware_id, stale_time):
+        stat = DiagnosticStatus()
+        stat.name = self.name
+        stat.hardware_id = hardware_id
+        stat.level = DiagnosticStatus.OK
+        stat.message = 'OK'
+
+        with self.lock:
+            est = self.estimator
+            apparent = est.apparent_delay()
+            skew = est.skew_ppm()
+            min_delay = est.min_delay()
+            last = est.last_receive
+            stat.values = [ KeyValue('Topics', ', '.join(self.topics)),
+                            KeyValue('Messages', str(est.samples)),
+                            KeyValue('Bins In Window', str(est.num_bins())) ]
+            if self.no_header:
+                stat.values.append(KeyValue('Topics Without Stamps', ', '.join(sorted(self.no_header))))
+
+        if last is None or monotonic() - last > stale_time:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'No Stamped Messages'
+            return stat
+
+        # Apparent delay is one-way delay plus offset
+        apparent_us = apparent * 1000000
+        stat.values.extend([ KeyValue('Apparent One-Way Delay (us)', '%.0f' % apparent_us),
+                             KeyValue('Minimum Delay In Window (us)', '%.0f' % (min_delay * 1000000)),
+                             KeyValue('Offset tolerance (us)', str(self.offset_tolerance)),
+                             KeyValue('Offset tolerance (us) for Error', str(self.error_offset_tolerance)) ])
+        if skew is not None:
+            stat.values.append(KeyValue('Skew (ppm)', '%.3f' % skew))
+        stat.values.append(KeyValue('Skew tolerance (ppm)', str(self.skew_tolerance)))
+
+        if skew is not None and abs(skew) > self.skew_tolerance:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'Clock Skew Too High'
+        if apparent_us < 0:
+            # Messages can't arrive before they're sent
+            stat.values.append(KeyValue('Remote Clock Ahead By At Least (us)', '%.0f' % -apparent_us))
+        if abs(apparent_us) > self.offset_tolerance:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'Clock Offset Too High'
+        if abs(apparent_us) > self.error_offset_tolerance:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'Clock Offset Too High'
+        return stat
+
+##\brief Builds hosts from the ~hosts parameter, a list of dicts with 'host'
+## and 'topics' keys and optional 'offset_tolerance',
+## 'error_offset_tolerance' and 'skew_tolerance' keys
+def hosts_from_param(diag_hostname):
+    window = rospy.get_param('~window', 60.0)
+    bin_size = rospy.get_param('~bin_size', 1.0)
+    hosts = []
+    for cfg in rospy.get_param('~hosts', []):
+        host = cfg['host']
+        hosts.append(RemoteHost('Clock Skew from %s to %s' % (diag_hostname, host), host,
+                                cfg['topics'],
+                                cfg.get('offset_tolerance', 5000),
+                                cfg.get('error_offset_tolerance', 1000000),
+                                cfg.get('skew_tolerance', 50.0),
+                                window, bin_size))
+    return hosts
+
+if __name__ == '__main__':
+    hostname = socket.gethostname()
+
+    import optparse
+    parser = optparse.OptionParser(usage="usage: clock_skew_monitor.py [--diag-hostname=cX]")
+    parser.add_option("--diag-hostname", dest="diag_hostname",
+                      help="Computer name in diagnostics output (ex: 'c1')",
+                      metavar="DIAG_HOSTNAME",
+                      action="store", default = hostname)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('clock_skew_monitor_%s' % hostname)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'Clock skew monitor is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    if rospy.get_param('/use_sim_time', False):
+        rospy.logwarn('Clock skew monitor compares message stamps with wall time, and is meaningless with /use_sim_time')
+
+    pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
+    stale_time = rospy.get_param('~stale_time', 5.0)
+    hosts = hosts_from_param(options.diag_hostname)
+    if not hosts:
+        rospy.logerr('Clock skew monitor has no ~hosts to watch')
+    for h in hosts:
+        h.subscribe()
+
+    rate = rospy.Rate(1.0)
+    try:
+        while not rospy.is_shutdown():
+            rate.sleep()
+            msg = DiagnosticArray()
+            msg.header.stamp = rospy.get_rostime()
+            msg.status = [ h.status(hostname, stale_time) for h in hosts ]
+            pub.publish(msg)
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        traceback.print_exc()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Watches for steps and slews of the wall clock
+##
+## Steps from ntpdate or chrony make timers misfire and statuses look
+## stale. This samples the kernel clocks at a high rate, logs each step
+## with its size and publishes counts and the last step as diagnostics.
+
+from __future__ import with_statement, division
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+
+import traceback
+import threading
+import sys, time
+import socket
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from pr2_computer_monitor import ClockSentinel
+from pr2_computer_monitor.clock import monotonic
+from pr2_computer_monitor.clock_sentinel import STEP, SUSPEND, SLEW
+
+##### monkey-patch to suppress threading error message in python 2.7.3
+##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
+if sys.version_info[:3] == (2, 7, 3):
+    import threading
+    threading._DummyThread._Thread__stop = lambda x: 42
+#####
+
+class ClockStepMonitor(object):
+    def __init__(self, hostname, diag_hostname):
+        self._diag_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
+        self._mutex = threading.Lock()
+
+        self._period = 1.0 / rospy.get_param('~sample_rate', 10.0)
+        self._warn_duration = rospy.get_param('~warn_duration', 60.0)
+        step_threshold = rospy.get_param('~step_threshold_ms', 1.0) / 1000.0
+        slew_threshold = rospy.get_param('~slew_threshold_ppm', 200.0)
+        slew_window = rospy.get_param('~slew_window', 10.0)
+        self._sentinel = ClockSentinel(step_threshold, slew_threshold, slew_window)
+
+        self._last_step_mono = None
+
+        self._stat = DiagnosticStatus()
+        self._stat.name = '%s Clock Steps' % diag_hostname
+        self._stat.hardware_id = hostname
+        self._stat.level = DiagnosticStatus.OK
+        self._stat.message = 'No Data'
+
+        self._thread = threading.Thread(target = self._run, name = 'clock_sentinel')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        # Sleep on the monotonic clock, time.sleep() isn't affected by steps
+        next_sample = monotonic()
+        while not rospy.is_shutdown():
+            try:
+                with self._mutex:
+                    events = self._sentinel.sample()
+                    if [ e for e in events if e[0] == STEP ]:
+                        self._last_step_mono = monotonic()
+            except:
+                rospy.logerr(traceback.format_exc())
+                events = []
+
+            for kind, size in events:
+                if kind == STEP:
+                    rospy.logwarn('Wall clock stepped by %.3f ms' % (size * 1000))
+                elif kind == SUSPEND:
+                    rospy.logwarn('System was suspended for %.3f s' % size)
+                elif kind == SLEW:
+                    rospy.logwarn('Wall clock slewing at %.1f ppm' % size)
+
+            next_sample += self._period
+            now = monotonic()
+            if next_sample < now:
+                next_sample = now
+            time.sleep(next_sample - now)
+
+    def publish_stats(self):
+        with self._mutex:
+            sentinel = self._sentinel
+            st = self._stat
+            st.level = DiagnosticStatus.OK
+            st.message = 'OK'
+
+            st.values = [ KeyValue(key = 'Steps', value = str(sentinel.steps)),
+                          KeyValue(key = 'Suspends', value = str(sentinel.suspends)),
+                          KeyValue(key = 'Slew Events', value = str(sentinel.slews)),
+                          KeyValue(key = 'Step Threshold (ms)', value = str(sentinel.step_threshold * 1000)),
+                          KeyValue(key = 'Slew Threshold (ppm)', value = str(sentinel.slew_threshold)) ]
+            if sentinel.last_step is not None:
+                st.values.append(KeyValue(key = 'Last Step (ms)', value = '%.3f' % (sentinel.last_step * 1000)))
+                st.values.append(KeyValue(key = 'Last Step Time',
+                                          value = time.strftime('%Y-%m-%d %H:%M:%S',
+                                                                time.localtime(sentinel.last_step_time))))
+                st.values.append(KeyValue(key = 'Largest Step (ms)', value = '%.3f' % (sentinel.largest_step * 1000)))
+            if sentinel.last_suspend is not None:
+                st.values.append(KeyValue(key = 'Last Suspend (s)', value = '%.3f' % sentinel.last_suspend))
+            if sentinel.slew_rate is not None:
+                st.values.append(KeyValue(key = 'Frequency Correction (ppm)', value = '%.3f' % sentinel.slew_rate))
+
+            if self._last_step_mono is not None and \
+                    monotonic() - self._last_step_mono < self._warn_duration:
+                st.level = DiagnosticStatus.WARN
+                st.message = 'Clock Stepped'
+            if sentinel.slewing:
+                st.level = DiagnosticStatus.WARN
+                st.message = 'Clock Slewing'
+
+            msg = DiagnosticArray()
+            msg.header.stamp = rospy.get_rostime()
+            msg.status = [ st ]
+            self._diag_pub.publish(msg)
+
+if __name__ == '__main__':
+    hostname = socket.gethostname()
+
+    import optparse
+    parser = optparse.OptionParser(usage="usage: clock_step_monitor.py [--diag-hostname=cX]")
+    parser.add_option("--diag-hostname", dest="diag_hostname",
+                      help="Computer name in diagnostics output (ex: 'c1')",
+                      metavar="DIAG_HOSTNAME",
+                      action="store", default = hostname)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('clock_step_monitor_%s' % hostname)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'Clock step monitor is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    monitor = ClockStepMonitor(hostname, options.diag_hostname)
+    rate = rospy.Rate(1.0)
+
+    try:
+        while not rospy.is_shutdown():
+            rate.sleep()
+            monitor.publish_stats()
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        traceback.print_exc()
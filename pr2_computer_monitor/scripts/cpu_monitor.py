@@ -52,6 +52,8 @@ import socket
 
 from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 
+from pr2_computer_monitor.clock import monotonic
+
 ##### monkey-patch to suppress threading error message in python 2.7.3
 ##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
 if sys.version_info[:3] == (2, 7, 3):
@@ -492,8 +494,10 @@ def get_core_temp_names():
         rospy.logerr('Exception finding temp vals: %s' % traceback.format_exc())
         return []
 
-def update_status_stale(stat, last_update_time):
-    time_since_update = rospy.get_time() - last_update_time
+def update_status_stale(stat, last_update_time, now = None):
+    if now is None:
+        now = rospy.get_time()
+    time_since_update = now - last_update_time
 
     stale_status = 'OK'
     if time_since_update > 20 and time_since_update <= 35:
@@ -524,6 +528,13 @@ class CPUMonitor():
 
         self._mutex = threading.Lock()
 
+        # Update times from the monotonic clock don't jump when the wall
+        # clock is stepped, so a step can't make a status look stale
+        if rospy.get_param('~use_monotonic_time', False):
+            self._get_time = monotonic
+        else:
+            self._get_time = rospy.get_time
+
         self._check_ipmi = rospy.get_param('~check_ipmi_tool', True)
         self._enforce_speed = rospy.get_param('~enforce_clock_speed', True)
 
@@ -671,7 +682,7 @@ class CPUMonitor():
             self._nfs_stat.message = msg
             self._nfs_stat.values = vals
             
-            self._last_nfs_time = rospy.get_time()
+            self._last_nfs_time = self._get_time()
             
             if not rospy.is_shutdown():
                 self._nfs_timer = threading.Timer(5.0, self.check_nfs_stat)
@@ -716,7 +727,7 @@ class CPUMonitor():
             message = stat_dict[diag_level]
 
         with self._mutex:
-            self._last_temp_time = rospy.get_time()
+            self._last_temp_time = self._get_time()
             
             self._temp_stat.level = diag_level
             self._temp_stat.message = message
@@ -767,7 +778,7 @@ class CPUMonitor():
 
         # Update status
         with self._mutex:
-            self._last_usage_time = rospy.get_time()
+            self._last_usage_time = self._get_time()
             self._usage_stat.level = diag_level
             self._usage_stat.values = diag_vals
             
@@ -782,10 +793,10 @@ class CPUMonitor():
     def publish_stats(self):
         with self._mutex:
             # Update everything with last update times
-            update_status_stale(self._temp_stat, self._last_temp_time)
-            update_status_stale(self._usage_stat, self._last_usage_time)
+            update_status_stale(self._temp_stat, self._last_temp_time, self._get_time())
+            update_status_stale(self._usage_stat, self._last_usage_time, self._get_time())
             if self._check_nfs:
-                update_status_stale(self._nfs_stat, self._last_nfs_time)
+                update_status_stale(self._nfs_stat, self._last_nfs_time, self._get_time())
 
             msg = DiagnosticArray()
             msg.header.stamp = rospy.get_rostime()
@@ -794,14 +805,14 @@ class CPUMonitor():
             if self._check_nfs:
                 msg.status.append(self._nfs_stat)
 
-            if rospy.get_time() - self._last_publish_time > 0.5:
+            if self._get_time() - self._last_publish_time > 0.5:
                 self._diag_pub.publish(msg)
-                self._last_publish_time = rospy.get_time()
+                self._last_publish_time = self._get_time()
 
         
         # Restart temperature checking if it goes stale, #4171
         # Need to run this without mutex
-        if rospy.get_time() - self._last_temp_time > 90: 
+        if self._get_time() - self._last_temp_time > 90: 
             self._restart_temp_check()
 
 
@@ -51,6 +51,10 @@ import socket
 
 from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 
+from pr2_computer_monitor import DirUsageIndex, WriteLatencyProbe
+from pr2_computer_monitor.write_latency import latency_level
+from pr2_computer_monitor.clock import monotonic
+
 ##### monkey-patch to suppress threading error message in python 2.7.3
 ##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
 if sys.version_info[:3] == (2, 7, 3):
@@ -67,6 +71,7 @@ hd_temp_error = 70 # Above this temperature, hard drives will have serious probl
 stat_dict = { 0: 'OK', 1: 'Warning', 2: 'Error' }
 temp_dict = { 0: 'OK', 1: 'Hot', 2: 'Critical Hot' }
 usage_dict = { 0: 'OK', 1: 'Low Disk Space', 2: 'Very Low Disk Space' }
+latency_dict = { 0: 'OK', 1: 'Slow Writes', 2: 'Very Slow Writes' }
 
 REMOVABLE = ['/dev/sda'] # Store removable drives so we can ignore if removed
 
@@ -113,8 +118,10 @@ def get_hddtemp_data(hostname = 'localhost', port = 7634):
         rospy.logerr(traceback.format_exc())
         return False, [ 'Exception' ], [ traceback.format_exc() ], [ 0 ]
 
-def update_status_stale(stat, last_update_time):
-    time_since_update = rospy.get_time() - last_update_time
+def update_status_stale(stat, last_update_time, now = None):
+    if now is None:
+        now = rospy.get_time()
+    time_since_update = now - last_update_time
 
     stale_status = 'OK'
     if time_since_update > 20 and time_since_update <= 35:
@@ -142,19 +149,48 @@ class hd_monitor():
         self._mutex = threading.Lock()
         
         self._hostname = hostname
+
+        # Update times from the monotonic clock don't jump when the wall
+        # clock is stepped, so a step can't make a status look stale
+        if rospy.get_param('~use_monotonic_time', False):
+            self._get_time = monotonic
+        else:
+            self._get_time = rospy.get_time
+
         self._no_temp_warn = rospy.get_param('~no_hd_temp_warn', False)
         if self._no_temp_warn:
             rospy.logwarn('Not warning for HD temperatures is deprecated. This will be removed in D-turtle')
         self._home_dir = home_dir
 
+        # Optional directories (ex: ~/.ros/log) to keep a usage index of
+        self._watch_dirs = rospy.get_param('~watch_dirs', [])
+        self._watch_top_n = rospy.get_param('~watch_top_n', 5)
+        self._dir_index = None
+        if self._watch_dirs and self._home_dir == '':
+            rospy.logwarn('Watched directories are reported with HD usage, which needs a home directory. Not watching %s' % self._watch_dirs)
+        elif self._watch_dirs:
+            try:
+                self._dir_index = DirUsageIndex(self._watch_dirs)
+            except:
+                rospy.logerr('Unable to index watched directories: %s' % traceback.format_exc())
+
+        # Optional directories to probe write+fsync latency in, one per mount
+        self._probe_dirs = rospy.get_param('~latency_probe_dirs', [])
+        self._probe_period = rospy.get_param('~latency_probe_period', 5.0)
+        self._latency_warn = rospy.get_param('~latency_warn_ms', 100.0) / 1000.0
+        self._latency_error = rospy.get_param('~latency_error_ms', 1000.0) / 1000.0
+        self._probes = [ WriteLatencyProbe(d) for d in self._probe_dirs ]
+
         self._diag_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
 
         self._last_temp_time = 0
         self._last_usage_time = 0
+        self._last_latency_time = 0
         self._last_publish_time = 0
 
         self._temp_timer = None
         self._usage_timer = None
+        self._latency_timer = None
 
         self._temp_stat = DiagnosticStatus()
         self._temp_stat.name = "%s HD Temperature" % diag_hostname
@@ -173,6 +209,16 @@ class hd_monitor():
                                         KeyValue(key = 'Time Since Last Update', value = 'N/A') ]
             self.check_disk_usage()
 
+        if self._probes:
+            self._latency_stat = DiagnosticStatus()
+            self._latency_stat.level = DiagnosticStatus.ERROR
+            self._latency_stat.hardware_id = hostname
+            self._latency_stat.name = '%s HD Write Latency' % diag_hostname
+            self._latency_stat.message = 'No Data'
+            self._latency_stat.values = [ KeyValue(key = 'Update Status', value = 'No Data' ),
+                                          KeyValue(key = 'Time Since Last Update', value = 'N/A') ]
+            self.check_write_latency()
+
         self.check_temps()
 
     ## Must have the lock to cancel everything
@@ -185,6 +231,10 @@ class hd_monitor():
             self._usage_timer.cancel()
             self._usage_timer = None
 
+        if self._latency_timer:
+            self._latency_timer.cancel()
+            self._latency_timer = None
+
     def check_temps(self):
         if rospy.is_shutdown():
             with self._mutex:
@@ -225,7 +275,7 @@ class hd_monitor():
             diag_level = DiagnosticStatus.ERROR
 
         with self._mutex:
-            self._last_temp_time = rospy.get_time()
+            self._last_temp_time = self._get_time()
             self._temp_stat.values = diag_strs
             self._temp_stat.level = diag_level
             
@@ -311,10 +361,13 @@ class hd_monitor():
 
             diag_level = DiagnosticStatus.ERROR
             diag_message = stat_dict[diag_level]
+
+        if self._dir_index:
+            diag_vals.extend(self.check_watched_dirs())
             
         # Update status
         with self._mutex:
-            self._last_usage_time = rospy.get_time()
+            self._last_usage_time = self._get_time()
             self._usage_stat.values = diag_vals
             self._usage_stat.message = diag_message
             self._usage_stat.level = diag_level
@@ -325,21 +378,115 @@ class hd_monitor():
             else:
                 self.cancel_timers()
 
-        
+
+    ## Deletes the latency probe files, so they aren't left behind
+    def remove_probes(self):
+        for probe in self._probes:
+            probe.remove()
+
+    ## Times a small write+fsync in each probe directory. A hung filesystem
+    ## holds up this timer, so it shows up as a stale status.
+    def check_write_latency(self):
+        if rospy.is_shutdown():
+            with self._mutex:
+                self.cancel_timers()
+            return
+
+        diag_vals = [ KeyValue(key = 'Update Status', value = 'OK' ),
+                      KeyValue(key = 'Time Since Last Update', value = '0' ) ]
+        diag_level = DiagnosticStatus.OK
+
+        for index, probe in enumerate(self._probes):
+            level = DiagnosticStatus.OK
+            try:
+                probe.probe()
+            except OSError, e:
+                rospy.logerr('Write latency probe failed in %s: %s' % (probe.directory, e))
+                level = DiagnosticStatus.ERROR
+                diag_vals.append(KeyValue(key = 'Dir %d Probe Error' % (index + 1), value = str(e)))
+
+            hist = probe.total_hist
+            if level == DiagnosticStatus.OK:
+                level = latency_level(hist, self._latency_warn, self._latency_error)
+
+            diag_vals.append(KeyValue(key = 'Dir %d' % (index + 1), value = probe.directory))
+            diag_vals.append(KeyValue(key = 'Dir %d Status' % (index + 1), value = latency_dict[level]))
+            diag_vals.append(KeyValue(key = 'Dir %d Last Write+Fsync (ms)' % (index + 1),
+                                      value = '%.2f' % (hist.last() * 1000)))
+            diag_vals.append(KeyValue(key = 'Dir %d p50 Write+Fsync (ms)' % (index + 1),
+                                      value = '%.2f' % (hist.percentile(50) * 1000)))
+            diag_vals.append(KeyValue(key = 'Dir %d p99 Write+Fsync (ms)' % (index + 1),
+                                      value = '%.2f' % (hist.percentile(99) * 1000)))
+            diag_vals.append(KeyValue(key = 'Dir %d Max Write+Fsync (ms)' % (index + 1),
+                                      value = '%.2f' % (hist.max() * 1000)))
+            diag_vals.append(KeyValue(key = 'Dir %d p99 Write (ms)' % (index + 1),
+                                      value = '%.2f' % (probe.write_hist.percentile(99) * 1000)))
+            diag_vals.append(KeyValue(key = 'Dir %d Probe Errors' % (index + 1), value = str(probe.errors)))
+
+            diag_level = max(diag_level, level)
+
+        diag_vals.append(KeyValue(key = 'Warn Latency (ms)', value = '%.0f' % (self._latency_warn * 1000)))
+        diag_vals.append(KeyValue(key = 'Error Latency (ms)', value = '%.0f' % (self._latency_error * 1000)))
+
+        with self._mutex:
+            self._last_latency_time = self._get_time()
+            self._latency_stat.values = diag_vals
+            self._latency_stat.level = diag_level
+            self._latency_stat.message = latency_dict[diag_level]
+
+            if not rospy.is_shutdown():
+                self._latency_timer = threading.Timer(self._probe_period, self.check_write_latency)
+                self._latency_timer.start()
+            else:
+                self.cancel_timers()
+
+    ## Reports largest and fastest growing directories from the usage index
+    def check_watched_dirs(self):
+        vals = []
+        try:
+            self._dir_index.update()
+
+            for index, root in enumerate(self._dir_index.roots):
+                vals.append(KeyValue(key = 'Watched Dir %d' % (index + 1), value = root))
+                vals.append(KeyValue(key = 'Watched Dir %d Size (MB)' % (index + 1),
+                                     value = '%.1f' % (self._dir_index.total(root) / 1e6)))
+
+            for index, (path, size) in enumerate(self._dir_index.largest(self._watch_top_n)):
+                vals.append(KeyValue(key = 'Largest Dir %d' % (index + 1),
+                                     value = '%s (%.1f MB)' % (path, size / 1e6)))
+
+            for index, (path, rate) in enumerate(self._dir_index.fastest_growing(self._watch_top_n)):
+                vals.append(KeyValue(key = 'Fastest Growing Dir %d' % (index + 1),
+                                     value = '%s (%.3f MB/s)' % (path, rate / 1e6)))
+
+            stats = self._dir_index.get_stats()
+            vals.append(KeyValue(key = 'Watched Dir Files', value = str(stats['files'])))
+            vals.append(KeyValue(key = 'Watched Dir Watches', value = str(stats['watches'])))
+            if stats['watch_errors'] > 0:
+                vals.append(KeyValue(key = 'Watched Dir Watch Errors', value = str(stats['watch_errors'])))
+        except:
+            rospy.logerr(traceback.format_exc())
+            vals.append(KeyValue(key = 'Watched Dir Reading', value = 'Exception'))
+
+        return vals
+
     def publish_stats(self):
         with self._mutex:
-            update_status_stale(self._temp_stat, self._last_temp_time)
+            update_status_stale(self._temp_stat, self._last_temp_time, self._get_time())
             
             msg = DiagnosticArray()
             msg.header.stamp = rospy.get_rostime()
             msg.status.append(self._temp_stat)
             if self._home_dir != '':
-                update_status_stale(self._usage_stat, self._last_usage_time)
+                update_status_stale(self._usage_stat, self._last_usage_time, self._get_time())
                 msg.status.append(self._usage_stat)
+            if self._probes:
+                update_status_stale(self._latency_stat, self._last_latency_time, self._get_time())
+                msg.status.append(self._latency_stat)
                 
-            if rospy.get_time() - self._last_publish_time > 0.5:
+            if self._get_time() - self._last_publish_time > 0.5:
                 self._diag_pub.publish(msg)
-                self._last_publish_time = rospy.get_time()
+                self._last_publish_time = self._get_time()
             
 
 
@@ -380,6 +527,7 @@ if __name__ == '__main__':
         traceback.print_exc()
 
     hd_monitor.cancel_timers()
+    hd_monitor.remove_probes()
     sys.exit(0)
     
 
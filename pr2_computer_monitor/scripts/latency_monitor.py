@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Round trip latency and loss to the base station and other robot
+## computers, measured against udp_echo_responder.py on each target
+
+from __future__ import with_statement, division
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+
+import traceback
+import sys
+import socket
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from pr2_computer_monitor import EchoProber
+from pr2_computer_monitor.udp_echo import ECHO_PORT
+
+##### monkey-patch to suppress threading error message in python 2.7.3
+##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
+if sys.version_info[:3] == (2, 7, 3):
+    import threading
+    threading._DummyThread._Thread__stop = lambda x: 42
+#####
+
+def _ms(val):
+    if val is None:
+        return 'N/A'
+    return '%.2f' % (val * 1000)
+
+##\brief Prober and thresholds for one target
+class LatencyTarget(object):
+    def __init__(self, name, hardware_id, prober, rtt_warn, rtt_error, loss_warn, loss_error):
+        self.name = name
+        self.hardware_id = hardware_id
+        self.prober = prober
+        self.rtt_warn = rtt_warn
+        self.rtt_error = rtt_error
+        self.loss_warn = loss_warn
+        self.loss_error = loss_error
+
+    def status(self):
+        s = self.prober.get_stats()
+        stat = DiagnosticStatus()
+        stat.name = self.name
+        stat.hardware_id = self.hardware_id
+        stat.level = DiagnosticStatus.OK
+        stat.message = 'OK'
+        stat.values = [ KeyValue('Target', '%s:%d' % (self.prober.host, self.prober.port)),
+                        KeyValue('RTT p50 (ms)', _ms(s.p50)),
+                        KeyValue('RTT p95 (ms)', _ms(s.p95)),
+                        KeyValue('RTT p99 (ms)', _ms(s.p99)),
+                        KeyValue('RTT Max (ms)', _ms(s.max)),
+                        KeyValue('Loss (%)', 'N/A' if s.loss_percent is None else '%.1f' % s.loss_percent),
+                        KeyValue('Sent', str(s.sent)),
+                        KeyValue('Received', str(s.received)),
+                        KeyValue('Lost', str(s.lost)),
+                        KeyValue('Late', str(s.late)),
+                        KeyValue('Time Since Reply', 'N/A' if s.last_reply_age is None else '%.1f' % s.last_reply_age),
+                        KeyValue('RTT p95 Warning (ms)', _ms(self.rtt_warn)),
+                        KeyValue('Loss Warning (%)', str(self.loss_warn)) ]
+
+        if s.p95 is not None and s.p95 > self.rtt_warn:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'High Latency'
+        if s.loss_percent is not None and s.loss_percent > self.loss_warn:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'Packet Loss'
+        if s.p95 is not None and s.p95 > self.rtt_error:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'High Latency'
+        if s.loss_percent is not None and s.loss_percent > self.loss_error:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'Packet Loss'
+        if s.sent > 0 and s.received == 0 and s.lost > 0:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'No Replies'
+        return stat
+
+##\brief Builds targets from ~targets, a list of dicts with a 'host' key
+## and optional 'port', 'rate', 'timeout', 'size', 'rtt_warn_ms',
+## 'rtt_error_ms', 'loss_warn' and 'loss_error' keys
+def targets_from_param(diag_hostname, hardware_id):
+    defaults = { 'port': rospy.get_param('~port', ECHO_PORT),
+                 'rate': rospy.get_param('~rate', 10.0),
+                 'timeout': rospy.get_param('~timeout', 1.0),
+                 'size': rospy.get_param('~size', 64),
+                 'rtt_warn_ms': rospy.get_param('~rtt_warn_ms', 50.0),
+                 'rtt_error_ms': rospy.get_param('~rtt_error_ms', 200.0),
+                 'loss_warn': rospy.get_param('~loss_warn', 1.0),
+                 'loss_error': rospy.get_param('~loss_error', 10.0) }
+    targets = []
+    for entry in rospy.get_param('~targets', []):
+        cfg = dict(defaults)
+        cfg.update(entry)
+        prober = EchoProber(cfg['host'], cfg['port'], cfg['rate'], cfg['timeout'], cfg['size'])
+        targets.append(LatencyTarget('Network Latency from %s to %s' % (diag_hostname, cfg['host']),
+                                     hardware_id, prober,
+                                     cfg['rtt_warn_ms'] / 1000.0, cfg['rtt_error_ms'] / 1000.0,
+                                     cfg['loss_warn'], cfg['loss_error']))
+    return targets
+
+if __name__ == '__main__':
+    hostname = socket.gethostname()
+
+    import optparse
+    parser = optparse.OptionParser(usage="usage: latency_monitor.py [--diag-hostname=cX]")
+    parser.add_option("--diag-hostname", dest="diag_hostname",
+                      help="Computer name in diagnostics output (ex: 'c1')",
+                      metavar="DIAG_HOSTNAME",
+                      action="store", default = hostname)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('latency_monitor_%s' % hostname)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'Latency monitor is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
+    targets = targets_from_param(options.diag_hostname, hostname)
+    if not targets:
+        rospy.logerr('Latency monitor has no ~targets to probe')
+    for t in targets:
+        t.prober.start()
+
+    rate = rospy.Rate(1.0)
+    try:
+        while not rospy.is_shutdown():
+            rate.sleep()
+            msg = DiagnosticArray()
+            msg.header.stamp = rospy.get_rostime()
+            msg.status = [ t.status() for t in targets ]
+            pub.publish(msg)
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        traceback.print_exc()
+
+    for t in targets:
+        t.prober.stop()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Keeps ROS log directories within a size and age budget
+##
+## Closed log files are compressed and the oldest runs are deleted first.
+## All disk work happens in one background thread at idle I/O priority
+## and nice 19, rate limited, and paused while the disk is busy so it
+## doesn't compete with bag recording.
+
+from __future__ import with_statement, division
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+
+import traceback
+import threading
+import sys, os, time
+import ctypes
+import ctypes.util
+import platform
+import socket
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from pr2_computer_monitor import log_cleaner
+from pr2_computer_monitor.log_cleaner import LogCleaner
+
+##### monkey-patch to suppress threading error message in python 2.7.3
+##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
+if sys.version_info[:3] == (2, 7, 3):
+    import threading
+    threading._DummyThread._Thread__stop = lambda x: 42
+#####
+
+stat_dict = { 0: 'OK', 1: 'Warning', 2: 'Error' }
+
+# ioprio_set syscall numbers, see linux/ioprio.h
+IOPRIO_SET_SYSCALL = { 'x86_64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'armv7l': 314 }
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+##\brief Puts the calling thread at idle I/O priority and lowest CPU priority
+##
+## On Linux both ioprio_set and setpriority act on the calling thread
+## only, so the rest of the node keeps its normal priority.
+def lower_thread_priority():
+    ok = True
+    try:
+        os.nice(19)
+    except OSError:
+        ok = False
+
+    nr = IOPRIO_SET_SYSCALL.get(platform.machine())
+    if nr is None:
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+    if libc.syscall(nr, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+        ok = False
+    return ok
+
+##\brief Bytes read and written by this process, from /proc/self/io
+def get_self_io():
+    vals = {}
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for ln in f:
+                key, _, val = ln.partition(':')
+                vals[key.strip()] = int(val)
+    except (IOError, ValueError):
+        pass
+    return vals.get('read_bytes', 0), vals.get('write_bytes', 0)
+
+def update_status_stale(stat, last_update_time, warn_time, error_time):
+    time_since_update = rospy.get_time() - last_update_time
+
+    stale_status = 'OK'
+    if time_since_update > warn_time and time_since_update <= error_time:
+        stale_status = 'Lagging'
+        if stat.level == DiagnosticStatus.OK:
+            stat.message = stale_status
+        elif stat.message.find(stale_status) < 0:
+            stat.message = ', '.join([stat.message, stale_status])
+        stat.level = max(stat.level, DiagnosticStatus.WARN)
+    if time_since_update > error_time:
+        stale_status = 'Stale'
+        if stat.level == DiagnosticStatus.OK:
+            stat.message = stale_status
+        elif stat.message.find(stale_status) < 0:
+            stat.message = ', '.join([stat.message, stale_status])
+        stat.level = max(stat.level, DiagnosticStatus.ERROR)
+
+    stat.values.pop(0)
+    stat.values.pop(0)
+    stat.values.insert(0, KeyValue(key = 'Update Status', value = stale_status))
+    stat.values.insert(1, KeyValue(key = 'Time Since Last Update', value = str(time_since_update)))
+
+class LogJanitor(object):
+    def __init__(self, hostname, diag_hostname):
+        self._mutex = threading.Lock()
+        self._stop = threading.Event()
+
+        self._roots = [ os.path.expanduser(r) for r in
+                        rospy.get_param('~log_roots', [ '~/.ros/log' ]) ]
+        self._max_size = rospy.get_param('~max_size_mb', 2000) * 1e6
+        self._max_age = rospy.get_param('~max_age_days', 14) * 86400
+        self._period = rospy.get_param('~period', 60.0)
+
+        compression = rospy.get_param('~compression', 'gzip')
+        if compression == 'zstd' and log_cleaner.zstandard is None:
+            rospy.logwarn('zstandard module not found, compressing logs with gzip')
+            compression = 'gzip'
+
+        self._cleaner = LogCleaner(self._max_size, self._max_age,
+                                   rospy.get_param('~min_idle_sec', 300),
+                                   rospy.get_param('~max_io_rate_mb', 4.0) * 1e6,
+                                   rospy.get_param('~busy_util_percent', 30.0),
+                                   compression, self._stop)
+
+        self._diag_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
+
+        self._low_priority = False
+        self._last_cycle_time = 0
+        self._last_cycle_duration = 0
+        self._last_publish_time = 0
+
+        self._stat = DiagnosticStatus()
+        self._stat.name = '%s Log Janitor' % diag_hostname
+        self._stat.level = DiagnosticStatus.WARN
+        self._stat.hardware_id = hostname
+        self._stat.message = 'No Data'
+        self._stat.values = [ KeyValue(key = 'Update Status', value = 'No Data'),
+                              KeyValue(key = 'Time Since Last Update', value = 'N/A') ]
+
+        self._thread = threading.Thread(target = self._run, name = 'log_janitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self._low_priority = lower_thread_priority()
+        if not self._low_priority:
+            rospy.logwarn('Log janitor is unable to lower its I/O priority')
+
+        while not self._stop.is_set() and not rospy.is_shutdown():
+            start = time.time()
+            try:
+                for root in self._roots:
+                    if os.path.isdir(root):
+                        self._cleaner.clean_root(root)
+            except:
+                rospy.logerr(traceback.format_exc())
+                self._cleaner.error()
+
+            with self._mutex:
+                self._last_cycle_time = rospy.get_time()
+                self._last_cycle_duration = time.time() - start
+            self._stop.wait(self._period)
+
+    def publish_stats(self):
+        read_bytes, write_bytes = get_self_io()
+        stats = self._cleaner.get_stats()
+        root_sizes = stats['root_sizes']
+
+        with self._mutex:
+            level = DiagnosticStatus.OK
+            msgs = []
+            if not self._low_priority:
+                level = max(level, DiagnosticStatus.WARN)
+                msgs.append('Not Running at Idle Priority')
+            if stats['errors'] > 0:
+                level = max(level, DiagnosticStatus.WARN)
+                msgs.append('Cleanup Errors')
+            if any(s > self._max_size for s in root_sizes.values()):
+                level = max(level, DiagnosticStatus.WARN)
+                msgs.append('Over Size Budget')
+
+            vals = [ KeyValue(key = 'Update Status', value = 'OK'),
+                     KeyValue(key = 'Time Since Last Update', value = '0') ]
+            for index, root in enumerate(self._roots):
+                vals.append(KeyValue(key = 'Log Root %d' % (index + 1), value = root))
+                if root in root_sizes:
+                    vals.append(KeyValue(key = 'Log Root %d Size (MB)' % (index + 1),
+                                         value = '%.1f' % (root_sizes[root] / 1e6)))
+            vals.append(KeyValue(key = 'Size Budget (MB)', value = '%.0f' % (self._max_size / 1e6)))
+            vals.append(KeyValue(key = 'Age Budget (days)', value = '%.1f' % (self._max_age / 86400)))
+            vals.append(KeyValue(key = 'Compression', value = self._cleaner.compression))
+            vals.append(KeyValue(key = 'Bytes Reclaimed (MB)',
+                                 value = '%.1f' % ((stats['bytes_compressed'] + stats['bytes_deleted']) / 1e6)))
+            vals.append(KeyValue(key = 'Reclaimed by Compression (MB)', value = '%.1f' % (stats['bytes_compressed'] / 1e6)))
+            vals.append(KeyValue(key = 'Reclaimed by Deletion (MB)', value = '%.1f' % (stats['bytes_deleted'] / 1e6)))
+            vals.append(KeyValue(key = 'Files Compressed', value = str(stats['files_compressed'])))
+            vals.append(KeyValue(key = 'Runs Deleted', value = str(stats['runs_deleted'])))
+            vals.append(KeyValue(key = 'Janitor Read (MB)', value = '%.1f' % (read_bytes / 1e6)))
+            vals.append(KeyValue(key = 'Janitor Written (MB)', value = '%.1f' % (write_bytes / 1e6)))
+            vals.append(KeyValue(key = 'Throttle Waits', value = str(stats['throttle_waits'])))
+            vals.append(KeyValue(key = 'Last Cycle Duration (s)', value = '%.1f' % self._last_cycle_duration))
+            vals.append(KeyValue(key = 'Errors', value = str(stats['errors'])))
+
+            self._stat.level = level
+            self._stat.message = ', '.join(msgs) if msgs else stat_dict[level]
+            self._stat.values = vals
+
+            # A cleanup cycle can take a long time while throttled
+            if self._last_cycle_time > 0:
+                update_status_stale(self._stat, self._last_cycle_time,
+                                    self._period + 3600, self._period + 7200)
+
+            msg = DiagnosticArray()
+            msg.header.stamp = rospy.get_rostime()
+            msg.status.append(self._stat)
+
+            if rospy.get_time() - self._last_publish_time > 0.5:
+                self._diag_pub.publish(msg)
+                self._last_publish_time = rospy.get_time()
+
+if __name__ == '__main__':
+    hostname = socket.gethostname()
+
+    import optparse
+    parser = optparse.OptionParser(usage="usage: log_janitor.py [--diag-hostname=cX]")
+    parser.add_option("--diag-hostname", dest="diag_hostname",
+                      help="Computer name in diagnostics output (ex: 'c1')",
+                      metavar="DIAG_HOSTNAME",
+                      action="store", default = hostname)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('log_janitor_%s' % hostname)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'Log janitor is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    janitor = LogJanitor(hostname, options.diag_hostname)
+    rate = rospy.Rate(1.0)
+
+    try:
+        while not rospy.is_shutdown():
+            rate.sleep()
+            janitor.publish_stats()
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        traceback.print_exc()
+
+    janitor.stop()
+    sys.exit(0)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Per-interface network throughput and error diagnostics
+##
+## Reads /proc/net/dev, /sys/class/net/*/statistics and /proc/net/snmp
+## once per cycle and publishes rates computed from the counter deltas.
+
+from __future__ import with_statement, division
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+
+import traceback
+import threading
+import sys
+import socket
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from pr2_computer_monitor import NetCollector
+from pr2_computer_monitor.clock import monotonic
+
+##### monkey-patch to suppress threading error message in python 2.7.3
+##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
+if sys.version_info[:3] == (2, 7, 3):
+    import threading
+    threading._DummyThread._Thread__stop = lambda x: 42
+#####
+
+THRESHOLD_KEYS = [ 'util_warn', 'util_error', 'error_rate_warn', 'error_rate_error' ]
+
+def _fmt(val, fmt):
+    if val is None:
+        return 'N/A'
+    return fmt % val
+
+class NetMonitor(object):
+    def __init__(self, hostname, diag_hostname):
+        self._diag_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
+        self._mutex = threading.Lock()
+        self._hostname = hostname
+        self._diag_hostname = diag_hostname
+
+        self._defaults = { 'util_warn': rospy.get_param('~util_warn', 0.8),
+                           'util_error': rospy.get_param('~util_error', 0.95),
+                           'error_rate_warn': rospy.get_param('~error_rate_warn', 1.0),
+                           'error_rate_error': rospy.get_param('~error_rate_error', 100.0) }
+        self._tcp_retrans_warn = rospy.get_param('~tcp_retrans_warn', 2.0)
+        self._tcp_retrans_error = rospy.get_param('~tcp_retrans_error', 10.0)
+
+        # Each entry is an interface name, or a dict with 'name' and any
+        # of the threshold keys, and 'speed' (Mbps) for links that don't
+        # report one. Empty watches every interface that's up except lo.
+        self._interfaces = {}
+        for entry in rospy.get_param('~interfaces', []):
+            if isinstance(entry, basestring):
+                entry = { 'name': entry }
+            cfg = dict(self._defaults)
+            cfg.update(entry)
+            self._interfaces[entry['name']] = cfg
+
+        self._collector = NetCollector()
+
+    def _interface_stat(self, r, cfg):
+        stat = DiagnosticStatus()
+        stat.name = '%s Network Interface %s' % (self._diag_hostname, r.name)
+        stat.hardware_id = self._hostname
+        stat.level = DiagnosticStatus.OK
+        stat.message = 'OK'
+
+        speed = cfg.get('speed', r.speed)
+        utilisation = r.utilisation
+        if speed and r.rx_mbps is not None and r.tx_mbps is not None:
+            utilisation = max(r.rx_mbps, r.tx_mbps) / speed
+
+        c = r.counters
+        stat.values = [ KeyValue('State', r.operstate),
+                        KeyValue('Link Speed (Mbps)', _fmt(speed, '%d')),
+                        KeyValue('MTU', _fmt(r.mtu, '%d')),
+                        KeyValue('RX (Mbps)', _fmt(r.rx_mbps, '%.2f')),
+                        KeyValue('TX (Mbps)', _fmt(r.tx_mbps, '%.2f')),
+                        KeyValue('RX Packets/s', _fmt(r.rx_pps, '%.0f')),
+                        KeyValue('TX Packets/s', _fmt(r.tx_pps, '%.0f')),
+                        KeyValue('Utilisation (%)', _fmt(utilisation and utilisation * 100, '%.1f')),
+                        KeyValue('Errors/s', _fmt(r.errors_per_sec, '%.2f')),
+                        KeyValue('Drops/s', _fmt(r.drops_per_sec, '%.2f')),
+                        KeyValue('RX Errors', str(c['rx_errors'])),
+                        KeyValue('TX Errors', str(c['tx_errors'])),
+                        KeyValue('RX Dropped', str(c['rx_dropped'])),
+                        KeyValue('TX Dropped', str(c['tx_dropped'])),
+                        KeyValue('RX FIFO Errors', str(c['rx_fifo_errors'])),
+                        KeyValue('Collisions', str(c['collisions'])) ]
+        for field, label in [ ('rx_crc_errors', 'RX CRC Errors'), ('rx_missed_errors', 'RX Missed'),
+                              ('rx_length_errors', 'RX Length Errors'), ('rx_over_errors', 'RX Overruns') ]:
+            if field in c:
+                stat.values.append(KeyValue(label, str(c[field])))
+        stat.values.extend([ KeyValue('Utilisation Warning (%)', str(cfg['util_warn'] * 100)),
+                             KeyValue('Errors+Drops/s Warning', str(cfg['error_rate_warn'])) ])
+
+        bad_rate = None
+        if r.errors_per_sec is not None and r.drops_per_sec is not None:
+            bad_rate = r.errors_per_sec + r.drops_per_sec
+
+        if utilisation is not None and utilisation > cfg['util_warn']:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'High Utilisation'
+        if bad_rate is not None and bad_rate > cfg['error_rate_warn']:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'Errors or Drops'
+        if utilisation is not None and utilisation > cfg['util_error']:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'Saturated'
+        if bad_rate is not None and bad_rate > cfg['error_rate_error']:
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'High Error Rate'
+        if r.operstate == 'down':
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'Link Down'
+        return stat
+
+    def _tcp_stat(self, tcp):
+        stat = DiagnosticStatus()
+        stat.name = '%s Network TCP' % self._diag_hostname
+        stat.hardware_id = self._hostname
+        stat.level = DiagnosticStatus.OK
+        stat.message = 'OK'
+        stat.values = [ KeyValue('Segments Out/s', _fmt(tcp.out_segs_per_sec, '%.0f')),
+                        KeyValue('Retransmits/s', _fmt(tcp.retrans_per_sec, '%.1f')),
+                        KeyValue('Retransmits (%)', _fmt(tcp.retrans_percent, '%.2f')),
+                        KeyValue('Total Retransmits', str(tcp.counters.get('RetransSegs', 0))),
+                        KeyValue('Current Connections', str(tcp.counters.get('CurrEstab', 0))),
+                        KeyValue('Retransmits Warning (%)', str(self._tcp_retrans_warn)) ]
+
+        if tcp.retrans_percent is not None:
+            if tcp.retrans_percent > self._tcp_retrans_error:
+                stat.level = DiagnosticStatus.ERROR
+                stat.message = 'High TCP Retransmits'
+            elif tcp.retrans_percent > self._tcp_retrans_warn:
+                stat.level = DiagnosticStatus.WARN
+                stat.message = 'High TCP Retransmits'
+        return stat
+
+    def publish_stats(self):
+        msg = DiagnosticArray()
+        msg.header.stamp = rospy.get_rostime()
+
+        with self._mutex:
+            try:
+                rates, tcp = self._collector.sample(monotonic())
+            except:
+                rospy.logerr(traceback.format_exc())
+                stat = DiagnosticStatus()
+                stat.name = '%s Network Interfaces' % self._diag_hostname
+                stat.hardware_id = self._hostname
+                stat.level = DiagnosticStatus.ERROR
+                stat.message = 'Error Reading Counters'
+                msg.status.append(stat)
+                self._diag_pub.publish(msg)
+                return
+
+            if self._interfaces:
+                for name, cfg in sorted(self._interfaces.iteritems()):
+                    if name in rates:
+                        msg.status.append(self._interface_stat(rates[name], cfg))
+                    else:
+                        stat = DiagnosticStatus()
+                        stat.name = '%s Network Interface %s' % (self._diag_hostname, name)
+                        stat.hardware_id = self._hostname
+                        stat.level = DiagnosticStatus.ERROR
+                        stat.message = 'No Such Interface'
+                        msg.status.append(stat)
+            else:
+                for name, r in sorted(rates.iteritems()):
+                    if name == 'lo' or r.operstate == 'down':
+                        continue
+                    msg.status.append(self._interface_stat(r, self._defaults))
+
+            if tcp is not None:
+                msg.status.append(self._tcp_stat(tcp))
+
+        self._diag_pub.publish(msg)
+
+if __name__ == '__main__':
+    hostname = socket.gethostname()
+
+    import optparse
+    parser = optparse.OptionParser(usage="usage: net_monitor.py [--diag-hostname=cX]")
+    parser.add_option("--diag-hostname", dest="diag_hostname",
+                      help="Computer name in diagnostics output (ex: 'c1')",
+                      metavar="DIAG_HOSTNAME",
+                      action="store", default = hostname)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('net_monitor_%s' % hostname)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'Network monitor is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    net_node = NetMonitor(hostname, options.diag_hostname)
+    rate = rospy.Rate(1.0)
+
+    try:
+        while not rospy.is_shutdown():
+            rate.sleep()
+            net_node.publish_stats()
+    except KeyboardInterrupt:
+        pass
+    except Exception, e:
+        traceback.print_exc()
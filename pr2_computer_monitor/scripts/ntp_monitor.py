@@ -34,16 +34,15 @@
 import roslib
 roslib.load_manifest('pr2_computer_monitor')
 
-from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from diagnostic_msgs.msg import DiagnosticArray
 
 import sys
 import rospy
 import socket
-from subprocess import Popen, PIPE
 
 import time
 
-import re
+from pr2_computer_monitor.ntp_peer import NTPPeer, BACKENDS
 
 ##### monkey-patch to suppress threading error message in python 2.7.3
 ##### See http://stackoverflow.com/questions/13193278/understand-python-threading-bug
@@ -54,74 +53,36 @@ if sys.version_info[:3] == (2, 7, 3):
 
 NAME = 'ntp_monitor'
 
-def ntp_monitor(ntp_hostname, offset=500, self_offset=500, diag_hostname = None, error_offset = 5000000):
-    pub = rospy.Publisher("/diagnostics", DiagnosticArray, queue_size=10)
-    rospy.init_node(NAME, anonymous=True)
-    
-    hostname = socket.gethostname()
-    if diag_hostname is None:
-        diag_hostname = hostname
+def ntp_monitor(peers):
+    for peer in peers:
+        peer.start()
 
-    stat = DiagnosticStatus()
-    stat.level = 0
-    stat.name = "NTP offset from "+ diag_hostname + " to " + ntp_hostname
-    stat.message = "OK"
-    stat.hardware_id = hostname
-    stat.values = []
-
-    self_stat = DiagnosticStatus()
-    self_stat.level = DiagnosticStatus.OK
-    self_stat.name = "NTP self-offset for "+ diag_hostname
-    self_stat.message = "OK"
-    self_stat.hardware_id = hostname
-    self_stat.values = []
-    
     while not rospy.is_shutdown():
-        for st,host,off in [(stat,ntp_hostname,offset), (self_stat, hostname,self_offset)]:
-            try:
-                p = Popen(["ntpdate", "-q", host], stdout=PIPE, stdin=PIPE, stderr=PIPE)
-                res = p.wait()
-                (o,e) = p.communicate()
-            except OSError, (errno, msg):
-                if errno == 4:
-                    break #ctrl-c interrupt
-                else:
-                    raise
-            if (res == 0):
-                measured_offset = float(re.search("offset (.*),", o).group(1))*1000000
-
-                st.level = DiagnosticStatus.OK
-                st.message = "OK"
-                st.values = [ KeyValue("Offset (us)", str(measured_offset)),
-                              KeyValue("Offset tolerance (us)", str(off)),
-                              KeyValue("Offset tolerance (us) for Error", str(error_offset)) ]
-            
-                if (abs(measured_offset) > off):
-                    st.level = DiagnosticStatus.WARN
-                    st.message = "NTP Offset Too High"
-                if (abs(measured_offset) > error_offset):
-                    st.level = DiagnosticStatus.ERROR
-                    st.message = "NTP Offset Too High"
-                                
-            else:
-                st.level = DiagnosticStatus.ERROR
-                st.message = "Error Running ntpdate. Returned %d" % res
-                st.values = [ KeyValue("Offset (us)", "N/A"),
-                              KeyValue("Offset tolerance (us)", str(off)),
-                              KeyValue("Offset tolerance (us) for Error", str(error_offset)),
-                              KeyValue("Output", o),
-                              KeyValue("Errors", e) ]
-
-
-        msg = DiagnosticArray()
-        msg.header.stamp = rospy.get_rostime()
-        msg.status = [stat, self_stat]
-        pub.publish(msg)
         time.sleep(1)
 
+##\brief Builds peers from the ~peers parameter, a list of dicts with a
+## 'host' key and optional 'offset_tolerance', 'error_offset_tolerance',
+## 'interval', 'timeout', 'samples', 'drift_tolerance' and 'backend' keys
+## that override the defaults.
+def peers_from_param(pub, diag_hostname, hardware_id, defaults):
+    peers = []
+    for cfg in rospy.get_param('~peers', []):
+        host = cfg['host']
+        peers.append(NTPPeer(pub, "NTP offset from " + diag_hostname + " to " + host, host, hardware_id,
+                             offset = cfg.get('offset_tolerance', defaults['offset']),
+                             error_offset = cfg.get('error_offset_tolerance', defaults['error_offset']),
+                             interval = cfg.get('interval', defaults['interval']),
+                             timeout = cfg.get('timeout', defaults['timeout']),
+                             samples = cfg.get('samples', defaults['samples']),
+                             max_backoff = defaults['max_backoff'],
+                             drift_window = defaults['drift_window'],
+                             drift_tolerance = cfg.get('drift_tolerance', defaults['drift_tolerance']),
+                             backend = cfg.get('backend', 'sntp')))
+    return peers
+
 def ntp_monitor_main(argv=sys.argv):
     import optparse
-    parser = optparse.OptionParser(usage="usage: ntp_monitor ntp-hostname []")
+    parser = optparse.OptionParser(usage="usage: ntp_monitor [ntp-hostname ...] []")
     parser.add_option("--offset-tolerance", dest="offset_tol",
                       action="store", default=500,
                       help="Offset from NTP host", metavar="OFFSET-TOL")
@@ -135,20 +96,77 @@ def ntp_monitor_main(argv=sys.argv):
                       help="Computer name in diagnostics output (ex: 'c1')",
                       metavar="DIAG_HOSTNAME",
                       action="store", default=None)
+    parser.add_option("--timeout", dest="timeout",
+                      action="store", default=1.0,
+                      help="Time to wait for each NTP response (s)", metavar="TIMEOUT")
+    parser.add_option("--samples", dest="samples",
+                      action="store", default=3,
+                      help="NTP requests per query, the one with least delay is used",
+                      metavar="SAMPLES")
+    parser.add_option("--interval", dest="interval",
+                      action="store", default=1.0,
+                      help="Time between queries to each peer (s)", metavar="INTERVAL")
+    parser.add_option("--max-backoff", dest="max_backoff",
+                      action="store", default=60.0,
+                      help="Longest time between queries to a failing peer (s)", metavar="MAX_BACKOFF")
+    parser.add_option("--drift-window", dest="drift_window",
+                      action="store", default=300,
+                      help="Offset samples kept per peer to estimate drift", metavar="DRIFT_WINDOW")
+    parser.add_option("--drift-tolerance", dest="drift_tolerance",
+                      action="store", default=5.0,
+                      help="Frequency error (ppm) above which offset is drifting", metavar="DRIFT_TOL")
+    parser.add_option("--self-backend", dest="self_backend",
+                      action="store", default="sntp", choices=BACKENDS,
+                      help="How to get this host's offset: sntp, or ask the local chrony or ntpd",
+                      metavar="BACKEND")
+    parser.add_option("--no-self-offset", dest="self_offset",
+                      action="store_false", default=True,
+                      help="Don't check the offset to this host's own NTP server")
     options, args = parser.parse_args(rospy.myargv())
 
-    if (len(args) != 2):
-        parser.error("Invalid arguments. Must have HOSTNAME [args]. %s" % args)
-
-
     try:
         offset = int(options.offset_tol)
         self_offset = int(options.self_offset_tol)
         error_offset = int(options.error_offset_tol)
     except:
         parser.error("Offsets must be numbers")        
-    
-    ntp_monitor(args[1], offset, self_offset, options.diag_hostname, error_offset)
+
+    try:
+        timeout = float(options.timeout)
+        samples = int(options.samples)
+        interval = float(options.interval)
+        max_backoff = float(options.max_backoff)
+        drift_window = int(options.drift_window)
+        drift_tolerance = float(options.drift_tolerance)
+    except:
+        parser.error("Timeout, samples, interval, backoff and drift settings must be numbers")
+
+    pub = rospy.Publisher("/diagnostics", DiagnosticArray, queue_size=10)
+    rospy.init_node(NAME, anonymous=True)
+
+    hostname = socket.gethostname()
+    diag_hostname = options.diag_hostname
+    if diag_hostname is None:
+        diag_hostname = hostname
+
+    defaults = { 'offset': offset, 'error_offset': error_offset, 'interval': interval,
+                 'timeout': timeout, 'samples': samples, 'max_backoff': max_backoff,
+                 'drift_window': drift_window, 'drift_tolerance': drift_tolerance }
+
+    peers = [ NTPPeer(pub, "NTP offset from " + diag_hostname + " to " + host, host, hostname,
+                      offset, error_offset, interval, timeout, samples, max_backoff,
+                      drift_window, drift_tolerance)
+              for host in args[1:] ]
+    peers.extend(peers_from_param(pub, diag_hostname, hostname, defaults))
+    if options.self_offset:
+        peers.append(NTPPeer(pub, "NTP self-offset for " + diag_hostname, hostname, hostname,
+                             self_offset, error_offset, interval, timeout, samples, max_backoff,
+                             drift_window, drift_tolerance, options.self_backend))
+
+    if not peers:
+        parser.error("Invalid arguments. Must have HOSTNAME [args] or ~peers. %s" % args)
+
+    ntp_monitor(peers)
     
 
 if __name__ == "__main__":
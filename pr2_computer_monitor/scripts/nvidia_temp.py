@@ -33,7 +33,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 ##\author Kevin Watts
-##\brief Publishes diagnostic data on temperature and usage for a Quadro 600 GPU
+##\brief Publishes diagnostic data on temperature and usage for each nVidia GPU
 
 from __future__ import with_statement, division
 
@@ -42,42 +42,201 @@ import roslib; roslib.load_manifest(PKG)
 
 import rospy
 
-from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from pr2_msgs.msg import GPUStatus
 
 import pr2_computer_monitor
+from pr2_computer_monitor.clock import monotonic
+from pr2_computer_monitor.gpu_throttle import POWER, THERMAL
+
+# Data older than this many periods is reported as missing
+STALE_PERIODS = 5
 
 class NVidiaTempMonitor(object):
     def __init__(self):
         self._pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
         self._gpu_pub = rospy.Publisher('gpu_status', GPUStatus, queue_size=10)
+        self._proc_pub = rospy.Publisher('gpu_processes', DiagnosticArray, queue_size=10)
+
+        # Streaming keeps one nvidia-smi query process running instead of
+        # forking 'sudo nvidia-smi -a' every update. Older drivers without
+        # the query interface fall back to that after ~stream_attempts.
+        self._stream = None
+        attempts = rospy.get_param('~stream_attempts', 3)
+        if rospy.get_param('~streaming', True):
+            self._stream = pr2_computer_monitor.SmiStream(rospy.get_param('~period', 1.0),
+                                                          rospy.get_param('~nvidia_smi', 'nvidia-smi'),
+                                                          max_failed_starts = attempts)
+            self._stream.start()
+
+        # Compute processes, only available from the query interface, and
+        # their utilisation from pmon where the driver has it
+        self._apps = None
+        self._pmon = None
+        self._names = pr2_computer_monitor.ProcessNames()
+        self._top_count = rospy.get_param('~top_processes', 3)
+        if self._stream and rospy.get_param('~process_stats', True):
+            period = self._stream.period
+            self._apps = pr2_computer_monitor.SmiStream(period, self._stream.command,
+                                                        pr2_computer_monitor.COMPUTE_APP_FIELDS,
+                                                        query = 'compute-apps', key = ('gpu_bus_id', 'pid'),
+                                                        expire = STALE_PERIODS * period,
+                                                        max_failed_starts = attempts)
+            self._apps.start()
+            self._pmon = pr2_computer_monitor.PmonStream(period, self._stream.command,
+                                                         max_failed_starts = attempts)
+            self._pmon.start()
+
+        # Throttling lasting this long is reported as a warning
+        self._throttle_warn_time = rospy.get_param('~throttle_warn_time', 10.0)
+        self._throttle_window = rospy.get_param('~throttle_window', 60.0)
+        self._throttle = {}
+
+    def shutdown(self):
+        if self._stream:
+            self._stream.stop()
+        if self._apps:
+            self._apps.stop()
+        if self._pmon:
+            self._pmon.stop()
+
+    ##\brief Drops streams that never worked, back to 'nvidia-smi -a'
+    def _check_streams(self):
+        if self._apps and self._apps.unavailable():
+            rospy.logwarn('nvidia-smi compute-apps query not working (%s), no process data' % self._apps.last_error)
+            self._apps.stop()
+            self._apps = None
+        if self._pmon and self._pmon.unavailable():
+            rospy.logwarn('nvidia-smi pmon not working (%s), no process utilization' % self._pmon.last_error)
+            self._pmon.stop()
+            self._pmon = None
+        if self._stream and self._stream.unavailable():
+            rospy.logwarn('nvidia-smi query mode not working (%s), using nvidia-smi -a' % self._stream.last_error)
+            self.shutdown()
+            self._stream = None
+            self._apps = None
+            self._pmon = None
+
+    ##\return Latest GPUInfo list from the stream, empty if the data is stale
+    def _stream_gpus(self):
+        rows = self._stream.rows()
+        age = self._stream.age()
+        if not rows or age > STALE_PERIODS * self._stream.period:
+            return []
+        return [ pr2_computer_monitor.csv_to_gpu_info(row) for row in rows ]
+
+    def _stream_values(self, stat):
+        age = self._stream.age()
+        stat.values.append(KeyValue(key = 'Data Age (s)', value = 'N/A' if age is None else '%.1f' % age))
+        stat.values.append(KeyValue(key = 'nvidia-smi Restarts', value = str(self._stream.restarts)))
+        if self._stream.last_error:
+            stat.values.append(KeyValue(key = 'nvidia-smi Error', value = self._stream.last_error))
+
+    def _throttle_values(self, info, stat):
+        if info.throttle_mask is None:
+            return
+        tracker = self._throttle.get(info.index)
+        if tracker is None:
+            tracker = pr2_computer_monitor.ThrottleTracker(self._throttle_warn_time, self._throttle_window)
+            self._throttle[info.index] = tracker
+        tracker.update(info.throttle_mask, monotonic())
+
+        for kind in (POWER, THERMAL):
+            stat.values.append(KeyValue(key = '%s Throttle Events (last %.0fs)' % (kind, self._throttle_window),
+                                        value = str(tracker.events(kind))))
+            stat.values.append(KeyValue(key = '%s Throttled For (s)' % kind, value = '%.0f' % tracker.duration(kind)))
+
+        sustained = tracker.sustained()
+        if sustained and stat.level < DiagnosticStatus.WARN:
+            stat.level = DiagnosticStatus.WARN
+            stat.message = ', '.join('%s Throttled' % kind for kind in sustained)
+
+    def _process_values(self, info, procs, stat):
+        on_gpu = pr2_computer_monitor.top_processes(procs, info.status.pci_location, len(procs))
+        stat.values.append(KeyValue(key = 'Compute Processes', value = str(len(on_gpu))))
+        for i, proc in enumerate(on_gpu[:self._top_count]):
+            value = '%s (pid %d): %.0f MiB' % (proc.node, proc.pid, proc.used_memory)
+            if proc.sm_usage is not None:
+                value += ', %.0f%% SM' % proc.sm_usage
+            stat.values.append(KeyValue(key = 'Top Process %d' % (i + 1), value = value))
+
+    def _pub_processes(self, procs):
+        array = DiagnosticArray()
+        array.header.stamp = rospy.get_rostime()
+        for proc in procs:
+            stat = DiagnosticStatus()
+            stat.name = proc.node
+            stat.hardware_id = proc.gpu_bus_id
+            stat.level = DiagnosticStatus.OK
+            stat.message = '%.0f MiB' % proc.used_memory
+            stat.values.append(KeyValue(key = 'PID', value = str(proc.pid)))
+            stat.values.append(KeyValue(key = 'Process Name', value = proc.process_name))
+            stat.values.append(KeyValue(key = 'GPU Bus ID', value = proc.gpu_bus_id))
+            stat.values.append(KeyValue(key = 'Used Memory (MiB)', value = '%.0f' % proc.used_memory))
+            if proc.sm_usage is not None:
+                stat.values.append(KeyValue(key = 'SM Utilization (%)', value = '%.0f' % proc.sm_usage))
+            if proc.memory_usage is not None:
+                stat.values.append(KeyValue(key = 'Memory Utilization (%)', value = '%.0f' % proc.memory_usage))
+            array.status.append(stat)
+        self._proc_pub.publish(array)
 
     def pub_status(self):
-        gpu_stat = GPUStatus()
-        stat = DiagnosticStatus()
+        gpus = []
+        procs = None
         try:
-            card_out = pr2_computer_monitor.get_gpu_status()
-            gpu_stat = pr2_computer_monitor.parse_smi_output(card_out)
-            stat = pr2_computer_monitor.gpu_status_to_diag(gpu_stat)
+            self._check_streams()
+            if self._apps:
+                procs = pr2_computer_monitor.rows_to_gpu_processes(self._apps.rows(), self._names)
+                if self._pmon:
+                    bus_ids = dict((row['index'], row['pci.bus_id']) for row in self._stream.rows())
+                    pr2_computer_monitor.add_process_usage(procs, self._pmon.rows(), bus_ids)
+            if self._stream:
+                gpus = self._stream_gpus()
+            else:
+                card_out = pr2_computer_monitor.get_gpu_status()
+                gpus = pr2_computer_monitor.parse_smi_gpus(card_out)
         except Exception, e:
             import traceback
             rospy.logerr('Unable to process nVidia GPU data')
             rospy.logerr(traceback.format_exc())
 
-        gpu_stat.header.stamp = rospy.get_rostime()
-
         array = DiagnosticArray()
         array.header.stamp = rospy.get_rostime()
-        
-        array.status = [ stat ]
+
+        if not gpus:
+            stat = pr2_computer_monitor.gpu_status_to_diag(GPUStatus())
+            stat.message = 'No GPU Data'
+            if self._stream:
+                self._stream_values(stat)
+            array.status.append(stat)
+
+            gpu_stat = GPUStatus()
+            gpu_stat.header.stamp = rospy.get_rostime()
+            self._gpu_pub.publish(gpu_stat)
+
+        for info in gpus:
+            # Keep the single GPU name so existing analyzers still match
+            name = 'GPU Status' if len(gpus) == 1 else 'GPU Status (%d)' % info.index
+            stat = pr2_computer_monitor.gpu_info_to_diag(info, name)
+            self._throttle_values(info, stat)
+            if procs is not None:
+                self._process_values(info, procs, stat)
+            if self._stream:
+                self._stream_values(stat)
+            array.status.append(stat)
+
+            info.status.header.stamp = rospy.get_rostime()
+            self._gpu_pub.publish(info.status)
 
         self._pub.publish(array)
-        self._gpu_pub.publish(gpu_stat)
+        if procs is not None:
+            self._pub_processes(procs)
 
 if __name__ == '__main__':
     rospy.init_node('nvidia_temp_monitor')
     
     monitor = NVidiaTempMonitor()
+    rospy.on_shutdown(monitor.shutdown)
     my_rate = rospy.Rate(1.0)
     while not rospy.is_shutdown():
         monitor.pub_status()
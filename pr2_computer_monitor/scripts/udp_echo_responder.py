@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Echoes latency_monitor.py probes back to their sender. Run it on
+## the base station and each robot computer that is probed.
+
+import roslib
+roslib.load_manifest('pr2_computer_monitor')
+
+import rospy
+
+import sys
+
+from pr2_computer_monitor import EchoResponder
+from pr2_computer_monitor.udp_echo import ECHO_PORT
+
+if __name__ == '__main__':
+    import optparse
+    parser = optparse.OptionParser(usage="usage: udp_echo_responder.py [--port=PORT]")
+    parser.add_option("--port", dest="port", type="int",
+                      help="UDP port to listen on", metavar="PORT",
+                      action="store", default = ECHO_PORT)
+    options, args = parser.parse_args(rospy.myargv())
+
+    try:
+        rospy.init_node('udp_echo_responder', anonymous=True)
+    except rospy.exceptions.ROSInitException:
+        print >> sys.stderr, 'UDP echo responder is unable to initialize node. Master may not be running.'
+        sys.exit(0)
+
+    responder = EchoResponder(rospy.get_param('~port', options.port))
+    responder.start()
+    rospy.spin()
+    responder.stop()
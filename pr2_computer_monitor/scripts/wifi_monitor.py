@@ -48,6 +48,11 @@ import sys
 
 from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from pr2_msgs.msg import AccessPoint
+from std_srvs.srv import Trigger, TriggerResponse
+
+from pr2_computer_monitor import WifiLinkStats, RoamTimeline, parse_rate, WirelessCollector, WirelessError
+from pr2_computer_monitor.clock import monotonic
+from pr2_computer_monitor.link_stats import RATE_CHANGE
 
 DIAG_NAME = 'Wifi Status (ddwrt)'
 WARN_TIME = 30
@@ -73,6 +78,46 @@ def wifi_to_diag(msg):
 
     return stat
 
+def _fmt(val, fmt = '%s'):
+    if val is None:
+        return 'N/A'
+    return fmt % val
+
+##\brief Same fields as wifi_to_diag, from the robot's own interface, plus
+## transmit retry and failure counts
+def local_wifi_to_diag(sample, name):
+    stat = DiagnosticStatus()
+
+    stat.name = name
+    stat.level = DiagnosticStatus.OK
+    stat.message = 'OK'
+
+    stat.values.append(KeyValue(key='ESSID',       value=sample.essid))
+    stat.values.append(KeyValue(key='Mac Address', value=sample.macaddr))
+    stat.values.append(KeyValue(key='Signal',      value=_fmt(sample.signal, '%.0f')))
+    stat.values.append(KeyValue(key='Noise',       value=_fmt(sample.noise, '%.0f')))
+    stat.values.append(KeyValue(key='Sig/Noise',   value=_fmt(sample.snr, '%.0f')))
+    stat.values.append(KeyValue(key='Channel',     value=str(sample.channel)))
+    stat.values.append(KeyValue(key='Rate',        value=_fmt(sample.rate, '%.1f Mb/s')))
+    stat.values.append(KeyValue(key='TX Power',    value=_fmt(sample.tx_power, '%.0f dBm')))
+    stat.values.append(KeyValue(key='Quality',     value=_fmt(sample.quality, '%.0f')))
+    stat.values.append(KeyValue(key='TX Packets',  value=_fmt(sample.tx_packets)))
+    stat.values.append(KeyValue(key='TX Retries',  value=_fmt(sample.tx_retries)))
+    stat.values.append(KeyValue(key='TX Failed',   value=_fmt(sample.tx_failed)))
+    stat.values.append(KeyValue(key='Beacon Loss', value=_fmt(sample.beacon_loss)))
+    stat.values.append(KeyValue(key='TX Packet Rate (/s)', value=_fmt(sample.tx_packet_rate, '%.1f')))
+    stat.values.append(KeyValue(key='TX Retry Rate (/s)',  value=_fmt(sample.tx_retry_rate, '%.1f')))
+    stat.values.append(KeyValue(key='TX Failed Rate (/s)', value=_fmt(sample.tx_failed_rate, '%.1f')))
+    if sample.tx_packet_rate and sample.tx_retry_rate is not None:
+        stat.values.append(KeyValue(key='TX Retries Per Packet',
+                                    value='%.2f' % (sample.tx_retry_rate / sample.tx_packet_rate)))
+
+    if not sample.connected:
+        stat.level = DiagnosticStatus.ERROR
+        stat.message = 'Not Associated'
+
+    return stat
+
 def mark_diag_stale(diag_stat = None, error = False):
     if not diag_stat:
         diag_stat = DiagnosticStatus()
@@ -95,19 +140,94 @@ class WifiMonitor(object):
         self._last_update_time = None
         self._start_time = rospy.get_time()
 
+        self._stats = WifiLinkStats(rospy.get_param('~stats_windows', [ 10, 60, 300 ]),
+                                    rospy.get_param('~history_size', 600))
+        # Warn when the median SNR over this window is low, not on one sample
+        self._snr_warn = rospy.get_param('~snr_warn', 15)
+        self._snr_window = rospy.get_param('~snr_window', 30.0)
+
+        self._timeline = RoamTimeline(rospy.get_param('~timeline_size', 200),
+                                      rospy.get_param('~rate_change_min', 0.25))
+        self._timeline_srv = rospy.Service('~roam_timeline', Trigger, self._timeline_cb)
+
         self._diag_pub = rospy.Publisher('/diagnostics', DiagnosticArray, queue_size=10)
 
-        self._ddwrt_sub = rospy.Subscriber('ddwrt/accesspoint', AccessPoint, self._cb)
+        # With ~interface set, read the robot's own wireless interface
+        # instead of listening to the ddwrt access point
+        self._interface = rospy.get_param('~interface', '')
+        if self._interface:
+            self._collector = WirelessCollector(self._interface)
+        else:
+            self._collector = None
+            self._ddwrt_sub = rospy.Subscriber('ddwrt/accesspoint', AccessPoint, self._cb)
 
     def _cb(self, msg):
         with self._mutex:
             self._last_msg = msg
             self._last_update_time = rospy.get_time()
+            connected = bool(msg.macaddr) and msg.signal != 0
+            rate = parse_rate(msg.rate)
+            self._stats.add(self._last_update_time, connected, msg.signal, msg.noise,
+                            msg.snr, msg.quality, rate)
+            self._log_events(self._timeline.update(self._last_update_time, connected, msg.macaddr,
+                                                   msg.essid, msg.channel, rate))
+
+    def _log_events(self, events):
+        for event in events:
+            if event.kind != RATE_CHANGE:
+                rospy.loginfo('Wifi %s' % event)
+
+    def _timeline_cb(self, req):
+        with self._mutex:
+            events = self._timeline.recent()
+        return TriggerResponse(success = True, message = '\n'.join(str(e) for e in events))
+
+    def _local_stat(self):
+        name = 'Wifi Status (%s)' % self._interface
+        now = rospy.get_time()
+        try:
+            sample = self._collector.sample(monotonic())
+        except WirelessError, e:
+            stat = DiagnosticStatus()
+            stat.name = name
+            stat.level = DiagnosticStatus.ERROR
+            stat.message = 'Error Reading Interface'
+            stat.values.append(KeyValue(key='Error', value=str(e)))
+            return stat
+
+        self._stats.add(now, sample.connected, sample.signal, sample.noise,
+                        sample.snr, sample.quality, sample.rate)
+        self._log_events(self._timeline.update(now, sample.connected, sample.macaddr,
+                                               sample.essid, sample.channel, sample.rate))
+        stat = local_wifi_to_diag(sample, name)
+        if self._collector.nl_error:
+            stat.values.append(KeyValue(key='nl80211 Error', value=self._collector.nl_error))
+        stat.values.extend(self._stats.to_values(now))
+        stat.values.extend(self._timeline.to_values(now))
+        if stat.level == DiagnosticStatus.OK and \
+                self._stats.low_snr(self._snr_warn, self._snr_window, now):
+            stat.level = DiagnosticStatus.WARN
+            stat.message = 'Low Sig/Noise'
+        return stat
 
     def publish_stats(self):
+        if self._collector:
+            msg = DiagnosticArray()
+            msg.header.stamp = rospy.get_rostime()
+            with self._mutex:
+                msg.status.append(self._local_stat())
+            self._diag_pub.publish(msg)
+            return
+
         with self._mutex:
             if self._last_msg:
                 ddwrt_stat = wifi_to_diag(self._last_msg)
+                now = rospy.get_time()
+                ddwrt_stat.values.extend(self._stats.to_values(now))
+                ddwrt_stat.values.extend(self._timeline.to_values(now))
+                if self._stats.low_snr(self._snr_warn, self._snr_window, now):
+                    ddwrt_stat.level = DiagnosticStatus.WARN
+                    ddwrt_stat.message = 'Low Sig/Noise'
 
                 update_diff = rospy.get_time() - self._last_update_time
                 if update_diff > WARN_TIME:
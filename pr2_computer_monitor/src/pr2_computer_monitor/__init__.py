@@ -1 +1,18 @@
 from nvidia_smi_util import gpu_status_to_diag, parse_smi_output, get_gpu_status
+from nvidia_smi_util import GPUInfo, gpu_info_to_diag, parse_smi_gpus, parse_smi_tree
+from dir_usage import DirUsageIndex
+from log_cleaner import LogCleaner
+from write_latency import WriteLatencyProbe, LatencyHistogram
+from sntp import sntp_query, best_sample, SNTPError
+from clock_stats import OffsetHistory
+from ntp_daemon import query_chrony, query_ntpd, NTPDaemonError
+from ntp_peer import NTPPeer
+from skew_estimator import SkewEstimator
+from clock_sentinel import ClockSentinel
+from link_stats import RollingStats, WifiLinkStats, RoamTimeline, parse_rate
+from wireless import WirelessCollector, WirelessError
+from net_stats import NetCollector
+from udp_echo import EchoResponder, EchoProber
+from nvidia_smi_stream import SmiStream, PmonStream, csv_to_gpu_status, csv_to_gpu_info, COMPUTE_APP_FIELDS
+from gpu_throttle import ThrottleTracker
+from gpu_processes import ProcessNames, rows_to_gpu_processes, add_process_usage, top_processes
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Access to the POSIX clocks, which python 2 doesn't expose
+
+import ctypes
+import ctypes.util
+import os
+
+CLOCK_REALTIME = 0
+CLOCK_MONOTONIC = 1
+CLOCK_MONOTONIC_RAW = 4
+CLOCK_BOOTTIME = 7
+
+class _timespec(ctypes.Structure):
+    _fields_ = [ ('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long) ]
+
+_clock_gettime = None
+def _get_clock_gettime():
+    global _clock_gettime
+    if _clock_gettime is None:
+        # clock_gettime lives in librt before glibc 2.17
+        try:
+            lib = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno = True)
+        except OSError:
+            lib = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        _clock_gettime = lib.clock_gettime
+        _clock_gettime.argtypes = [ ctypes.c_int, ctypes.POINTER(_timespec) ]
+    return _clock_gettime
+
+##\brief Reads the given clock
+##\return Time in seconds, as a float
+def clock_gettime(clock_id):
+    ts = _timespec()
+    if _get_clock_gettime()(clock_id, ctypes.byref(ts)) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+def monotonic():
+    return clock_gettime(CLOCK_MONOTONIC)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Detects steps and slews of the wall clock
+
+from __future__ import division
+
+import collections
+
+from clock import clock_gettime, CLOCK_REALTIME, CLOCK_MONOTONIC, CLOCK_MONOTONIC_RAW, CLOCK_BOOTTIME
+
+STEP = 'step'
+SUSPEND = 'suspend'
+SLEW = 'slew'
+
+# Reads of the clocks taking longer than this were interrupted and are retried
+MAX_READ_TIME = 0.0005
+MAX_READ_TRIES = 3
+
+##\brief Watches CLOCK_REALTIME against the kernel's other clocks
+##
+## REALTIME and MONOTONIC are slewed together by NTP, so any change in
+## their difference is a step. BOOTTIME also counts time suspended, so a
+## change in BOOTTIME - MONOTONIC is a suspend rather than a step.
+## MONOTONIC_RAW is never adjusted, so the rate of change of MONOTONIC -
+## MONOTONIC_RAW is the frequency correction being applied.
+##
+## sample() should be called often, every 100ms or so; each call reads
+## four clocks.
+class ClockSentinel(object):
+    ##\param step_threshold Smallest change (s) reported as a step
+    ##\param slew_threshold Frequency correction (ppm) above which the clock is slewing
+    ##\param slew_window Time (s) over which the slew rate is measured
+    def __init__(self, step_threshold = 0.001, slew_threshold = 200.0, slew_window = 10.0,
+                 read_clock = clock_gettime):
+        self.step_threshold = step_threshold
+        self.slew_threshold = slew_threshold
+        self.slew_window = slew_window
+        self._read_clock = read_clock
+        # Older kernels lack BOOTTIME and MONOTONIC_RAW, which disables
+        # suspend and slew detection
+        self._boot_clock = self._clock_or_monotonic(CLOCK_BOOTTIME)
+        self._raw_clock = self._clock_or_monotonic(CLOCK_MONOTONIC_RAW)
+
+        self._last = None
+        self._raw_history = collections.deque()
+
+        self.steps = 0
+        self.suspends = 0
+        self.slews = 0
+        self.last_step = None
+        self.last_step_time = None
+        self.largest_step = 0.0
+        self.last_suspend = None
+        self.slew_rate = None
+        self.slewing = False
+
+    def _clock_or_monotonic(self, clock_id):
+        try:
+            self._read_clock(clock_id)
+            return clock_id
+        except OSError:
+            return CLOCK_MONOTONIC
+
+    ## Reads all clocks close together, with REALTIME bracketed by MONOTONIC
+    def _read(self):
+        for i in range(MAX_READ_TRIES):
+            mono = self._read_clock(CLOCK_MONOTONIC)
+            real = self._read_clock(CLOCK_REALTIME)
+            boot = self._read_clock(self._boot_clock)
+            raw = self._read_clock(self._raw_clock)
+            mono_end = self._read_clock(CLOCK_MONOTONIC)
+            if mono_end - mono < MAX_READ_TIME:
+                break
+        mid = (mono + mono_end) / 2
+        return mid, real - mid, boot - mid, mid - raw, raw
+
+    ##\brief Takes one sample of the clocks
+    ##\return List of (kind, size in seconds or ppm) events seen since the last sample
+    def sample(self):
+        mono, real_off, boot_off, raw_off, raw = self._read()
+        events = []
+
+        if self._last is not None:
+            last_mono, last_real, last_boot = self._last
+            suspended = boot_off - last_boot
+            if abs(suspended) > self.step_threshold:
+                self.suspends += 1
+                self.last_suspend = suspended
+                events.append((SUSPEND, suspended))
+
+            step = (real_off - last_real) - suspended
+            if abs(step) > self.step_threshold:
+                self.steps += 1
+                self.last_step = step
+                self.last_step_time = real_off + mono
+                if abs(step) > abs(self.largest_step):
+                    self.largest_step = step
+                events.append((STEP, step))
+        self._last = (mono, real_off, boot_off)
+
+        self._raw_history.append((raw, raw_off))
+        while self._raw_history[0][0] < raw - self.slew_window:
+            self._raw_history.popleft()
+        first_raw, first_off = self._raw_history[0]
+        if raw - first_raw >= self.slew_window / 2:
+            self.slew_rate = (raw_off - first_off) / (raw - first_raw) * 1e6
+            slewing = abs(self.slew_rate) > self.slew_threshold
+            if slewing and not self.slewing:
+                self.slews += 1
+                events.append((SLEW, self.slew_rate))
+            self.slewing = slewing
+
+        return events
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Clock offset history and stability statistics for ntp_monitor
+
+from __future__ import division
+
+import math
+
+##\brief Fixed size ring buffer of (time, offset) samples, times in seconds
+##
+## Times should come from a monotonic clock so a step of the local clock
+## shows up in the offsets, not in the sample spacing.
+class OffsetHistory(object):
+    def __init__(self, size = 300):
+        self._size = size
+        self._times = [ 0.0 ] * size
+        self._offsets = [ 0.0 ] * size
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+
+    def add(self, t, offset):
+        idx = (self._start + self._count) % self._size
+        self._times[idx] = t
+        self._offsets[idx] = offset
+        if self._count < self._size:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % self._size
+
+    ##\return Samples in time order, as two lists
+    def samples(self):
+        idx = [ (self._start + i) % self._size for i in range(self._count) ]
+        return [ self._times[i] for i in idx ], [ self._offsets[i] for i in idx ]
+
+    ##\brief Least squares slope of offset against time
+    ##\return Frequency error in parts per million, None if too few samples
+    def frequency_ppm(self):
+        if self._count < 3:
+            return None
+        times, offsets = self.samples()
+        t0 = times[0]
+        n = self._count
+        mean_t = sum(t - t0 for t in times) / n
+        mean_x = sum(offsets) / n
+        sxx = sum((t - t0 - mean_t) ** 2 for t in times)
+        if sxx <= 0:
+            return None
+        sxy = sum((t - t0 - mean_t) * (x - mean_x) for t, x in zip(times, offsets))
+        return sxy / sxx * 1e6
+
+    ##\brief RMS of the differences between successive offsets, as in NTP
+    def jitter(self):
+        if self._count < 2:
+            return None
+        times, offsets = self.samples()
+        diffs = [ (b - a) ** 2 for a, b in zip(offsets[:-1], offsets[1:]) ]
+        return math.sqrt(sum(diffs) / len(diffs))
+
+    ##\brief Median spacing between samples
+    def sample_interval(self):
+        if self._count < 2:
+            return None
+        times, offsets = self.samples()
+        spacing = sorted(b - a for a, b in zip(times[:-1], times[1:]))
+        return spacing[len(spacing) // 2]
+
+    ##\brief Overlapping Allan deviation from the offset (phase) samples
+    ##
+    ## Assumes samples are evenly spaced at the median sample interval; tau is
+    ## rounded to a whole number of intervals.
+    ##\return (tau actually used, ADEV), or None if there aren't enough samples
+    def allan_deviation(self, tau):
+        tau0 = self.sample_interval()
+        if not tau0:
+            return None
+        m = max(1, int(round(tau / tau0)))
+        n = self._count
+        if n < 2 * m + 1:
+            return None
+
+        times, x = self.samples()
+        total = 0.0
+        for i in range(n - 2 * m):
+            total += (x[i + 2 * m] - 2 * x[i + m] + x[i]) ** 2
+        tau_m = m * tau0
+        return tau_m, math.sqrt(total / (2 * tau_m ** 2 * (n - 2 * m)))
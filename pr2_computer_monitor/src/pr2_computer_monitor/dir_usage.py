@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Directory usage index for hd_monitor, kept current with inotify
+##
+## Scans each watched directory once, then applies inotify events to keep
+## per-subtree sizes current so the largest and fastest growing
+## subdirectories can be reported without running 'du' every cycle.
+
+from __future__ import with_statement, division
+
+import os
+import errno
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+from clock import monotonic
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC  = 0x80000
+
+_EVENT_HDR = struct.Struct('iIII')
+
+_libc = None
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+    return _libc
+
+##\brief Minimal non-blocking inotify wrapper using libc through ctypes
+class Inotify(object):
+    def __init__(self):
+        self._libc = _get_libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    ##\brief Returns all queued events as (wd, mask, cookie, name) tuples
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+
+            idx = 0
+            while idx + _EVENT_HDR.size <= len(buf):
+                wd, mask, cookie, length = _EVENT_HDR.unpack_from(buf, idx)
+                idx += _EVENT_HDR.size
+                name = buf[idx:idx + length].rstrip('\0')
+                idx += length
+                events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+def _disk_usage(st):
+    # Allocated size, as 'du' reports it
+    return st.st_blocks * 512
+
+##\brief Per-subtree size index of a set of watched directories
+##
+## Sizes are kept for every file; every directory holds the total of its
+## subtree. Each change is propagated to the ancestors of the file, so the
+## cost of an event is bounded by the depth of the tree, not its size.
+## Each directory also lists its files and subdirectories, so removing a
+## directory only visits the removed subtree.
+## Modified files are only re-stat'ed once per update() call, however many
+## writes happened in between.
+class DirUsageIndex(object):
+    def __init__(self, roots):
+        self._mutex = threading.Lock()
+        self._roots = [ os.path.abspath(os.path.expanduser(r)) for r in roots ]
+
+        self._file_sizes = {}
+        self._dir_sizes = {}
+        self._dir_files = {}   # Directory -> paths of its files
+        self._subdirs = {}     # Directory -> paths of its subdirectories
+        self._growth = {}
+        self._growth_start = monotonic()
+        self._growth_rates = {}
+
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self._dirty = set()
+
+        self._watch_errors = 0
+        self._rescans = 0
+        self._events = 0
+
+        self._inotify = Inotify()
+        self.rescan()
+
+    def close(self):
+        with self._mutex:
+            self._inotify.close()
+
+    @property
+    def roots(self):
+        return list(self._roots)
+
+    ##\brief Drops all state and rebuilds the index with one walk of each root
+    def rescan(self):
+        with self._mutex:
+            for wd in self._wd_to_dir.keys():
+                self._inotify.rm_watch(wd)
+            self._wd_to_dir = {}
+            self._dir_to_wd = {}
+            self._file_sizes = {}
+            self._dir_sizes = {}
+            self._dir_files = {}
+            self._subdirs = {}
+            self._dirty = set()
+            self._growth = {}
+            self._growth_start = monotonic()
+            self._rescans += 1
+
+            for root in self._roots:
+                if os.path.isdir(root):
+                    self._scan_dir(root)
+
+    def _root_of(self, path):
+        for root in self._roots:
+            if path == root or path.startswith(root + os.sep):
+                return root
+        return None
+
+    ##\brief Propagates a size change to the ancestors of path
+    ##
+    ## Only deltas from writes are counted as growth. Scans and moves only
+    ## bring already existing data into the index.
+    def _add_delta(self, path, delta, growth = False):
+        if delta == 0:
+            return
+        root = self._root_of(path)
+        if root is None:
+            return
+
+        # Attribute growth to the top-level subdirectory under the root
+        rel = os.path.relpath(path, root).split(os.sep)
+        if growth and len(rel) > 1 and delta > 0:
+            top = os.path.join(root, rel[0])
+            self._growth[top] = self._growth.get(top, 0) + delta
+
+        parent = os.path.dirname(path)
+        while True:
+            if parent in self._dir_sizes:
+                self._dir_sizes[parent] += delta
+            if parent == root or len(parent) < len(root):
+                break
+            parent = os.path.dirname(parent)
+
+    def _watch(self, path):
+        try:
+            wd = self._inotify.add_watch(path, _WATCH_MASK)
+        except OSError:
+            # ENOSPC when fs.inotify.max_user_watches is reached. The
+            # subtree is still sized, but won't see updates until a rescan.
+            self._watch_errors += 1
+            return
+        self._wd_to_dir[wd] = path
+        self._dir_to_wd[path] = wd
+
+    def _add_dir(self, path):
+        self._dir_sizes[path] = 0
+        parent = os.path.dirname(path)
+        if parent in self._dir_sizes:
+            self._subdirs.setdefault(parent, set()).add(path)
+        self._watch(path)
+
+    def _scan_dir(self, top):
+        if top in self._dir_sizes:
+            return
+        self._add_dir(top)
+
+        # Directories are added before their contents so that the
+        # deltas below reach every ancestor.
+        for dirpath, dirnames, filenames in os.walk(top):
+            for d in dirnames:
+                sub = os.path.join(dirpath, d)
+                if os.path.islink(sub) or sub in self._dir_sizes:
+                    continue
+                self._add_dir(sub)
+            for f in filenames:
+                self._update_file(os.path.join(dirpath, f))
+
+    def _update_file(self, path, growth = False):
+        try:
+            st = os.lstat(path)
+            size = _disk_usage(st)
+        except OSError:
+            size = 0
+        old = self._file_sizes.get(path, 0)
+        dirpath = os.path.dirname(path)
+        if size:
+            self._file_sizes[path] = size
+            self._dir_files.setdefault(dirpath, set()).add(path)
+        elif old:
+            del self._file_sizes[path]
+            self._dir_files[dirpath].discard(path)
+        self._add_delta(path, size - old, growth)
+
+    def _remove_subtree(self, top):
+        parent = os.path.dirname(top)
+        if parent in self._subdirs:
+            self._subdirs[parent].discard(top)
+
+        stack = [ top ]
+        while stack:
+            d = stack.pop()
+            for f in self._dir_files.pop(d, ()):
+                self._add_delta(f, -self._file_sizes.pop(f))
+            stack.extend(self._subdirs.pop(d, ()))
+            self._dir_sizes.pop(d, None)
+            wd = self._dir_to_wd.pop(d, None)
+            if wd is not None:
+                self._wd_to_dir.pop(wd, None)
+                self._inotify.rm_watch(wd)
+
+    ##\brief Applies pending inotify events. Call once per monitoring cycle.
+    def update(self):
+        overflow = False
+        with self._mutex:
+            events = self._inotify.read_events()
+            self._events += len(events)
+            for wd, mask, cookie, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    break
+                dirpath = self._wd_to_dir.get(wd)
+                if dirpath is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self._wd_to_dir.pop(wd, None)
+                    self._dir_to_wd.pop(dirpath, None)
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._remove_subtree(dirpath)
+                    continue
+                if not name:
+                    continue
+
+                path = os.path.join(dirpath, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._scan_dir(path)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        self._remove_subtree(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+                    self._dirty.discard(path)
+                    self._update_file(path)
+                else:
+                    self._dirty.add(path)
+
+            if not overflow:
+                for path in self._dirty:
+                    # Skip files whose directory was removed since
+                    if os.path.dirname(path) in self._dir_sizes:
+                        self._update_file(path, growth = True)
+                self._dirty = set()
+
+            # Pick up roots that were removed and created again
+            for root in self._roots:
+                if root not in self._dir_sizes and os.path.isdir(root):
+                    self._scan_dir(root)
+
+        # Kernel dropped events, index can't be trusted anymore
+        if overflow:
+            self.rescan()
+
+        with self._mutex:
+            now = monotonic()
+            dt = now - self._growth_start
+            if dt > 0:
+                self._growth_rates = dict((d, g / dt) for d, g in self._growth.iteritems())
+            self._growth = {}
+            self._growth_start = now
+
+    def total(self, root):
+        with self._mutex:
+            return self._dir_sizes.get(os.path.abspath(os.path.expanduser(root)), 0)
+
+    ##\brief Largest subdirectories directly below the watched roots
+    ##\return List of (path, bytes), largest first
+    def largest(self, n):
+        with self._mutex:
+            dirs = [ (d, s) for d, s in self._dir_sizes.iteritems()
+                     if os.path.dirname(d) in self._roots ]
+        dirs.sort(key = lambda x: x[1], reverse = True)
+        return dirs[:n]
+
+    ##\brief Fastest growing subdirectories over the last update() interval
+    ##\return List of (path, bytes/sec), fastest first
+    def fastest_growing(self, n):
+        with self._mutex:
+            rates = [ (d, r) for d, r in self._growth_rates.iteritems()
+                      if r > 0 and d in self._dir_sizes ]
+        rates.sort(key = lambda x: x[1], reverse = True)
+        return rates[:n]
+
+    def get_stats(self):
+        with self._mutex:
+            return { 'watches': len(self._wd_to_dir),
+                     'watch_errors': self._watch_errors,
+                     'files': len(self._file_sizes),
+                     'rescans': self._rescans,
+                     'events': self._events }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Per process GPU memory use, attributed to ROS nodes
+
+from __future__ import with_statement
+
+import os
+
+def _number(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+##\brief Guesses a ROS node name from a process's arguments
+##
+## roslaunch passes the node name as a __name:= remapping, and the
+## namespace as __ns:=. Otherwise it's the name of the script or program.
+def node_name_from_cmdline(args):
+    name = None
+    ns = ''
+    for arg in args:
+        if arg.startswith('__name:='):
+            name = arg[len('__name:='):]
+        elif arg.startswith('__ns:='):
+            ns = arg[len('__ns:='):]
+    if name is not None:
+        return '/'.join([ ns.rstrip('/'), name ]) if ns else '/' + name
+    if not args:
+        return ''
+
+    prog = os.path.basename(args[0])
+    # Interpreters run a script, named by the first argument that isn't a flag
+    if prog.startswith('python') or prog in ('bash', 'sh'):
+        for arg in args[1:]:
+            if not arg.startswith('-'):
+                return os.path.basename(arg)
+    return prog
+
+##\brief Cache of pid to node name, read from /proc/<pid>/cmdline
+##
+## Processes on the GPU live for a long time, so each process is read once.
+## Entries are checked against the start time in /proc/<pid>/stat, so a
+## pid reused by a new process is read again. prune() drops pids that have
+## gone.
+class ProcessNames(object):
+    def __init__(self, proc_root = '/proc'):
+        self._proc_root = proc_root
+        self._names = {} # pid -> (start time, name)
+        self.reads = 0
+
+    ##\return Start time of the process in clock ticks since boot, or None
+    def start_time(self, pid):
+        try:
+            with open(os.path.join(self._proc_root, str(pid), 'stat')) as f:
+                stat = f.read()
+            # The command in parentheses may contain spaces, starttime is
+            # the 22nd field
+            return int(stat[stat.rindex(')') + 2:].split()[19])
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    def name(self, pid, default = ''):
+        start = self.start_time(pid)
+        if pid in self._names and self._names[pid][0] == start:
+            return self._names[pid][1]
+        self.reads += 1
+        try:
+            with open(os.path.join(self._proc_root, str(pid), 'cmdline')) as f:
+                args = f.read().split('\0')
+        except (IOError, OSError):
+            # Gone, or in another PID namespace
+            return default
+        if args and args[-1] == '':
+            args = args[:-1]
+        name = node_name_from_cmdline(args) or default
+        self._names[pid] = (start, name)
+        return name
+
+    ##\param pids Pids that are still running
+    def prune(self, pids):
+        for pid in set(self._names) - set(pids):
+            del self._names[pid]
+
+##\brief One compute process on one GPU, memory in MiB. Utilisation is
+## in percent, or None if it isn't known.
+class GPUProcess(object):
+    def __init__(self, pid, gpu_bus_id, process_name, used_memory, node = ''):
+        self.pid = pid
+        self.gpu_bus_id = gpu_bus_id
+        self.process_name = process_name
+        self.used_memory = used_memory
+        self.node = node
+        self.sm_usage = None
+        self.memory_usage = None
+
+##\brief Converts rows of nvidia-smi --query-compute-apps to GPUProcess,
+## naming each process from names, a ProcessNames
+def rows_to_gpu_processes(rows, names):
+    procs = []
+    for row in rows:
+        pid = _number(row.get('pid'))
+        if pid is None:
+            continue
+        pid = int(pid)
+        process_name = row.get('process_name', '')
+        procs.append(GPUProcess(pid, row.get('gpu_bus_id', ''), process_name,
+                                _number(row.get('used_memory')) or 0,
+                                names.name(pid, os.path.basename(process_name))))
+    names.prune([ p.pid for p in procs ])
+    return procs
+
+def _bus_id(bus_id):
+    # Domain is 4 or 8 digits depending on the query and driver
+    return bus_id.lower().split(':', 1)[-1]
+
+##\brief Fills in the utilisation of procs from rows of nvidia-smi pmon
+##\param bus_ids Dict of GPU index, as a string, to PCI bus id. pmon
+## numbers GPUs, the compute-apps query names them by bus id.
+def add_process_usage(procs, pmon_rows, bus_ids):
+    usage = {}
+    for row in pmon_rows:
+        bus_id = bus_ids.get(row.get('gpu'))
+        pid = _number(row.get('pid'))
+        if bus_id is not None and pid is not None:
+            usage[(_bus_id(bus_id), int(pid))] = row
+    for proc in procs:
+        row = usage.get((_bus_id(proc.gpu_bus_id), proc.pid))
+        if row is not None:
+            proc.sm_usage = _number(row.get('sm'))
+            proc.memory_usage = _number(row.get('mem'))
+
+##\return Processes on the GPU at bus_id using the most memory, largest first
+def top_processes(procs, bus_id, count):
+    on_gpu = [ p for p in procs if _bus_id(p.gpu_bus_id) == _bus_id(bus_id) ]
+    return sorted(on_gpu, key = lambda p: -p.used_memory)[:count]
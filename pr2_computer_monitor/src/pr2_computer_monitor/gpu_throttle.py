@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Tracks power and thermal clock throttling of one GPU for nvidia_temp
+
+from __future__ import division
+
+from collections import deque
+
+from nvidia_smi_util import THROTTLE_POWER, THROTTLE_THERMAL
+
+POWER = 'Power'
+THERMAL = 'Thermal'
+
+_KINDS = [ (POWER, THROTTLE_POWER), (THERMAL, THROTTLE_THERMAL) ]
+
+##\brief Counts throttle events and how long throttling has lasted
+##
+## An event is the start of a throttled period, so a GPU held at its power
+## cap counts once however long it stays there. Events are counted over the
+## last window seconds. Throttling that lasts sustain_time seconds or more
+## is sustained, which is what separates a GPU that's power or heat limited
+## from one that touches its cap now and then. Times are in seconds and
+## should be monotonic.
+class ThrottleTracker(object):
+    def __init__(self, sustain_time = 10.0, window = 60.0):
+        self.sustain_time = sustain_time
+        self.window = window
+        self._since = dict((kind, None) for kind, bits in _KINDS)
+        self._events = deque()
+        self._totals = dict((kind, 0) for kind, bits in _KINDS)
+        self._now = None
+
+    ##\param mask Active clocks throttle reasons, None if unknown
+    def update(self, mask, now):
+        self._now = now
+        if mask is not None:
+            for kind, bits in _KINDS:
+                if not mask & bits:
+                    self._since[kind] = None
+                elif self._since[kind] is None:
+                    self._since[kind] = now
+                    self._events.append((now, kind))
+                    self._totals[kind] += 1
+
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    ##\return Number of throttle events of kind in the window
+    def events(self, kind):
+        return len([ e for e in self._events if e[1] == kind ])
+
+    def total_events(self, kind):
+        return self._totals[kind]
+
+    ##\return Seconds that kind of throttling has been active, 0 if it isn't
+    def duration(self, kind):
+        if self._since[kind] is None:
+            return 0.0
+        return self._now - self._since[kind]
+
+    ##\return Kinds of throttling active for at least sustain_time
+    def sustained(self):
+        return [ kind for kind, bits in _KINDS if self._since[kind] is not None and
+                 self.duration(kind) >= self.sustain_time ]
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Windowed statistics of wireless link quality
+
+from __future__ import division
+
+import re
+import time
+from collections import deque
+
+from diagnostic_msgs.msg import KeyValue
+
+##\brief Linear interpolated percentile of a sorted list, p in [0, 100]
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    pos = (len(sorted_vals) - 1) * p / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+##\brief Fixed size ring buffer of (time, value) samples
+class RollingStats(object):
+    def __init__(self, size = 600):
+        self._size = size
+        self._times = [ 0.0 ] * size
+        self._values = [ 0.0 ] * size
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, t, value):
+        idx = (self._start + self._count) % self._size
+        self._times[idx] = t
+        self._values[idx] = value
+        if self._count < self._size:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % self._size
+
+    ##\return Values with time after 'since', oldest first
+    def values_since(self, since):
+        vals = []
+        for i in range(self._count - 1, -1, -1):
+            idx = (self._start + i) % self._size
+            if self._times[idx] < since:
+                break
+            vals.append(self._values[idx])
+        vals.reverse()
+        return vals
+
+    ##\return Dict of count, min, max, mean, p10, p50 and variance over the
+    ## last 'window' seconds, or None if there are no samples
+    def summary(self, window, now):
+        vals = sorted(self.values_since(now - window))
+        if not vals:
+            return None
+        n = len(vals)
+        mean = sum(vals) / n
+        return { 'count': n,
+                 'min': vals[0],
+                 'max': vals[-1],
+                 'mean': mean,
+                 'p10': percentile(vals, 10),
+                 'p50': percentile(vals, 50),
+                 'variance': sum((v - mean) ** 2 for v in vals) / n }
+
+_RATE_RE = re.compile(r'\s*([0-9.]+)')
+
+##\brief Link rate in Mbps from strings like '54 Mb/s' or '130.0 Mbps'
+def parse_rate(rate):
+    m = _RATE_RE.match(rate or '')
+    if not m:
+        return None
+    try:
+        return float(m.group(1))
+    except ValueError:
+        return None
+
+##\brief Rolling statistics of each wireless link metric, and link drops
+class WifiLinkStats(object):
+    # Attribute and diagnostic label of each metric
+    METRICS = [ ('signal', 'Signal'), ('noise', 'Noise'), ('snr', 'Sig/Noise'),
+                ('quality', 'Quality'), ('rate', 'Rate (Mbps)') ]
+
+    def __init__(self, windows = [ 10, 60, 300 ], size = 600):
+        self.windows = windows
+        self._stats = dict((name, RollingStats(size)) for name, label in self.METRICS)
+        self._connected = None
+        self.drops = 0
+        self.last_drop_time = None
+
+    ##\brief Adds one sample. Metrics that are None are skipped.
+    ##\param connected False if the link is down, which counts a drop if it was up
+    def add(self, t, connected, signal = None, noise = None, snr = None, quality = None, rate = None):
+        if self._connected and not connected:
+            self.drops += 1
+            self.last_drop_time = t
+        self._connected = connected
+        if not connected:
+            return
+
+        sample = { 'signal': signal, 'noise': noise, 'snr': snr, 'quality': quality, 'rate': rate }
+        for name, value in sample.iteritems():
+            if value is not None:
+                self._stats[name].add(t, value)
+
+    def summary(self, metric, window, now):
+        return self._stats[metric].summary(window, now)
+
+    ##\brief True if the median SNR over the window is below the threshold
+    def low_snr(self, threshold, window, now, min_samples = 3):
+        s = self.summary('snr', window, now)
+        if s is None or s['count'] < min_samples:
+            return False
+        return s['p50'] < threshold
+
+    ##\return KeyValues with min, mean, p10 and variance of each metric
+    ## over each window, and the drop count
+    def to_values(self, now):
+        vals = [ KeyValue(key = 'Link Drops', value = str(self.drops)) ]
+        if self.last_drop_time is not None:
+            vals.append(KeyValue(key = 'Time Since Drop', value = '%.0f' % (now - self.last_drop_time)))
+        for window in self.windows:
+            for name, label in self.METRICS:
+                s = self.summary(name, window, now)
+                if s is None:
+                    continue
+                prefix = '%s %ds' % (label, window)
+                vals.append(KeyValue(key = prefix + ' Min',      value = '%.1f' % s['min']))
+                vals.append(KeyValue(key = prefix + ' Mean',     value = '%.1f' % s['mean']))
+                vals.append(KeyValue(key = prefix + ' P10',      value = '%.1f' % s['p10']))
+                vals.append(KeyValue(key = prefix + ' Variance', value = '%.2f' % s['variance']))
+        return vals
+
+ROAM = 'roam'
+ESSID_CHANGE = 'essid'
+CHANNEL_CHANGE = 'channel'
+RATE_CHANGE = 'rate'
+DISCONNECT = 'disconnect'
+CONNECT = 'connect'
+
+##\brief One change of the wireless association, or of its rate
+class LinkEvent(object):
+    def __init__(self, t, kind, old, new, detail = ''):
+        self.t = t
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.detail = detail
+
+    def __str__(self):
+        s = '%s %s: %s -> %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.t)),
+                                 self.kind, self.old, self.new)
+        if self.detail:
+            s += ' (%s)' % self.detail
+        return s
+
+##\brief Bounded timeline of association changes between consecutive
+## samples of the wireless link
+##
+## A BSSID change within the same ESSID is a roam. Rate changes smaller
+## than rate_change_min (a fraction of the old rate) aren't recorded, as
+## rate adaptation moves the rate a little all the time.
+class RoamTimeline(object):
+    def __init__(self, size = 200, rate_change_min = 0.25):
+        self._events = deque(maxlen = size)
+        self.rate_change_min = rate_change_min
+        self._last = None
+        self.counts = dict((kind, 0) for kind in
+                           (ROAM, ESSID_CHANGE, CHANNEL_CHANGE, RATE_CHANGE, DISCONNECT, CONNECT))
+        self.last_roam_time = None
+        # Roam times for the last hour, kept apart from the timeline so a
+        # burst of rate changes can't push them out
+        self._roam_times = deque()
+
+    def _add(self, event):
+        self._events.append(event)
+        self.counts[event.kind] += 1
+        return event
+
+    ##\brief Compares a sample with the previous one
+    ##\param t Wall clock time (s)
+    ##\param rate Link rate in Mbps, or None
+    ##\return List of new LinkEvent's
+    def update(self, t, connected, bssid, essid, channel, rate):
+        events = []
+        last = self._last
+        self._last = (connected, bssid, essid, channel, rate)
+        if last is None:
+            return events
+        was_connected, last_bssid, last_essid, last_channel, last_rate = last
+
+        if was_connected and not connected:
+            return [ self._add(LinkEvent(t, DISCONNECT, last_bssid, '')) ]
+        if not connected:
+            return events
+        if not was_connected:
+            return [ self._add(LinkEvent(t, CONNECT, '', bssid, 'ESSID %s, channel %s' % (essid, channel))) ]
+
+        if essid != last_essid:
+            events.append(self._add(LinkEvent(t, ESSID_CHANGE, last_essid, essid,
+                                              'BSSID %s -> %s' % (last_bssid, bssid))))
+        elif bssid != last_bssid:
+            events.append(self._add(LinkEvent(t, ROAM, last_bssid, bssid,
+                                              'channel %s -> %s' % (last_channel, channel))))
+            self.last_roam_time = t
+            self._roam_times.append(t)
+        elif channel != last_channel:
+            events.append(self._add(LinkEvent(t, CHANNEL_CHANGE, last_channel, channel)))
+
+        if rate is not None and last_rate:
+            if abs(rate - last_rate) >= self.rate_change_min * last_rate:
+                events.append(self._add(LinkEvent(t, RATE_CHANGE, last_rate, rate)))
+        return events
+
+    def roams_last_hour(self, now):
+        while self._roam_times and self._roam_times[0] < now - 3600:
+            self._roam_times.popleft()
+        return len(self._roam_times)
+
+    ##\return The most recent events, oldest first
+    def recent(self, n = None):
+        events = list(self._events)
+        if n is not None:
+            events = events[-n:]
+        return events
+
+    def to_values(self, now):
+        vals = [ KeyValue(key = 'Roams', value = str(self.counts[ROAM])),
+                 KeyValue(key = 'Roams Last Hour', value = str(self.roams_last_hour(now))),
+                 KeyValue(key = 'ESSID Changes', value = str(self.counts[ESSID_CHANGE])),
+                 KeyValue(key = 'Channel Changes', value = str(self.counts[CHANNEL_CHANGE])),
+                 KeyValue(key = 'Rate Changes', value = str(self.counts[RATE_CHANGE])),
+                 KeyValue(key = 'Disconnects', value = str(self.counts[DISCONNECT])) ]
+        if self.last_roam_time is not None:
+            vals.append(KeyValue(key = 'Time Since Roam', value = '%.0f' % (now - self.last_roam_time)))
+        if self._events:
+            vals.append(KeyValue(key = 'Last Link Event', value = str(self._events[-1])))
+        return vals
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+##\brief Size and age budget cleanup of ROS log directories, for log_janitor
+
+from __future__ import with_statement, division
+
+import rospy
+
+import traceback
+import threading
+import os, time
+import gzip
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_EXT = ('.gz', '.zst')
+CHUNK_SIZE = 256 * 1024
+# Deleting a file is charged as this much I/O against the rate limit
+DELETE_COST = CHUNK_SIZE
+
+##\brief Name of the block device holding path, as in /proc/diskstats
+def get_block_device(path):
+    try:
+        dev = os.stat(path).st_dev
+        sys_path = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(dev), os.minor(dev)))
+        return os.path.basename(sys_path)
+    except OSError:
+        return None
+
+##\brief Milliseconds the device spent doing I/O, from /proc/diskstats
+def get_io_ticks(device):
+    try:
+        with open('/proc/diskstats', 'r') as f:
+            for ln in f:
+                words = ln.split()
+                if len(words) > 12 and words[2] == device:
+                    return int(words[12])
+    except IOError:
+        pass
+    return None
+
+##\brief Compresses closed log files and deletes the oldest runs of a log
+## root until it is within its size and age budget
+##
+## All disk work is rate limited, and paused while the disk is busy.
+## Nothing modified in the last min_idle seconds is compressed or deleted.
+class LogCleaner(object):
+    def __init__(self, max_size, max_age, min_idle, max_io_rate, busy_util,
+                 compression = 'gzip', stop = None):
+        self._mutex = threading.Lock()
+        self._stop = stop or threading.Event()
+
+        self._max_size = max_size
+        self._max_age = max_age
+        self._min_idle = min_idle
+        self._max_io_rate = max_io_rate
+        self._busy_util = busy_util
+        self.compression = compression
+
+        self._bytes_compressed = 0
+        self._bytes_deleted = 0
+        self._files_compressed = 0
+        self._runs_deleted = 0
+        self._throttle_waits = 0
+        self._errors = 0
+        self._root_sizes = {}
+        self._last_io_sample = (0, None)
+
+    def error(self):
+        with self._mutex:
+            self._errors += 1
+
+    def get_stats(self):
+        with self._mutex:
+            return { 'bytes_compressed': self._bytes_compressed,
+                     'bytes_deleted': self._bytes_deleted,
+                     'files_compressed': self._files_compressed,
+                     'runs_deleted': self._runs_deleted,
+                     'throttle_waits': self._throttle_waits,
+                     'errors': self._errors,
+                     'root_sizes': dict(self._root_sizes) }
+
+    ## Sleeps until our own I/O is back under the rate limit, then until
+    ## the disk is quiet enough. Utilisation is measured over the time
+    ## since the previous call, so an idle disk costs no extra waiting.
+    def _throttle(self, device, nbytes, chunk_start):
+        if self._max_io_rate > 0:
+            wait = nbytes / self._max_io_rate - (time.time() - chunk_start)
+            if wait > 0:
+                self._stop.wait(wait)
+
+        if device is None or self._busy_util <= 0:
+            return
+        while not self._stop.is_set():
+            now = time.time()
+            ticks = get_io_ticks(device)
+            if ticks is None:
+                return
+            last_time, last_ticks = self._last_io_sample
+            self._last_io_sample = (now, ticks)
+            if last_ticks is None or now - last_time > 5.0:
+                return
+
+            util = 100.0 * (ticks - last_ticks) / max(1.0, (now - last_time) * 1000)
+            if util < self._busy_util:
+                return
+            with self._mutex:
+                self._throttle_waits += 1
+            self._stop.wait(1.0)
+
+    def _compress(self, path, device):
+        if self.compression == 'zstd':
+            dest = path + '.zst'
+        else:
+            dest = path + '.gz'
+        tmp = dest + '.tmp'
+
+        orig_size = os.path.getsize(path)
+        try:
+            with open(path, 'rb') as src:
+                if self.compression == 'zstd':
+                    out = zstandard.ZstdCompressor(level = 3).stream_writer(open(tmp, 'wb'))
+                else:
+                    out = gzip.open(tmp, 'wb', 6)
+                try:
+                    while not self._stop.is_set():
+                        chunk_start = time.time()
+                        data = src.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        out.write(data)
+                        self._throttle(device, len(data), chunk_start)
+                finally:
+                    out.close()
+
+            if self._stop.is_set():
+                os.remove(tmp)
+                return 0
+
+            # Don't replace a file that was written to while compressing
+            st = os.stat(path)
+            if st.st_size != orig_size or time.time() - st.st_mtime < self._min_idle:
+                os.remove(tmp)
+                return 0
+
+            shutil.copystat(path, tmp)
+            os.rename(tmp, dest)
+            os.remove(path)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        return orig_size - os.path.getsize(dest)
+
+    ## Removes a run one file at a time, throttled like compression.
+    ## Returns False if stopped before the run was fully removed.
+    def _remove_run(self, path, device):
+        if not os.path.isdir(path) or os.path.islink(path):
+            os.remove(path)
+            return True
+        for dirpath, dirnames, filenames in os.walk(path, topdown = False):
+            for name in filenames + [ d for d in dirnames if os.path.islink(os.path.join(dirpath, d)) ]:
+                if self._stop.is_set():
+                    return False
+                start = time.time()
+                os.remove(os.path.join(dirpath, name))
+                self._throttle(device, DELETE_COST, start)
+            for name in dirnames:
+                sub = os.path.join(dirpath, name)
+                if not os.path.islink(sub):
+                    os.rmdir(sub)
+        os.rmdir(path)
+        return True
+
+    ## Runs are the top-level entries of a log root (one directory per
+    ## roslaunch). Returns (mtime, path, size, files) sorted oldest first,
+    ## and the size of the active run, which is never touched.
+    def _list_runs(self, root):
+        active = None
+        latest = os.path.join(root, 'latest')
+        if os.path.islink(latest):
+            active = os.path.realpath(latest)
+
+        runs = []
+        active_size = 0
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                continue
+            mtime = 0
+            size = 0
+            files = []
+            if os.path.isdir(path):
+                try:
+                    mtime = os.lstat(path).st_mtime
+                except OSError:
+                    continue
+                for dirpath, dirnames, filenames in os.walk(path):
+                    for f in filenames:
+                        files.append(os.path.join(dirpath, f))
+            else:
+                files.append(path)
+            for f in files:
+                try:
+                    st = os.lstat(f)
+                except OSError:
+                    continue
+                mtime = max(mtime, st.st_mtime)
+                size += st.st_size
+            if os.path.realpath(path) == active:
+                active_size += size
+            else:
+                runs.append((mtime, path, size, files))
+        runs.sort()
+        return runs, active_size
+
+    def clean_root(self, root):
+        device = get_block_device(root)
+        now = time.time()
+
+        runs, active_size = self._list_runs(root)
+        total = active_size + sum(r[2] for r in runs)
+
+        # Delete oldest runs first until we are within budget. Runs still
+        # being written to, such as another live roslaunch, are kept.
+        kept = []
+        for run in runs:
+            mtime, path, size, files = run
+            if self._stop.is_set() or \
+                    (total <= self._max_size and now - mtime <= self._max_age):
+                kept.append(run)
+                continue
+            if now - mtime < self._min_idle:
+                kept.append(run)
+                continue
+            try:
+                removed = self._remove_run(path, device)
+            except OSError:
+                rospy.logwarn('Log janitor unable to remove %s: %s' % (path, traceback.format_exc()))
+                self.error()
+                continue
+            if not removed:
+                kept.append(run)
+                continue
+            rospy.loginfo('Log janitor removed %s (%.1f MB)' % (path, size / 1e6))
+            total -= size
+            with self._mutex:
+                self._bytes_deleted += size
+                self._runs_deleted += 1
+
+        # Compress closed files in what's left, oldest first
+        for mtime, path, size, files in kept:
+            for f in files:
+                if self._stop.is_set():
+                    return
+                if f.endswith(COMPRESSED_EXT) or f.endswith('.tmp'):
+                    continue
+                try:
+                    st = os.lstat(f)
+                    if not os.path.isfile(f) or os.path.islink(f) or \
+                            now - st.st_mtime < self._min_idle:
+                        continue
+                    saved = self._compress(f, device)
+                except (IOError, OSError):
+                    rospy.logwarn('Log janitor unable to compress %s: %s' % (f, traceback.format_exc()))
+                    self.error()
+                    continue
+                if saved:
+                    total -= saved
+                    with self._mutex:
+                        self._bytes_compressed += saved
+                        self._files_compressed += 1
+
+        with self._mutex:
+            self._root_sizes[root] = total
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Network interface throughput and error rates from /proc and /sys
+
+from __future__ import with_statement, division
+
+import os
+
+PROC_NET_DEV_FIELDS = [ 'rx_bytes', 'rx_packets', 'rx_errors', 'rx_dropped', 'rx_fifo_errors',
+                        'rx_frame_errors', 'rx_compressed', 'multicast',
+                        'tx_bytes', 'tx_packets', 'tx_errors', 'tx_dropped', 'tx_fifo_errors',
+                        'collisions', 'tx_carrier_errors', 'tx_compressed' ]
+
+# Counters only in /sys/class/net/<if>/statistics
+SYSFS_ERROR_FIELDS = [ 'rx_crc_errors', 'rx_missed_errors', 'rx_length_errors', 'rx_over_errors' ]
+
+##\return Dict of interface name to dict of counters
+def parse_proc_net_dev(text):
+    counters = {}
+    for line in text.splitlines()[2:]:
+        if ':' not in line:
+            continue
+        name, rest = line.split(':', 1)
+        fields = rest.split()
+        if len(fields) < len(PROC_NET_DEV_FIELDS):
+            continue
+        counters[name.strip()] = dict(zip(PROC_NET_DEV_FIELDS, [ int(f) for f in fields ]))
+    return counters
+
+##\return Dict of protocol ('Tcp', 'Udp', ...) to dict of counters
+def parse_proc_net_snmp(text):
+    stats = {}
+    lines = text.splitlines()
+    for header, values in zip(lines[0::2], lines[1::2]):
+        proto, names = header.split(':', 1)
+        vproto, vals = values.split(':', 1)
+        if proto != vproto:
+            continue
+        stats[proto] = dict(zip(names.split(), [ int(v) for v in vals.split() ]))
+    return stats
+
+def _read_sys(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+##\brief Link state of one interface from sysfs
+##\return Dict of 'operstate', 'speed' (Mbps, None if unknown), 'mtu'
+## and the sysfs only error counters that are present
+def read_link_info(interface, sys_root = '/sys/class/net'):
+    base = os.path.join(sys_root, interface)
+    info = { 'operstate': _read_sys(os.path.join(base, 'operstate')) or 'unknown' }
+
+    speed = _read_sys(os.path.join(base, 'speed'))
+    try:
+        info['speed'] = int(speed) if int(speed) > 0 else None
+    except (TypeError, ValueError):
+        info['speed'] = None
+
+    mtu = _read_sys(os.path.join(base, 'mtu'))
+    info['mtu'] = int(mtu) if mtu and mtu.isdigit() else None
+
+    for field in SYSFS_ERROR_FIELDS:
+        val = _read_sys(os.path.join(base, 'statistics', field))
+        if val is not None and val.isdigit():
+            info[field] = int(val)
+    return info
+
+##\brief Rates of one interface over the last sample period
+class InterfaceRates(object):
+    def __init__(self, name, counters, link):
+        self.name = name
+        self.counters = counters
+        self.operstate = link['operstate']
+        self.speed = link['speed']
+        self.mtu = link['mtu']
+        self.link = link
+        self.rx_mbps = None
+        self.tx_mbps = None
+        self.rx_pps = None
+        self.tx_pps = None
+        self.errors_per_sec = None
+        self.drops_per_sec = None
+        # Fraction of link speed used in the busier direction
+        self.utilisation = None
+
+##\brief TCP retransmission rate over the last sample period
+class TCPRates(object):
+    def __init__(self, counters):
+        self.counters = counters
+        self.out_segs_per_sec = None
+        self.retrans_per_sec = None
+        self.retrans_percent = None
+
+def _delta(cur, prev, key):
+    if key not in cur or key not in prev or cur[key] < prev[key]:
+        return None
+    return cur[key] - prev[key]
+
+##\brief Samples all interface counters once per call and computes rates
+## from the previous call
+class NetCollector(object):
+    def __init__(self, proc_root = '/proc', sys_root = '/sys/class/net'):
+        self._proc_root = proc_root
+        self._sys_root = sys_root
+        self._prev = {}
+        self._prev_tcp = None
+
+    ##\param now Monotonic time (s)
+    ##\return (dict of interface name to InterfaceRates, TCPRates or None)
+    def sample(self, now):
+        with open(os.path.join(self._proc_root, 'net', 'dev')) as f:
+            dev = parse_proc_net_dev(f.read())
+
+        rates = {}
+        for name, counters in dev.iteritems():
+            link = read_link_info(name, self._sys_root)
+            counters = dict(counters)
+            for field in SYSFS_ERROR_FIELDS:
+                if field in link:
+                    counters[field] = link[field]
+
+            r = InterfaceRates(name, counters, link)
+            prev = self._prev.get(name)
+            if prev is not None and now > prev[0]:
+                self._compute(r, prev[1], now - prev[0])
+            self._prev[name] = (now, counters)
+            rates[name] = r
+
+        for name in self._prev.keys():
+            if name not in dev:
+                del self._prev[name]
+
+        return rates, self._sample_tcp(now)
+
+    def _compute(self, r, prev, dt):
+        cur = r.counters
+        rx_bytes = _delta(cur, prev, 'rx_bytes')
+        tx_bytes = _delta(cur, prev, 'tx_bytes')
+        if rx_bytes is not None:
+            r.rx_mbps = rx_bytes * 8 / dt / 1e6
+        if tx_bytes is not None:
+            r.tx_mbps = tx_bytes * 8 / dt / 1e6
+        rx_packets = _delta(cur, prev, 'rx_packets')
+        tx_packets = _delta(cur, prev, 'tx_packets')
+        if rx_packets is not None:
+            r.rx_pps = rx_packets / dt
+        if tx_packets is not None:
+            r.tx_pps = tx_packets / dt
+
+        errors = [ _delta(cur, prev, k) for k in ('rx_errors', 'tx_errors') ]
+        drops = [ _delta(cur, prev, k) for k in ('rx_dropped', 'tx_dropped') ]
+        if None not in errors:
+            r.errors_per_sec = sum(errors) / dt
+        if None not in drops:
+            r.drops_per_sec = sum(drops) / dt
+
+        if r.speed and r.rx_mbps is not None and r.tx_mbps is not None:
+            r.utilisation = max(r.rx_mbps, r.tx_mbps) / r.speed
+
+    def _sample_tcp(self, now):
+        try:
+            with open(os.path.join(self._proc_root, 'net', 'snmp')) as f:
+                tcp = parse_proc_net_snmp(f.read()).get('Tcp')
+        except IOError:
+            return None
+        if tcp is None:
+            return None
+
+        t = TCPRates(tcp)
+        if self._prev_tcp is not None and now > self._prev_tcp[0]:
+            dt = now - self._prev_tcp[0]
+            out_segs = _delta(tcp, self._prev_tcp[1], 'OutSegs')
+            retrans = _delta(tcp, self._prev_tcp[1], 'RetransSegs')
+            if out_segs is not None and retrans is not None:
+                t.out_segs_per_sec = out_segs / dt
+                t.retrans_per_sec = retrans / dt
+                if out_segs > 0:
+                    t.retrans_percent = 100 * retrans / out_segs
+        self._prev_tcp = (now, tcp)
+        return t
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Reads the local NTP daemon's own view of the clock
+##
+## chronyd is asked through its command socket ('tracking' and 'sources'),
+## ntpd through a mode 6 READVAR. Neither generates NTP traffic on the
+## network: the daemon answers from state it already has.
+
+from __future__ import division
+
+import os
+import socket
+import struct
+import select
+import random
+import shutil
+import tempfile
+
+CHRONY_SOCKET = '/var/run/chrony/chronyd.sock'
+CHRONY_PORT = 323
+
+LEAP_STATUS = { 0: 'Normal', 1: 'Insert Second', 2: 'Delete Second', 3: 'Not Synchronised' }
+
+class NTPDaemonError(Exception):
+    pass
+
+##\brief State of the local NTP daemon. Times are in seconds.
+class DaemonStatus(object):
+    def __init__(self):
+        self.daemon = ''
+        self.offset = 0.0
+        self.system_time_offset = None
+        self.rms_offset = None
+        self.jitter = None
+        self.freq_ppm = None
+        self.root_delay = 0.0
+        self.root_dispersion = 0.0
+        self.stratum = 0
+        self.leap = 3
+        self.ref_id = ''
+        self.selected_source = ''
+        self.num_sources = None
+        self.reachable_sources = None
+
+    @property
+    def leap_status(self):
+        return LEAP_STATUS.get(self.leap, 'Unknown')
+
+    @property
+    def synchronised(self):
+        return self.leap != 3
+
+# chrony command protocol, see candm.h in the chrony sources
+_CHRONY_PROTO_VERSION = 6
+_CHRONY_PKT_REQUEST = 1
+_CHRONY_PKT_REPLY = 2
+_CHRONY_REQ_N_SOURCES = 14
+_CHRONY_REQ_SOURCE_DATA = 15
+_CHRONY_REQ_TRACKING = 33
+_CHRONY_STT_SUCCESS = 0
+_CHRONY_SD_SELECTED = 0
+_CHRONY_IPADDR_INET4 = 1
+_CHRONY_IPADDR_INET6 = 2
+
+_CHRONY_REQ_HDR = struct.Struct('!BBBBHHIII')
+_CHRONY_RPY_HDR = struct.Struct('!BBBBHHHHHHIII')
+_CHRONY_IPADDR = struct.Struct('!16sHH')
+
+# Requests are padded to the length of their reply
+_CHRONY_RPY_DATA_LEN = { _CHRONY_REQ_N_SOURCES: 4,
+                         _CHRONY_REQ_SOURCE_DATA: 48,
+                         _CHRONY_REQ_TRACKING: 76 }
+
+##\brief Decodes chrony's 32 bit float: 7 bit exponent, 25 bit coefficient
+def chrony_float(x):
+    exp = x >> 25
+    if exp >= 1 << 6:
+        exp -= 1 << 7
+    exp -= 25
+    coef = x % (1 << 25)
+    if coef >= 1 << 24:
+        coef -= 1 << 25
+    return coef * 2.0 ** exp
+
+def _chrony_ipaddr(data, offset):
+    addr, family, pad = _CHRONY_IPADDR.unpack_from(data, offset)
+    if family == _CHRONY_IPADDR_INET4:
+        return socket.inet_ntoa(addr[:4])
+    if family == _CHRONY_IPADDR_INET6 and hasattr(socket, 'inet_ntop'):
+        return socket.inet_ntop(socket.AF_INET6, addr)
+    return ''
+
+##\brief Fills in status from the body of a chrony tracking reply
+def parse_chrony_tracking(data, status):
+    if len(data) < 76:
+        raise NTPDaemonError('Short tracking reply from chronyd')
+    ref_id = struct.unpack_from('!I', data, 0)[0]
+    ip = _chrony_ipaddr(data, 4)
+    stratum, leap = struct.unpack_from('!HH', data, 24)
+    # Skip reference time (3 x uint32)
+    (correction, last_offset, rms_offset, freq_ppm, resid_freq, skew,
+     root_delay, root_disp, update_interval) = \
+        [ chrony_float(f) for f in struct.unpack_from('!9I', data, 40) ]
+
+    status.ref_id = '%08X' % ref_id
+    status.selected_source = ip or status.ref_id
+    status.stratum = stratum
+    status.leap = leap
+    # chrony's offsets are local minus true time, the other backends
+    # report server minus local, and the correction is how far the system
+    # clock still has to be slewed.
+    status.system_time_offset = correction
+    status.offset = -last_offset
+    status.rms_offset = rms_offset
+    status.freq_ppm = freq_ppm
+    status.root_delay = root_delay
+    status.root_dispersion = root_disp
+
+##\brief Decodes the body of a chrony source data reply
+##\return (address, state, reachability register)
+def parse_chrony_source(data):
+    if len(data) < 32:
+        raise NTPDaemonError('Short source data reply from chronyd')
+    ip = _chrony_ipaddr(data, 0)
+    poll, stratum, state, mode, flags, reach = struct.unpack_from('!hHHHHH', data, 20)
+    return ip, state, reach
+
+class ChronyClient(object):
+    def __init__(self, socket_path = CHRONY_SOCKET, timeout = 1.0):
+        self._timeout = timeout
+        self._sock = None
+        self._local_dir = None
+
+        # The Unix socket is normally only open to root and the chrony
+        # group. Fall back to the loopback command port, which allows
+        # monitoring commands without authentication.
+        if os.path.exists(socket_path):
+            sock = None
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._bind_local(sock, os.stat(socket_path).st_gid)
+                sock.connect(socket_path)
+                self._sock = sock
+            except EnvironmentError:
+                if sock is not None:
+                    sock.close()
+                self._cleanup_local()
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.connect(('127.0.0.1', CHRONY_PORT))
+
+    ## chronyd runs as its own user and has to reply to our socket. The
+    ## socket goes in a private directory that others can only pass
+    ## through, and only the group of chronyd's socket may write to it.
+    ## Raises OSError if we can't give that group access.
+    def _bind_local(self, sock, gid):
+        self._local_dir = tempfile.mkdtemp(prefix = 'ntp_monitor.')
+        os.chmod(self._local_dir, 0711)
+        path = os.path.join(self._local_dir, 'chrony.sock')
+        sock.bind(path)
+        if os.stat(path).st_gid != gid:
+            os.chown(path, -1, gid)
+        os.chmod(path, 0660)
+
+    def _cleanup_local(self):
+        if self._local_dir:
+            shutil.rmtree(self._local_dir, ignore_errors = True)
+        self._local_dir = None
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        self._cleanup_local()
+
+    def request(self, command, data = ''):
+        seq = random.randint(0, 0xffffffff)
+        msg = _CHRONY_REQ_HDR.pack(_CHRONY_PROTO_VERSION, _CHRONY_PKT_REQUEST, 0, 0,
+                                   command, 0, seq, 0, 0) + data
+        reply_len = _CHRONY_RPY_HDR.size + _CHRONY_RPY_DATA_LEN.get(command, 0)
+        msg += '\0' * max(0, reply_len - len(msg))
+
+        try:
+            self._sock.send(msg)
+            while True:
+                ready, _, _ = select.select([ self._sock ], [], [], self._timeout)
+                if not ready:
+                    raise NTPDaemonError('Timeout waiting for chronyd')
+                reply = self._sock.recv(4096)
+                if len(reply) < _CHRONY_RPY_HDR.size:
+                    continue
+                hdr = _CHRONY_RPY_HDR.unpack_from(reply)
+                if hdr[1] != _CHRONY_PKT_REPLY or hdr[4] != command or hdr[10] != seq:
+                    continue
+                break
+        except socket.error, e:
+            raise NTPDaemonError('Unable to talk to chronyd: %s' % e)
+
+        if hdr[0] != _CHRONY_PROTO_VERSION:
+            raise NTPDaemonError('Unsupported chrony protocol version %d' % hdr[0])
+        if hdr[6] != _CHRONY_STT_SUCCESS:
+            raise NTPDaemonError('chronyd refused command %d, status %d' % (command, hdr[6]))
+        return reply[_CHRONY_RPY_HDR.size:]
+
+    ## Equivalent of 'chronyc tracking'
+    def tracking(self, status):
+        parse_chrony_tracking(self.request(_CHRONY_REQ_TRACKING), status)
+
+    ## Summary of 'chronyc sources'
+    def sources(self, status):
+        data = self.request(_CHRONY_REQ_N_SOURCES)
+        n = struct.unpack_from('!I', data, 0)[0]
+        reachable = 0
+        for i in range(n):
+            ip, state, reach = parse_chrony_source(
+                self.request(_CHRONY_REQ_SOURCE_DATA, struct.pack('!iI', i, 0)))
+            if reach:
+                reachable += 1
+            if state == _CHRONY_SD_SELECTED and ip:
+                status.selected_source = ip
+        status.num_sources = n
+        status.reachable_sources = reachable
+
+def query_chrony(socket_path = CHRONY_SOCKET, timeout = 1.0):
+    client = ChronyClient(socket_path, timeout)
+    try:
+        status = DaemonStatus()
+        status.daemon = 'chronyd'
+        client.tracking(status)
+        client.sources(status)
+        return status
+    finally:
+        client.close()
+
+# NTP mode 6 control messages, see RFC 1305 appendix B
+_NTPQ_HDR = struct.Struct('!BBHHHHH')
+_NTPQ_OP_READVAR = 2
+_NTPQ_RESPONSE = 0x80
+_NTPQ_ERROR = 0x40
+_NTPQ_MORE = 0x20
+
+def parse_ntpq_vars(text):
+    vals = {}
+    for item in text.replace('\r', '').replace('\n', '').split(','):
+        key, sep, val = item.strip().partition('=')
+        if sep:
+            vals[key.strip()] = val.strip().strip('"')
+    return vals
+
+##\brief Reads the system variables of the local ntpd ('ntpq -c rv')
+def query_ntpd(host = '127.0.0.1', port = 123, timeout = 1.0):
+    seq = random.randint(1, 0xffff)
+    # LI = 0, VN = 2, Mode = 6
+    req = _NTPQ_HDR.pack((2 << 3) | 6, _NTPQ_OP_READVAR, seq, 0, 0, 0, 0)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    fragments = {}
+    end = None # Length of the whole reply, once its last fragment is in
+    try:
+        sock.connect((host, port))
+        sock.send(req)
+        # Fragments can arrive in any order
+        while end is None or sum(len(f) for f in fragments.values()) < end:
+            ready, _, _ = select.select([ sock ], [], [], timeout)
+            if not ready:
+                raise NTPDaemonError('Timeout waiting for ntpd')
+            reply = sock.recv(4096)
+            if len(reply) < _NTPQ_HDR.size:
+                continue
+            vn_mode, op, rseq, stat, assoc, offset, count = _NTPQ_HDR.unpack_from(reply)
+            if rseq != seq or not op & _NTPQ_RESPONSE:
+                continue
+            if op & _NTPQ_ERROR:
+                raise NTPDaemonError('ntpd returned error %d' % (stat >> 8))
+            fragments[offset] = reply[_NTPQ_HDR.size:_NTPQ_HDR.size + count]
+            if not op & _NTPQ_MORE:
+                end = offset + count
+    except socket.error, e:
+        raise NTPDaemonError('Unable to talk to ntpd: %s' % e)
+    finally:
+        sock.close()
+
+    return ntpd_status(''.join(fragments[k] for k in sorted(fragments)))
+
+##\brief Converts the text of an ntpd READVAR reply to a DaemonStatus
+def ntpd_status(text):
+    vals = parse_ntpq_vars(text)
+
+    status = DaemonStatus()
+    status.daemon = 'ntpd'
+    try:
+        # ntpd reports times in milliseconds
+        status.offset = float(vals.get('offset', 0)) / 1000
+        status.jitter = float(vals.get('sys_jitter', vals.get('jitter', 0))) / 1000
+        status.root_delay = float(vals.get('rootdelay', 0)) / 1000
+        status.root_dispersion = float(vals.get('rootdisp', vals.get('rootdispersion', 0))) / 1000
+        status.stratum = int(vals.get('stratum', 16))
+        status.leap = int(vals.get('leap', 3), 2) if len(vals.get('leap', '')) == 2 \
+            else int(vals.get('leap', 3))
+        if 'frequency' in vals:
+            status.freq_ppm = float(vals['frequency'])
+    except ValueError:
+        raise NTPDaemonError('Unable to parse ntpd variables: %s' % text)
+    status.ref_id = vals.get('refid', '')
+    status.selected_source = status.ref_id
+    return status
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Offset, drift and stability checks of one NTP peer, for ntp_monitor
+
+import rospy
+import socket
+import threading
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from sntp import sntp_query, best_sample, SNTPError
+from clock_stats import OffsetHistory
+from ntp_daemon import query_chrony, query_ntpd, NTPDaemonError
+from clock import monotonic
+
+# Republish period of every status, so the aggregator never sees a peer
+# go stale while it is backing off
+REPUBLISH_PERIOD = 1.0
+
+# Averaging times reported for the Allan deviation (s)
+ALLAN_TAUS = [ 1, 10, 60 ]
+
+# Drift is only judged once the history spans this many samples
+MIN_DRIFT_SAMPLES = 30
+
+# 'sntp' queries the host over the network. The others ask the local
+# daemon for its own offset and generate no NTP traffic.
+BACKENDS = [ 'sntp', 'chrony', 'ntpd' ]
+
+##\brief True if host names this machine, which is the only host the
+## daemon backends can report on
+def is_local_host(host):
+    if host in ('localhost', socket.gethostname(), socket.getfqdn()):
+        return True
+    try:
+        addr = socket.gethostbyname(host)
+        if addr.startswith('127.'):
+            return True
+        return addr == socket.gethostbyname(socket.gethostname())
+    except socket.error:
+        return False
+
+##\brief Checks the offset to one NTP peer in its own thread
+##
+## Each peer has its own query deadline, update interval and backoff, so
+## an unreachable peer doesn't hold up the others.
+class NTPPeer(threading.Thread):
+    def __init__(self, pub, name, host, hardware_id, offset = 500, error_offset = 5000000,
+                 interval = 1.0, timeout = 1.0, samples = 3, max_backoff = 60.0,
+                 drift_window = 300, drift_tolerance = 5.0, backend = 'sntp'):
+        threading.Thread.__init__(self, name = 'ntp_peer_' + host)
+        self.daemon = True
+        self._pub = pub
+        self._mutex = threading.Lock()
+        self._stop = threading.Event()
+
+        self.host = host
+        self.offset = offset
+        self.error_offset = error_offset
+        self.interval = interval
+        self.timeout = timeout
+        self.samples = samples
+        self.max_backoff = max_backoff
+        self.drift_tolerance = drift_tolerance
+        if backend not in BACKENDS:
+            raise ValueError('Unknown NTP backend %s, must be one of %s' % (backend, BACKENDS))
+        # The daemon backends read the local daemon, whatever the host
+        if backend != 'sntp' and not is_local_host(host):
+            raise ValueError('NTP backend %s only reports on this host, not %s' % (backend, host))
+        self.backend = backend
+
+        self._failures = 0
+        self._history = OffsetHistory(drift_window)
+
+        self._stat = DiagnosticStatus()
+        self._stat.level = DiagnosticStatus.WARN
+        self._stat.name = name
+        self._stat.message = "No Data"
+        self._stat.hardware_id = hardware_id
+        self._stat.values = []
+
+    ## Delay before the next query: the peer's interval, doubled after each
+    ## consecutive failure up to max_backoff
+    def _next_delay(self):
+        if self._failures == 0:
+            return self.interval
+        return min(self.max_backoff, self.interval * 2 ** self._failures)
+
+    ## Queries the host directly with SNTP
+    ##\return (offset in seconds, diagnostic values, level, message)
+    def _query_sntp(self):
+        results = sntp_query(self.host, timeout = self.timeout, samples = self.samples)
+        sample = best_sample(results)
+        vals = [ KeyValue("Round Trip Delay (us)", str(sample.delay * 1000000)),
+                 KeyValue("Stratum", str(sample.stratum)),
+                 KeyValue("Reference ID", sample.ref_id),
+                 KeyValue("Samples", "%d/%d" % (len(results), self.samples)) ]
+        return sample.offset, vals, DiagnosticStatus.OK, "OK"
+
+    ## Asks the local chronyd or ntpd for the offset it already measured
+    def _query_daemon(self):
+        if self.backend == 'chrony':
+            ds = query_chrony(timeout = self.timeout)
+        else:
+            ds = query_ntpd(timeout = self.timeout)
+
+        vals = [ KeyValue("Backend", ds.daemon),
+                 KeyValue("Selected Source", ds.selected_source),
+                 KeyValue("Reference ID", ds.ref_id),
+                 KeyValue("Stratum", str(ds.stratum)),
+                 KeyValue("Leap Status", ds.leap_status),
+                 KeyValue("Root Delay (us)", str(ds.root_delay * 1000000)),
+                 KeyValue("Root Dispersion (us)", str(ds.root_dispersion * 1000000)) ]
+        if ds.system_time_offset is not None:
+            vals.append(KeyValue("System Time Offset (us)", str(ds.system_time_offset * 1000000)))
+        if ds.rms_offset is not None:
+            vals.append(KeyValue("RMS Offset (us)", str(ds.rms_offset * 1000000)))
+        if ds.jitter is not None:
+            vals.append(KeyValue("Daemon Jitter (us)", str(ds.jitter * 1000000)))
+        if ds.freq_ppm is not None:
+            vals.append(KeyValue("Daemon Frequency (ppm)", str(ds.freq_ppm)))
+        if ds.num_sources is not None:
+            vals.append(KeyValue("Sources", str(ds.num_sources)))
+            vals.append(KeyValue("Reachable Sources", str(ds.reachable_sources)))
+
+        if not ds.synchronised:
+            return ds.offset, vals, DiagnosticStatus.ERROR, "NTP Daemon Not Synchronised"
+        return ds.offset, vals, DiagnosticStatus.OK, "OK"
+
+    def check(self):
+        try:
+            if self.backend == 'sntp':
+                offset_s, vals, level, message = self._query_sntp()
+            else:
+                offset_s, vals, level, message = self._query_daemon()
+        except (SNTPError, NTPDaemonError, socket.error), e:
+            with self._mutex:
+                self._failures += 1
+                st = self._stat
+                st.level = DiagnosticStatus.ERROR
+                if self.backend == 'sntp':
+                    st.message = "Error Querying NTP Server"
+                else:
+                    st.message = "Error Querying NTP Daemon"
+                st.values = [ KeyValue("Offset (us)", "N/A"),
+                              KeyValue("Offset tolerance (us)", str(self.offset)),
+                              KeyValue("Offset tolerance (us) for Error", str(self.error_offset)),
+                              KeyValue("Errors", str(e)),
+                              KeyValue("Consecutive Failures", str(self._failures)),
+                              KeyValue("Retry In (s)", str(self._next_delay())) ]
+            return
+
+        measured_offset = offset_s * 1000000
+
+        self._history.add(monotonic(), offset_s)
+        drift_vals, drifting = self._drift_stats()
+
+        with self._mutex:
+            self._failures = 0
+            st = self._stat
+            st.level = DiagnosticStatus.OK
+            st.message = "OK"
+            st.values = [ KeyValue("Offset (us)", str(measured_offset)),
+                          KeyValue("Offset tolerance (us)", str(self.offset)),
+                          KeyValue("Offset tolerance (us) for Error", str(self.error_offset)) ]
+            st.values.extend(vals)
+            st.values.extend(drift_vals)
+
+            if drifting:
+                st.level = DiagnosticStatus.WARN
+                st.message = "NTP Offset Drifting"
+            if (abs(measured_offset) > self.offset):
+                st.level = DiagnosticStatus.WARN
+                st.message = "NTP Offset Too High"
+            if (abs(measured_offset) > self.error_offset):
+                st.level = DiagnosticStatus.ERROR
+                st.message = "NTP Offset Too High"
+            if level > st.level:
+                st.level = level
+                st.message = message
+
+    ## Frequency error, jitter and Allan deviation from the offset history
+    def _drift_stats(self):
+        vals = [ KeyValue("Offset History Samples", str(len(self._history))) ]
+        freq = self._history.frequency_ppm()
+        jitter = self._history.jitter()
+        if freq is not None:
+            vals.append(KeyValue("Frequency Error (ppm)", "%.3f" % freq))
+        if jitter is not None:
+            vals.append(KeyValue("Offset Jitter (us)", "%.1f" % (jitter * 1000000)))
+        for tau in ALLAN_TAUS:
+            adev = self._history.allan_deviation(tau)
+            if adev is not None:
+                vals.append(KeyValue("Allan Deviation tau=%.0fs" % adev[0], "%.3g" % adev[1]))
+        vals.append(KeyValue("Frequency Error tolerance (ppm)", str(self.drift_tolerance)))
+
+        drifting = freq is not None and len(self._history) >= MIN_DRIFT_SAMPLES and \
+            abs(freq) > self.drift_tolerance
+        return vals, drifting
+
+    def publish(self):
+        msg = DiagnosticArray()
+        msg.header.stamp = rospy.get_rostime()
+        with self._mutex:
+            msg.status = [ self._stat ]
+            self._pub.publish(msg)
+
+    def stop(self):
+        self._stop.set()
+
+    ## Queries are scheduled on the monotonic clock, so a step of the wall
+    ## clock can't stop them while the last status keeps being republished.
+    def run(self):
+        next_check = monotonic()
+        while not rospy.is_shutdown() and not self._stop.is_set():
+            if monotonic() >= next_check:
+                self.check()
+                with self._mutex:
+                    next_check = monotonic() + self._next_delay()
+
+            self.publish()
+            self._stop.wait(max(0.0, min(REPUBLISH_PERIOD, next_check - monotonic())))
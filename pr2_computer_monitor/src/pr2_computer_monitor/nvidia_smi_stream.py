@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Streams GPU status from one long-lived nvidia-smi query process
+
+from __future__ import with_statement, division
+
+import csv
+import os
+import subprocess
+import threading
+import time
+
+from pr2_msgs.msg import GPUStatus
+
+from clock import monotonic
+from nvidia_smi_util import MAX_FAN_RPM, _rpm_to_rads, GPUInfo, throttle_names
+
+# Fields asked of nvidia-smi --query-gpu, in output order
+QUERY_FIELDS = [ 'index', 'name', 'pci.device_id', 'pci.bus_id', 'display_mode', 'driver_version',
+                 'temperature.gpu', 'fan.speed', 'utilization.gpu', 'utilization.memory',
+                 'clocks.gr', 'clocks.max.gr', 'clocks.sm', 'clocks.max.sm', 'clocks.mem', 'clocks.max.mem',
+                 'power.draw', 'power.limit', 'clocks_throttle_reasons.active' ]
+
+# Fields asked of nvidia-smi --query-compute-apps, one row per process per GPU
+COMPUTE_APP_FIELDS = [ 'gpu_bus_id', 'pid', 'process_name', 'used_memory' ]
+
+# Columns of nvidia-smi pmon -s u, utilisation in percent of each process
+PMON_FIELDS = [ 'gpu', 'pid', 'type', 'sm', 'mem', 'enc', 'dec', 'command' ]
+
+# Query field prefixes of each clock in GPUInfo
+_CLOCK_FIELDS = [ ('Graphics', 'gr'), ('SM', 'sm'), ('Memory', 'mem') ]
+
+def _number(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        # '[Not Supported]', 'N/A'
+        return None
+
+##\brief Splits one line of --format=csv,noheader,nounits output
+##\return Dict of query field to string value, or None if the line doesn't match
+def parse_csv_line(line, fields = QUERY_FIELDS):
+    rows = list(csv.reader([ line.strip() ], skipinitialspace = True))
+    if not rows or len(rows[0]) != len(fields):
+        return None
+    return dict(zip(fields, [ v.strip() for v in rows[0] ]))
+
+def _text(val):
+    if val is None or val.startswith('[') or val == 'N/A':
+        return ''
+    return val
+
+def csv_to_gpu_status(row):
+    gpu_stat = GPUStatus()
+    gpu_stat.product_name   = _text(row.get('name'))
+    gpu_stat.pci_device_id  = _text(row.get('pci.device_id'))
+    gpu_stat.pci_location   = _text(row.get('pci.bus_id'))
+    gpu_stat.display        = _text(row.get('display_mode'))
+    gpu_stat.driver_version = _text(row.get('driver_version'))
+
+    temp = _number(row.get('temperature.gpu'))
+    if temp is not None:
+        gpu_stat.temperature = temp
+    fan = _number(row.get('fan.speed'))
+    if fan is not None:
+        gpu_stat.fan_speed = _rpm_to_rads(fan * 0.01 * MAX_FAN_RPM)
+    usage = _number(row.get('utilization.gpu'))
+    if usage is not None:
+        gpu_stat.gpu_usage = usage
+    mem = _number(row.get('utilization.memory'))
+    if mem is not None:
+        gpu_stat.memory_usage = mem
+    return gpu_stat
+
+def csv_to_gpu_info(row):
+    info = GPUInfo(csv_to_gpu_status(row))
+    index = _number(row.get('index'))
+    if index is not None:
+        info.index = int(index)
+
+    for name, field in _CLOCK_FIELDS:
+        clock = _number(row.get('clocks.' + field))
+        if clock is not None:
+            info.clocks[name] = clock
+        max_clock = _number(row.get('clocks.max.' + field))
+        if max_clock is not None:
+            info.max_clocks[name] = max_clock
+    info.power_draw = _number(row.get('power.draw'))
+    info.power_limit = _number(row.get('power.limit'))
+
+    # Bitmask printed in hex, '0x0000000000000004'
+    try:
+        info.throttle_mask = int(row.get('clocks_throttle_reasons.active'), 16)
+        info.throttle_reasons = throttle_names(info.throttle_mask)
+    except (TypeError, ValueError):
+        pass
+    return info
+
+##\brief Runs nvidia-smi in loop mode and keeps the latest row of each GPU
+##
+## One process replaces a fork of 'sudo nvidia-smi -a' per update; the
+## query mode doesn't need root. Lines are read on a background thread as
+## they arrive. If the process exits it's restarted, with the delay
+## doubling from min_backoff up to max_backoff while it keeps failing.
+##
+## query and key select other nvidia-smi queries, e.g. 'compute-apps'
+## keyed by GPU and pid. Loop mode prints nothing for a row that's gone, so
+## rows not updated for expire seconds are dropped if it's set.
+##
+## Drivers that don't support the query, or some of its fields, make
+## nvidia-smi exit straight away. If max_failed_starts is set, the stream
+## gives up after that many starts without a valid row, and unavailable()
+## tells the caller to use something else.
+class SmiStream(object):
+    def __init__(self, period = 1.0, command = 'nvidia-smi', fields = QUERY_FIELDS,
+                 min_backoff = 1.0, max_backoff = 60.0, query = 'gpu', key = ('index',),
+                 expire = None, max_failed_starts = None):
+        self.period = period
+        self.command = command
+        self.fields = fields
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.query = query
+        self.key = key
+        self.expire = expire
+        self.max_failed_starts = max_failed_starts
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._last_update = None
+        self._proc = None
+        self._running = False
+        self._thread = None
+        self._devnull = None
+        self._gave_up = False
+
+        self.restarts = 0
+        self.failed_starts = 0
+        self.bad_lines = 0
+        self.last_error = ''
+
+    def args(self):
+        return [ self.command, '--query-%s=%s' % (self.query, ','.join(self.fields)),
+                 '--format=csv,noheader,nounits', '-lms', str(int(self.period * 1000)) ]
+
+    ##\return Dict of field to value for one line of output, None if the
+    ## line doesn't parse, or an empty dict for a line without data
+    def parse_line(self, line):
+        return parse_csv_line(line, self.fields)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target = self._run, name = 'nvidia_smi_stream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            proc = self._proc
+        if proc is not None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        backoff = self.min_backoff
+        while self._running:
+            got_data = self._run_once()
+            if not self._running:
+                break
+            with self._lock:
+                if got_data:
+                    self.failed_starts = 0
+                else:
+                    self.failed_starts += 1
+                if self.max_failed_starts and self._last_update is None and \
+                        self.failed_starts >= self.max_failed_starts:
+                    self._gave_up = True
+                    break
+                self.restarts += 1
+            if got_data:
+                backoff = self.min_backoff
+            # Sleep in small steps so stop() doesn't wait for the backoff
+            deadline = monotonic() + backoff
+            while self._running and monotonic() < deadline:
+                time.sleep(min(0.1, deadline - monotonic()))
+            backoff = min(self.max_backoff, backoff * 2)
+
+    ##\return True if the process produced any valid rows
+    def _run_once(self):
+        if self._devnull is None:
+            self._devnull = open(os.devnull, 'w')
+        try:
+            proc = subprocess.Popen(self.args(), stdout = subprocess.PIPE,
+                                    stderr = self._devnull, close_fds = True)
+        except OSError, e:
+            with self._lock:
+                self.last_error = 'Unable to run %s: %s' % (self.command, e)
+            return False
+
+        with self._lock:
+            self._proc = proc
+
+        got_data = False
+        # readline, not iteration, which reads ahead and delays lines
+        for line in iter(proc.stdout.readline, ''):
+            if line.startswith('#'): # Column headings
+                continue
+            row = self.parse_line(line)
+            with self._lock:
+                if row is None:
+                    self.bad_lines += 1
+                    continue
+                if not row: # Nothing to report, e.g. an idle GPU in pmon
+                    continue
+                self._last_update = monotonic()
+                self._rows[tuple(row.get(k, '0') for k in self.key)] = (row, self._last_update)
+                got_data = True
+
+        proc.wait()
+        with self._lock:
+            self._proc = None
+            if self._running:
+                self.last_error = '%s exited with code %s' % (self.command, proc.returncode)
+        return got_data
+
+    ##\return True if the stream gave up without ever getting a valid row
+    def unavailable(self):
+        with self._lock:
+            return self._gave_up
+
+    ##\return Latest rows, one dict per key, in key order
+    def rows(self):
+        with self._lock:
+            if self.expire is not None:
+                now = monotonic()
+                for k in [ k for k, (row, t) in self._rows.iteritems() if now - t > self.expire ]:
+                    del self._rows[k]
+            order = lambda k: tuple(_number(v) if _number(v) is not None else v for v in k)
+            return [ self._rows[k][0] for k in sorted(self._rows, key = order) ]
+
+    ##\return Seconds since the last valid row, or None if there hasn't been one
+    def age(self):
+        with self._lock:
+            if self._last_update is None:
+                return None
+            return monotonic() - self._last_update
+
+##\brief Streams per process utilisation from nvidia-smi pmon
+##
+## Rows are keyed by GPU index and pid. pmon prints a row of '-' for an
+## idle GPU, which is skipped, and nothing for a process that's gone, so
+## rows expire like those of the compute-apps query. pmon only takes whole
+## seconds between samples. Drivers before pmon existed make it exit, see
+## max_failed_starts.
+class PmonStream(SmiStream):
+    def __init__(self, period = 1.0, command = 'nvidia-smi', **kwargs):
+        kwargs.setdefault('key', ('gpu', 'pid'))
+        kwargs.setdefault('expire', 5 * max(1, int(round(period))))
+        SmiStream.__init__(self, period, command, PMON_FIELDS, query = 'pmon', **kwargs)
+
+    def args(self):
+        return [ self.command, 'pmon', '-s', 'u', '-d', str(max(1, int(round(self.period)))) ]
+
+    def parse_line(self, line):
+        vals = line.split()
+        if len(vals) != len(self.fields):
+            return None
+        if vals[1] == '-':
+            return {}
+        return dict(zip(self.fields, vals))
@@ -46,6 +46,8 @@ from pr2_msgs.msg import GPUStatus
 
 import subprocess
 import math
+import re
+from collections import OrderedDict
 
 MAX_FAN_RPM = 4500
 
@@ -101,56 +103,210 @@ def gpu_status_to_diag(gpu_stat):
     return stat
 
 
-def _find_val(output, word):
-    lines = output.split('\n')
-    for line in lines:
-        tple = line.split(':')
-        if not len(tple) > 1:
+_LEAF_RE = re.compile(r'^(.*?)\s*:\s+(.*)$')
+
+##\brief Parses 'nvidia-smi -a' output in one pass into nested sections
+##
+## Lines of the form 'Key : Value' are leaves. Any other line opens a
+## section holding the lines indented below it.
+##\return OrderedDict of key to value string or section
+def parse_smi_tree(output):
+    root = OrderedDict()
+    stack = [ (-1, root) ]
+    for line in output.splitlines():
+        line = line.expandtabs(8).rstrip()
+        text = line.strip()
+        if not text or text.startswith('='):
             continue
+        indent = len(line) - len(line.lstrip())
+        while stack[-1][0] >= indent:
+            stack.pop()
+        node = stack[-1][1]
 
-        name = tple[0].strip()
-        val = ':'.join(tple[1:]).strip()
+        m = _LEAF_RE.match(text)
+        if m:
+            node[m.group(1).strip()] = m.group(2).strip()
+        else:
+            section = OrderedDict()
+            node[text.rstrip(':').strip()] = section
+            stack.append((indent, section))
+    return root
 
-        if not name.lower() == word.lower():
-            continue
-        
-        return val.strip()
+def _get(node, *paths):
+    for path in paths:
+        if isinstance(path, basestring):
+            path = (path,)
+        val = node
+        for key in path:
+            if not isinstance(val, dict):
+                val = None
+                break
+            # Capitalization varies between driver versions
+            val = val.get(key, val.get(key.lower(), val.get(key.title())))
+            if val is None:
+                break
+        if val is not None and not isinstance(val, dict):
+            return val
+    return None
 
-    return ''
+def _leading_number(val):
+    if val is None:
+        return None
+    m = re.match(r'\s*(-?[0-9.]+)', val)
+    if not m:
+        return None
+    try:
+        return float(m.group(1))
+    except ValueError:
+        return None
 
-def parse_smi_output(output):
-    gpu_stat = GPUStatus()
-
-    
-    gpu_stat.product_name   = _find_val(output, 'Product Name')
-    gpu_stat.pci_device_id  = _find_val(output, 'PCI Device/Vendor ID')
-    gpu_stat.pci_location   = _find_val(output, 'PCI Location ID')
-    gpu_stat.display        = _find_val(output, 'Display')
-    gpu_stat.driver_version = _find_val(output, 'Driver Version')
-    
-    temp_str = _find_val(output, 'Temperature')
-    if temp_str:
-        temp, units = temp_str.split()
+##\brief Status of one GPU, with fields that don't fit in GPUStatus
+##
+## Numbers that the driver doesn't report are None. Power is in W, clocks
+## in MHz and memory in MiB.
+class GPUInfo(object):
+    def __init__(self, status = None):
+        self.status = status or GPUStatus()
+        self.index = 0
+        self.power_draw = None
+        self.power_limit = None
+        self.clocks = {}
+        self.max_clocks = {}
+        self.throttle_reasons = []
+        self.throttle_mask = None
+        self.ecc_errors = None
+        self.memory_used = None
+        self.memory_total = None
+
+CLOCK_NAMES = [ 'Graphics', 'SM', 'Memory' ]
+
+# Clocks throttle reason bits, as in NVML and clocks_throttle_reasons.active
+THROTTLE_REASONS = [ (0x001, 'Idle'),
+                     (0x002, 'Applications Clocks Setting'),
+                     (0x004, 'SW Power Cap'),
+                     (0x008, 'HW Slowdown'),
+                     (0x010, 'Sync Boost'),
+                     (0x020, 'SW Thermal Slowdown'),
+                     (0x040, 'HW Thermal Slowdown'),
+                     (0x080, 'HW Power Brake Slowdown'),
+                     (0x100, 'Display Clock Setting') ]
+THROTTLE_IDLE = 0x001
+THROTTLE_POWER = 0x004 | 0x080
+# HW Slowdown is thermal or power brake; drivers before HW Thermal Slowdown
+# existed only report this bit for an overheating GPU
+THROTTLE_THERMAL = 0x008 | 0x020 | 0x040
+
+def throttle_names(mask):
+    return [ name for bit, name in THROTTLE_REASONS if mask & bit and bit != THROTTLE_IDLE ]
+
+def throttle_mask(names):
+    mask = 0
+    for bit, name in THROTTLE_REASONS:
+        if name in names:
+            mask |= bit
+    return mask
+
+def _gpu_from_section(section, driver_version, index):
+    info = GPUInfo()
+    info.index = index
+    gpu_stat = info.status
+
+    gpu_stat.product_name   = _get(section, 'Product Name') or ''
+    gpu_stat.pci_device_id  = _get(section, 'PCI Device/Vendor ID', ('PCI', 'Device Id')) or ''
+    gpu_stat.pci_location   = _get(section, 'PCI Location ID', ('PCI', 'Bus Id')) or ''
+    gpu_stat.display        = _get(section, 'Display', 'Display Active', 'Display Mode') or ''
+    gpu_stat.driver_version = driver_version
+
+    temp = _leading_number(_get(section, 'Temperature', ('Temperature', 'GPU Current Temp'), ('Temperature', 'Gpu')))
+    if temp is not None:
         gpu_stat.temperature = int(temp)
 
-    fan_str = _find_val(output, 'Fan Speed')
-    if fan_str:
-        # Fan speed in RPM
-        fan_spd = float(fan_str.strip('\%').strip()) * 0.01 * MAX_FAN_RPM
-        # Convert fan speed to Hz
-        gpu_stat.fan_speed = _rpm_to_rads(fan_spd)
+    fan = _leading_number(_get(section, 'Fan Speed'))
+    if fan is not None:
+        # Fan speed in RPM, converted to rad/s
+        gpu_stat.fan_speed = _rpm_to_rads(fan * 0.01 * MAX_FAN_RPM)
 
-    usage_str = _find_val(output, 'GPU')
-    if usage_str:
-        usage = usage_str.strip('\%').strip()
+    usage = _leading_number(_get(section, ('Utilization', 'GPU')))
+    if usage is not None:
         gpu_stat.gpu_usage = int(usage)
-        
-    mem_str = _find_val(output, 'Memory')
-    if mem_str:
-        mem = mem_str.strip('\%').strip()
+    mem = _leading_number(_get(section, ('Utilization', 'Memory')))
+    if mem is not None:
         gpu_stat.memory_usage = int(mem)
 
-    return gpu_stat
+    info.power_draw = _leading_number(_get(section, ('Power Readings', 'Power Draw')))
+    info.power_limit = _leading_number(_get(section, ('Power Readings', 'Enforced Power Limit'),
+                                            ('Power Readings', 'Power Limit')))
+    for name in CLOCK_NAMES:
+        clock = _leading_number(_get(section, ('Clocks', name)))
+        if clock is not None:
+            info.clocks[name] = clock
+        max_clock = _leading_number(_get(section, ('Max Clocks', name)))
+        if max_clock is not None:
+            info.max_clocks[name] = max_clock
+
+    reasons = section.get('Clocks Throttle Reasons', section.get('Clocks Event Reasons'))
+    if isinstance(reasons, dict):
+        info.throttle_reasons = [ name for name, val in reasons.iteritems()
+                                  if val == 'Active' and name != 'Idle' ]
+        info.throttle_mask = throttle_mask(info.throttle_reasons)
+
+    info.ecc_errors = _leading_number(_get(section, ('ECC Errors', 'Volatile', 'Double Bit', 'Total'),
+                                           ('ECC Errors', 'Volatile', 'DRAM Uncorrectable'),
+                                           ('Ecc Errors', 'Volatile', 'Double Bit', 'Total')))
+    info.memory_used = _leading_number(_get(section, ('FB Memory Usage', 'Used')))
+    info.memory_total = _leading_number(_get(section, ('FB Memory Usage', 'Total')))
+    return info
+
+##\brief Every GPU in 'nvidia-smi -a' output
+##\return List of GPUInfo, in output order
+def parse_smi_gpus(output):
+    tree = parse_smi_tree(output)
+    driver_version = _get(tree, 'Driver Version') or ''
+    gpus = []
+    for name, section in tree.iteritems():
+        if name.startswith('GPU ') and isinstance(section, dict):
+            gpus.append(_gpu_from_section(section, driver_version, len(gpus)))
+    return gpus
+
+##\brief Status of the first GPU in 'nvidia-smi -a' output, or an empty
+## GPUStatus if there's none
+def parse_smi_output(output):
+    gpus = parse_smi_gpus(output)
+    if not gpus:
+        return GPUStatus()
+    return gpus[0].status
+
+##\brief Diagnostic for one GPU, with the fields beyond GPUStatus
+##\param name Status name, defaults to 'GPU Status'
+def gpu_info_to_diag(info, name = None):
+    stat = gpu_status_to_diag(info.status)
+    if name:
+        stat.name = name
+
+    if info.power_draw is not None:
+        stat.values.append(KeyValue(key='Power Draw (W)', value = '%.1f' % info.power_draw))
+    if info.power_limit is not None:
+        stat.values.append(KeyValue(key='Power Limit (W)', value = '%.1f' % info.power_limit))
+        if info.power_draw is not None and info.power_limit > 0:
+            stat.values.append(KeyValue(key='Power Draw (% of Limit)', value = '%.0f' % (100 * info.power_draw / info.power_limit)))
+    for clock in CLOCK_NAMES:
+        if clock in info.clocks:
+            stat.values.append(KeyValue(key='%s Clock (MHz)' % clock, value = '%.0f' % info.clocks[clock]))
+        if clock in info.max_clocks:
+            stat.values.append(KeyValue(key='Max %s Clock (MHz)' % clock, value = '%.0f' % info.max_clocks[clock]))
+            if clock in info.clocks and info.max_clocks[clock] > 0:
+                stat.values.append(KeyValue(key='%s Clock (%% of Max)' % clock,
+                                            value = '%.0f' % (100 * info.clocks[clock] / info.max_clocks[clock])))
+    if info.memory_total is not None:
+        stat.values.append(KeyValue(key='Memory Used (MiB)', value = '%.0f / %.0f' % (info.memory_used or 0, info.memory_total)))
+    if info.throttle_reasons:
+        stat.values.append(KeyValue(key='Throttle Reasons', value = ', '.join(info.throttle_reasons)))
+    if info.ecc_errors is not None:
+        stat.values.append(KeyValue(key='Uncorrectable ECC Errors', value = '%.0f' % info.ecc_errors))
+        if info.ecc_errors > 0:
+            stat.level = max(stat.level, DiagnosticStatus.ERROR)
+            stat.message = 'ECC Errors'
+    return stat
         
 def get_gpu_status():
     p = subprocess.Popen('sudo nvidia-smi -a', stdout = subprocess.PIPE, 
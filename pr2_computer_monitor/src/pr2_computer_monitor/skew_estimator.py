@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Passive clock offset and skew estimation from message timestamps
+
+from __future__ import division
+
+import collections
+
+##\brief Lower envelope estimate of the clock relation to one remote host
+##
+## Each sample is the difference between the local receive time and the
+## remote send stamp of a message, which is the one-way delay plus the clock
+## offset. Queueing only ever adds delay, so the minimum in each bin is the
+## sample closest to the true offset plus the minimum delay. The lower convex
+## hull of those minima gives the skew (as its slope) and the current
+## offset plus minimum delay (as its value at the newest bin).
+##
+## Bins are keyed on the local monotonic clock so a local clock step moves
+## the offsets, not the bins.
+class SkewEstimator(object):
+    def __init__(self, window = 60.0, bin_size = 1.0):
+        self.window = window
+        self.bin_size = bin_size
+        # Each entry is [ bin index, monotonic time of minimum, minimum ]
+        self._bins = collections.deque()
+        self.samples = 0
+        self.last_receive = None
+
+    ##\param sent Remote send stamp (s)
+    ##\param received Local wall clock receive time (s)
+    ##\param mono Local monotonic receive time (s)
+    def add(self, sent, received, mono):
+        d = received - sent
+        idx = int(mono // self.bin_size)
+        self.samples += 1
+        self.last_receive = mono
+
+        if self._bins and self._bins[-1][0] == idx:
+            if d < self._bins[-1][2]:
+                self._bins[-1][1] = mono
+                self._bins[-1][2] = d
+        else:
+            self._bins.append([ idx, mono, d ])
+
+        oldest = idx - int(self.window // self.bin_size)
+        while self._bins and self._bins[0][0] <= oldest:
+            self._bins.popleft()
+
+    def clear(self):
+        self._bins.clear()
+        self.samples = 0
+        self.last_receive = None
+
+    def num_bins(self):
+        return len(self._bins)
+
+    ##\brief Smallest delay seen in the window, no skew correction
+    def min_delay(self):
+        if not self._bins:
+            return None
+        return min(b[2] for b in self._bins)
+
+    ## Lower convex hull of the bin minima, by Andrew's monotone chain
+    def _lower_hull(self):
+        hull = []
+        for b in self._bins:
+            p = (b[1], b[2])
+            while len(hull) >= 2:
+                (x1, y1), (x2, y2) = hull[-2], hull[-1]
+                if (x2 - x1) * (p[1] - y1) - (y2 - y1) * (p[0] - x1) > 0:
+                    break
+                hull.pop()
+            hull.append(p)
+        return hull
+
+    ##\brief Line under all bin minima that is closest to them on average
+    ##
+    ## That line is the hull edge spanning the mean sample time.
+    ##\return (slope, intercept at the mean time, mean time), None with
+    ## fewer than three bins
+    def envelope(self):
+        if len(self._bins) < 3:
+            return None
+        hull = self._lower_hull()
+        mean_t = sum(b[1] for b in self._bins) / len(self._bins)
+        for (x1, y1), (x2, y2) in zip(hull[:-1], hull[1:]):
+            if x1 <= mean_t <= x2:
+                if x2 == x1:
+                    return None
+                slope = (y2 - y1) / (x2 - x1)
+                return slope, y1 + slope * (mean_t - x1), mean_t
+        return None
+
+    ##\brief Rate of change of the remote clock relative to the local clock
+    ##\return Parts per million, positive when the local clock is gaining
+    def skew_ppm(self):
+        env = self.envelope()
+        if env is None:
+            return None
+        return env[0] * 1e6
+
+    ##\brief Offset plus minimum one-way delay at the newest sample
+    ##
+    ## Negative values can only come from the remote clock being ahead.
+    def apparent_delay(self):
+        env = self.envelope()
+        if env is None:
+            return self.min_delay()
+        slope, value, mean_t = env
+        return value + slope * (self._bins[-1][1] - mean_t)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Minimal SNTP client (RFC 4330) used by ntp_monitor
+
+from __future__ import division
+
+import socket
+import struct
+import select
+import time
+
+from clock import monotonic
+
+NTP_PORT = 123
+NTP_EPOCH_OFFSET = 2208988800 # Seconds from 1900-01-01 to 1970-01-01
+
+MODE_CLIENT = 3
+MODE_SERVER = 4
+MODE_BROADCAST = 5
+LEAP_ALARM = 3
+
+_PACKET = struct.Struct('!BBbbiI4sIIIIIIII')
+
+class SNTPError(Exception):
+    pass
+
+# Reply that doesn't belong to the outstanding request
+class _StrayResponse(SNTPError):
+    pass
+
+def to_ntp_time(t):
+    t += NTP_EPOCH_OFFSET
+    secs = int(t)
+    return secs, int((t - secs) * 2**32) & 0xffffffff
+
+def from_ntp_time(secs, frac):
+    return secs - NTP_EPOCH_OFFSET + frac / 2**32
+
+##\brief Result of one SNTP sample, times in seconds
+class SNTPSample(object):
+    def __init__(self, offset, delay, stratum, leap, ref_id):
+        self.offset = offset
+        self.delay = delay
+        self.stratum = stratum
+        self.leap = leap
+        self.ref_id = ref_id
+
+def make_request(transmit_time):
+    secs, frac = to_ntp_time(transmit_time)
+    # LI = 0, VN = 4, Mode = client
+    return _PACKET.pack((4 << 3) | MODE_CLIENT, 0, 0, 0, 0, 0, '\0' * 4,
+                        0, 0, 0, 0, 0, 0, secs, frac)
+
+##\brief Checks a server reply against our request and computes offset/delay
+##
+## t1 and t4 are the client transmit and receive times. Per RFC 4330:
+## offset = ((t2 - t1) + (t3 - t4)) / 2, delay = (t4 - t1) - (t3 - t2).
+def parse_response(data, t1, t4, request_secs, request_frac):
+    if len(data) < _PACKET.size:
+        raise SNTPError('Short NTP response (%d bytes)' % len(data))
+
+    fields = _PACKET.unpack_from(data)
+    li_vn_mode, stratum = fields[0], fields[1]
+    leap = li_vn_mode >> 6
+    mode = li_vn_mode & 0x7
+    ref_id = fields[6]
+    orig_secs, orig_frac = fields[9], fields[10]
+    recv_secs, recv_frac = fields[11], fields[12]
+    tx_secs, tx_frac = fields[13], fields[14]
+
+    if mode not in (MODE_SERVER, MODE_BROADCAST):
+        raise SNTPError('Unexpected NTP mode %d' % mode)
+    if (orig_secs, orig_frac) != (request_secs, request_frac):
+        raise _StrayResponse('NTP response does not match request')
+    if stratum == 0:
+        raise SNTPError('Kiss-o\'-death from NTP server: %s' % ref_id.strip('\0'))
+    if leap == LEAP_ALARM:
+        raise SNTPError('NTP server is not synchronized')
+    if tx_secs == 0 and tx_frac == 0:
+        raise SNTPError('NTP response has no transmit timestamp')
+
+    t2 = from_ntp_time(recv_secs, recv_frac)
+    t3 = from_ntp_time(tx_secs, tx_frac)
+
+    offset = ((t2 - t1) + (t3 - t4)) / 2
+    delay = (t4 - t1) - (t3 - t2)
+
+    if stratum == 1:
+        ref_id = ref_id.strip('\0')
+    else:
+        ref_id = socket.inet_ntoa(ref_id)
+    return SNTPSample(offset, delay, stratum, leap, ref_id)
+
+##\brief Queries an NTP server for one or more samples
+##
+## Wall clock time is read once, and the send/receive times of every sample
+## are derived from the monotonic clock, so a clock step in the middle of
+## a query can't corrupt the result.
+##\return List of SNTPSample, one per answered request. Raises SNTPError
+## or socket.error if no sample could be taken.
+def sntp_query(host, port = NTP_PORT, timeout = 1.0, samples = 1):
+    addr = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_DGRAM)[0]
+    sock = socket.socket(addr[0], socket.SOCK_DGRAM)
+    results = []
+    last_error = None
+    try:
+        wall_base = time.time()
+        mono_base = monotonic()
+        for i in range(samples):
+            mono_t1 = monotonic()
+            t1 = wall_base + (mono_t1 - mono_base)
+            secs, frac = to_ntp_time(t1)
+            sock.sendto(make_request(t1), addr[4])
+
+            deadline = mono_t1 + timeout
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    last_error = SNTPError('Timeout waiting for NTP response from %s' % host)
+                    break
+                ready, _, _ = select.select([ sock ], [], [], remaining)
+                if not ready:
+                    continue
+                data, src = sock.recvfrom(512)
+                mono_t4 = monotonic()
+                try:
+                    sample = parse_response(data, t1, t1 + (mono_t4 - mono_t1), secs, frac)
+                except _StrayResponse, e:
+                    # Late reply to an earlier sample, keep waiting
+                    last_error = e
+                    continue
+                except SNTPError, e:
+                    last_error = e
+                    break
+                results.append(sample)
+                break
+    finally:
+        sock.close()
+
+    if not results:
+        raise last_error or SNTPError('No NTP samples taken from %s' % host)
+    return results
+
+##\brief Picks the sample with the lowest round trip delay, which has the
+## least uncertainty in its offset
+def best_sample(samples):
+    return min(samples, key = lambda s: s.delay)
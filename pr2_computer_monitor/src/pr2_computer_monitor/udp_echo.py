@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief UDP echo responder and round trip latency prober
+
+from __future__ import with_statement, division
+
+import random
+import select
+import socket
+import struct
+import threading
+from collections import deque
+
+from clock import monotonic
+from write_latency import LatencyHistogram
+
+ECHO_PORT = 7031
+MAGIC = 'PEP1'
+# Magic, prober id, sequence number, monotonic send time
+_HEADER = struct.Struct('!4sIId')
+
+##\brief Sends every datagram it receives straight back to the sender
+class EchoResponder(threading.Thread):
+    def __init__(self, port = ECHO_PORT, host = ''):
+        threading.Thread.__init__(self, name = 'udp_echo_responder')
+        self.daemon = True
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self.port = self._sock.getsockname()[1]
+        self.echoed = 0
+        # Set to drop some requests, for testing
+        self.drop = lambda data: False
+        self._running = True
+
+    def stop(self):
+        self._running = False
+        self.join()
+        self._sock.close()
+
+    def run(self):
+        while self._running:
+            ready, _, _ = select.select([ self._sock ], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data, addr = self._sock.recvfrom(65536)
+                if data[:len(MAGIC)] != MAGIC or self.drop(data):
+                    continue
+                self._sock.sendto(data, addr)
+                self.echoed += 1
+            except socket.error:
+                pass
+
+##\brief Round trip statistics of one target
+class EchoStats(object):
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.loss_percent = None
+        self.p50 = None
+        self.p95 = None
+        self.p99 = None
+        self.max = None
+        self.last_reply_age = None
+
+##\brief Sends small timestamped datagrams to an echo responder at a fixed
+## rate, and keeps an RTT histogram and loss count
+##
+## The send time travels in the packet and is compared with the monotonic
+## clock on return, so clock offsets between hosts don't matter. A packet
+## not back within the timeout is lost; if it turns up later it is counted
+## as late, not received.
+class EchoProber(threading.Thread):
+    def __init__(self, host, port = ECHO_PORT, rate = 10.0, timeout = 1.0, size = 64, window = 600):
+        threading.Thread.__init__(self, name = 'udp_echo_prober_' + host)
+        self.daemon = True
+        self.host = host
+        self.port = port
+        self.period = 1.0 / rate
+        self.timeout = timeout
+        self.size = max(size, _HEADER.size)
+
+        self._id = random.getrandbits(32)
+        self._seq = 0
+        self._outstanding = {}
+        self._hist = LatencyHistogram(window)
+        self._results = deque(maxlen = window) # 1 for lost, 0 for received
+        self._last_reply = None
+        self._stats = EchoStats()
+        self._lock = threading.Lock()
+        self._running = True
+        self._sock = None
+
+    def stop(self):
+        self._running = False
+        if self.is_alive():
+            self.join()
+
+    def _send(self, now):
+        self._seq = (self._seq + 1) & 0xffffffff
+        data = _HEADER.pack(MAGIC, self._id, self._seq, now)
+        data += '\0' * (self.size - len(data))
+        try:
+            self._sock.sendto(data, (self.host, self.port))
+        except socket.error:
+            pass # Counted as lost when it times out
+        self._outstanding[self._seq] = now
+        with self._lock:
+            self._stats.sent += 1
+
+    def _receive(self, data, now):
+        if len(data) < _HEADER.size:
+            return
+        magic, prober_id, seq, sent = _HEADER.unpack_from(data)
+        if magic != MAGIC or prober_id != self._id:
+            return
+        with self._lock:
+            if self._outstanding.pop(seq, None) is None:
+                self._stats.late += 1
+                return
+            self._hist.add(now - sent)
+            self._results.append(0)
+            self._stats.received += 1
+            self._last_reply = now
+
+    def _expire(self, now):
+        expired = [ seq for seq, sent in self._outstanding.iteritems() if now - sent > self.timeout ]
+        with self._lock:
+            for seq in expired:
+                del self._outstanding[seq]
+                self._results.append(1)
+                self._stats.lost += 1
+
+    def run(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            next_send = monotonic()
+            while self._running:
+                now = monotonic()
+                if now >= next_send:
+                    self._send(now)
+                    next_send += self.period
+                    if next_send < now:
+                        next_send = now + self.period
+                self._expire(now)
+
+                ready, _, _ = select.select([ self._sock ], [], [], max(0.0, next_send - monotonic()))
+                if ready:
+                    try:
+                        data, addr = self._sock.recvfrom(65536)
+                    except socket.error:
+                        continue
+                    self._receive(data, monotonic())
+        finally:
+            self._sock.close()
+
+    ##\return EchoStats, with RTTs in seconds over the window
+    def get_stats(self):
+        with self._lock:
+            s = self._stats
+            stats = EchoStats()
+            stats.sent, stats.received, stats.lost, stats.late = s.sent, s.received, s.lost, s.late
+            if self._results:
+                stats.loss_percent = 100 * sum(self._results) / len(self._results)
+            if len(self._hist):
+                stats.p50 = self._hist.percentile(50)
+                stats.p95 = self._hist.percentile(95)
+                stats.p99 = self._hist.percentile(99)
+                stats.max = self._hist.max()
+            if self._last_reply is not None:
+                stats.last_reply_age = monotonic() - self._last_reply
+            return stats
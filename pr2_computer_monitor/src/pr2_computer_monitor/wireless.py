@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+##\brief Reads the local wireless link state from /proc/net/wireless and
+## nl80211, without forking iw or iwconfig
+
+from __future__ import with_statement, division
+
+import os
+import socket
+import struct
+
+# Generic netlink, see linux/netlink.h and linux/genetlink.h
+NETLINK_GENERIC = 16
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLA_TYPE_MASK = 0x3fff
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# nl80211, see linux/nl80211.h
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_STATION = 17
+NL80211_CMD_GET_SURVEY = 50
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_SSID = 52
+NL80211_ATTR_SURVEY_INFO = 84
+NL80211_ATTR_WIPHY_TX_POWER_LEVEL = 98
+
+NL80211_STA_INFO_SIGNAL = 7
+NL80211_STA_INFO_TX_BITRATE = 8
+NL80211_STA_INFO_TX_PACKETS = 10
+NL80211_STA_INFO_TX_RETRIES = 11
+NL80211_STA_INFO_TX_FAILED = 12
+NL80211_STA_INFO_BEACON_LOSS = 18
+
+NL80211_RATE_INFO_BITRATE = 1
+NL80211_RATE_INFO_BITRATE32 = 5
+
+NL80211_SURVEY_INFO_FREQUENCY = 1
+NL80211_SURVEY_INFO_NOISE = 2
+NL80211_SURVEY_INFO_IN_USE = 3
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_GENLMSGHDR = struct.Struct('=BBH')
+_NLATTR = struct.Struct('=HH')
+
+class WirelessError(Exception):
+    pass
+
+def _align(n):
+    return (n + 3) & ~3
+
+def pack_attr(attr_type, payload):
+    return _NLATTR.pack(_NLATTR.size + len(payload), attr_type) + \
+        payload + '\0' * (_align(len(payload)) - len(payload))
+
+##\brief Parses a run of netlink attributes
+##\return Dict of attribute type to raw payload
+def parse_attrs(data, offset = 0):
+    attrs = {}
+    while offset + _NLATTR.size <= len(data):
+        length, attr_type = _NLATTR.unpack_from(data, offset)
+        if length < _NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + _NLATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+def _u8s(data):
+    return struct.unpack('=b', data[:1])[0]
+
+def _u16(data):
+    return struct.unpack('=H', data[:2])[0]
+
+def _u32(data):
+    return struct.unpack('=I', data[:4])[0]
+
+def _mac(data):
+    return ':'.join('%02x' % ord(c) for c in data[:6])
+
+def freq_to_channel(freq):
+    if freq == 2484:
+        return 14
+    if 2412 <= freq < 2484:
+        return (freq - 2407) // 5
+    if 5000 <= freq < 6000:
+        return (freq - 5000) // 5
+    return 0
+
+def if_nametoindex(interface):
+    try:
+        with open('/sys/class/net/%s/ifindex' % interface) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        raise WirelessError('No network interface %s' % interface)
+
+##\brief Link quality, signal and noise of one interface in /proc/net/wireless
+##\return Dict with 'quality', 'signal' and 'noise' (None if the driver
+## doesn't report it), or None if the interface isn't listed
+def parse_proc_wireless(text, interface):
+    for line in text.splitlines():
+        if ':' not in line:
+            continue
+        name, rest = line.split(':', 1)
+        if name.strip() != interface:
+            continue
+        fields = rest.split()
+        if len(fields) < 4:
+            return None
+        link, level, noise = [ float(f.rstrip('.')) for f in fields[1:4] ]
+        # Old style unsigned dBm
+        if level > 0 and level != 256:
+            level -= 256
+        return { 'quality': link,
+                 'signal': level,
+                 'noise': None if noise in (-256, 0, 256) else noise }
+    return None
+
+##\brief Minimal generic netlink client for nl80211 queries
+class NL80211(object):
+    def __init__(self, timeout = 1.0):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._sock.settimeout(timeout)
+        self._sock.bind((0, 0))
+        self._seq = 0
+        self.family = self._resolve_family('nl80211')
+
+    def close(self):
+        self._sock.close()
+
+    ##\brief Sends one request
+    ##\return List of (genl cmd, attribute dict) replies
+    def _request(self, family, cmd, attrs = '', flags = 0):
+        self._seq += 1
+        seq = self._seq
+        payload = _GENLMSGHDR.pack(cmd, 1, 0) + attrs
+        self._sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(payload), family,
+                                       NLM_F_REQUEST | NLM_F_ACK | flags, seq, 0) + payload)
+
+        replies = []
+        try:
+            while True:
+                data = self._sock.recv(65536)
+                offset = 0
+                while offset + _NLMSGHDR.size <= len(data):
+                    length, msg_type, msg_flags, msg_seq, pid = _NLMSGHDR.unpack_from(data, offset)
+                    if length < _NLMSGHDR.size:
+                        break
+                    body = data[offset + _NLMSGHDR.size:offset + length]
+                    offset += _align(length)
+                    if msg_seq != seq:
+                        continue
+                    if msg_type == NLMSG_DONE:
+                        return replies
+                    if msg_type == NLMSG_ERROR:
+                        err = struct.unpack_from('=i', body)[0]
+                        if err == 0: # Ack
+                            return replies
+                        raise WirelessError('netlink error: %s' % os.strerror(-err))
+                    if len(body) >= _GENLMSGHDR.size:
+                        replies.append((ord(body[0]), parse_attrs(body, _GENLMSGHDR.size)))
+        except socket.timeout:
+            raise WirelessError('Timeout waiting for netlink reply')
+
+    def _resolve_family(self, name):
+        replies = self._request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY,
+                                pack_attr(CTRL_ATTR_FAMILY_NAME, name + '\0'))
+        for cmd, attrs in replies:
+            if CTRL_ATTR_FAMILY_ID in attrs:
+                return _u16(attrs[CTRL_ATTR_FAMILY_ID])
+        raise WirelessError('No generic netlink family %s' % name)
+
+    ##\return Dict with 'ssid', 'freq' (MHz) and 'tx_power' (dBm), when known
+    def interface_info(self, ifindex):
+        info = {}
+        for cmd, attrs in self._request(self.family, NL80211_CMD_GET_INTERFACE,
+                                        pack_attr(NL80211_ATTR_IFINDEX, struct.pack('=I', ifindex))):
+            if NL80211_ATTR_SSID in attrs:
+                info['ssid'] = attrs[NL80211_ATTR_SSID]
+            if NL80211_ATTR_WIPHY_FREQ in attrs:
+                info['freq'] = _u32(attrs[NL80211_ATTR_WIPHY_FREQ])
+            if NL80211_ATTR_WIPHY_TX_POWER_LEVEL in attrs:
+                info['tx_power'] = _u32(attrs[NL80211_ATTR_WIPHY_TX_POWER_LEVEL]) / 100
+        return info
+
+    ##\return Dict per associated station (the AP, for a client), with 'mac',
+    ## 'signal', 'tx_bitrate' (Mbps), 'tx_packets', 'tx_retries', 'tx_failed'
+    ## and 'beacon_loss', when known
+    def stations(self, ifindex):
+        stations = []
+        for cmd, attrs in self._request(self.family, NL80211_CMD_GET_STATION,
+                                        pack_attr(NL80211_ATTR_IFINDEX, struct.pack('=I', ifindex)),
+                                        NLM_F_DUMP):
+            if NL80211_ATTR_STA_INFO not in attrs:
+                continue
+            sta = parse_station_info(attrs[NL80211_ATTR_STA_INFO])
+            if NL80211_ATTR_MAC in attrs:
+                sta['mac'] = _mac(attrs[NL80211_ATTR_MAC])
+            stations.append(sta)
+        return stations
+
+    ##\return Noise floor (dBm) of the channel in use, or None
+    def survey_noise(self, ifindex):
+        for cmd, attrs in self._request(self.family, NL80211_CMD_GET_SURVEY,
+                                        pack_attr(NL80211_ATTR_IFINDEX, struct.pack('=I', ifindex)),
+                                        NLM_F_DUMP):
+            if NL80211_ATTR_SURVEY_INFO not in attrs:
+                continue
+            survey = parse_attrs(attrs[NL80211_ATTR_SURVEY_INFO])
+            if NL80211_SURVEY_INFO_IN_USE in survey and NL80211_SURVEY_INFO_NOISE in survey:
+                return _u8s(survey[NL80211_SURVEY_INFO_NOISE])
+        return None
+
+def parse_station_info(data):
+    info = parse_attrs(data)
+    sta = {}
+    if NL80211_STA_INFO_SIGNAL in info:
+        sta['signal'] = _u8s(info[NL80211_STA_INFO_SIGNAL])
+    if NL80211_STA_INFO_TX_BITRATE in info:
+        rate = parse_attrs(info[NL80211_STA_INFO_TX_BITRATE])
+        # Units of 100 kbit/s
+        if NL80211_RATE_INFO_BITRATE32 in rate:
+            sta['tx_bitrate'] = _u32(rate[NL80211_RATE_INFO_BITRATE32]) / 10
+        elif NL80211_RATE_INFO_BITRATE in rate:
+            sta['tx_bitrate'] = _u16(rate[NL80211_RATE_INFO_BITRATE]) / 10
+    for key, attr in [ ('tx_packets', NL80211_STA_INFO_TX_PACKETS),
+                       ('tx_retries', NL80211_STA_INFO_TX_RETRIES),
+                       ('tx_failed', NL80211_STA_INFO_TX_FAILED),
+                       ('beacon_loss', NL80211_STA_INFO_BEACON_LOSS) ]:
+        if attr in info:
+            sta[key] = _u32(info[attr])
+    return sta
+
+##\brief State of the local wireless link, in the fields of pr2_msgs/AccessPoint
+## plus transmit retry and failure counters
+class WirelessSample(object):
+    def __init__(self):
+        self.connected = False
+        self.essid = ''
+        self.macaddr = ''
+        self.signal = None
+        self.noise = None
+        self.snr = None
+        self.quality = None
+        self.channel = 0
+        self.rate = None
+        self.tx_power = None
+        self.tx_packets = None
+        self.tx_retries = None
+        self.tx_failed = None
+        self.beacon_loss = None
+        # Per second, from the previous sample
+        self.tx_packet_rate = None
+        self.tx_retry_rate = None
+        self.tx_failed_rate = None
+
+##\brief Collects WirelessSample's for one interface
+##
+## The netlink socket is kept open between samples. If nl80211 isn't
+## available only /proc/net/wireless is used.
+class WirelessCollector(object):
+    def __init__(self, interface, proc_path = '/proc/net/wireless', timeout = 1.0):
+        self.interface = interface
+        self._proc_path = proc_path
+        self._timeout = timeout
+        self._nl = None
+        self._prev = None
+        self.nl_error = None
+
+    def close(self):
+        if self._nl:
+            self._nl.close()
+            self._nl = None
+
+    def _read_nl80211(self, sample):
+        if self._nl is None:
+            self._nl = NL80211(self._timeout)
+        ifindex = if_nametoindex(self.interface)
+
+        info = self._nl.interface_info(ifindex)
+        sample.essid = info.get('ssid', '')
+        sample.channel = freq_to_channel(info.get('freq', 0))
+        sample.tx_power = info.get('tx_power')
+
+        stations = self._nl.stations(ifindex)
+        if stations:
+            sta = stations[0]
+            sample.connected = True
+            sample.macaddr = sta.get('mac', '')
+            sample.signal = sta.get('signal', sample.signal)
+            sample.rate = sta.get('tx_bitrate')
+            sample.tx_packets = sta.get('tx_packets')
+            sample.tx_retries = sta.get('tx_retries')
+            sample.tx_failed = sta.get('tx_failed')
+            sample.beacon_loss = sta.get('beacon_loss')
+            if sample.noise is None:
+                sample.noise = self._nl.survey_noise(ifindex)
+
+    ##\param now Monotonic time (s), used for the counter rates
+    def sample(self, now):
+        sample = WirelessSample()
+        try:
+            with open(self._proc_path) as f:
+                proc = parse_proc_wireless(f.read(), self.interface)
+        except IOError:
+            proc = None
+        if proc:
+            sample.quality = proc['quality']
+            sample.signal = proc['signal']
+            sample.noise = proc['noise']
+
+        try:
+            self._read_nl80211(sample)
+            self.nl_error = None
+        except (WirelessError, socket.error), e:
+            self.nl_error = str(e)
+            self.close()
+            # Without nl80211, a nonzero quality means associated
+            sample.connected = bool(proc and proc['quality'] > 0)
+
+        if proc is None and self.nl_error:
+            raise WirelessError('No data for %s: %s' % (self.interface, self.nl_error))
+
+        if sample.signal is not None and sample.noise is not None:
+            sample.snr = sample.signal - sample.noise
+
+        if sample.tx_packets is not None:
+            if self._prev is not None:
+                prev_time, prev = self._prev
+                dt = now - prev_time
+                # Counters restart when the station reassociates
+                if dt > 0 and sample.tx_packets >= prev.tx_packets:
+                    sample.tx_packet_rate = (sample.tx_packets - prev.tx_packets) / dt
+                    if sample.tx_retries is not None and prev.tx_retries is not None:
+                        sample.tx_retry_rate = (sample.tx_retries - prev.tx_retries) / dt
+                    if sample.tx_failed is not None and prev.tx_failed is not None:
+                        sample.tx_failed_rate = (sample.tx_failed - prev.tx_failed) / dt
+            self._prev = (now, sample)
+        else:
+            self._prev = None
+        return sample
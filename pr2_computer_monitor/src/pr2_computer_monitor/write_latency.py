@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Filesystem write+fsync latency probe for hd_monitor
+
+from __future__ import division
+
+import os
+import errno
+import math
+from collections import deque
+
+from clock import monotonic
+
+PROBE_FILE = '.hd_monitor_latency_probe'
+PROBE_SIZE = 4096
+
+# Latency levels, as DiagnosticStatus levels
+OK = 0
+SLOW = 1
+VERY_SLOW = 2
+
+##\brief Latency histogram over a window of the most recent samples
+##
+## Buckets are spaced logarithmically, four per octave, from 10us up to
+## about 20s. Counts are kept for the samples in the window only, so
+## adding a sample and reading a percentile don't depend on window size.
+class LatencyHistogram(object):
+    MIN_LATENCY = 1e-5
+    BUCKETS_PER_OCTAVE = 4
+    NUM_BUCKETS = 84
+
+    def __init__(self, window = 720):
+        self._counts = [ 0 ] * self.NUM_BUCKETS
+        self._samples = deque()
+        self._window = window
+        self.total_count = 0
+
+    def _bucket(self, latency):
+        if latency <= self.MIN_LATENCY:
+            return 0
+        idx = int(math.log(latency / self.MIN_LATENCY, 2) * self.BUCKETS_PER_OCTAVE) + 1
+        return min(idx, self.NUM_BUCKETS - 1)
+
+    def _upper_bound(self, idx):
+        return self.MIN_LATENCY * 2 ** (idx / self.BUCKETS_PER_OCTAVE)
+
+    def add(self, latency):
+        idx = self._bucket(latency)
+        self._samples.append((idx, latency))
+        self._counts[idx] += 1
+        self.total_count += 1
+        if len(self._samples) > self._window:
+            old_idx, old_latency = self._samples.popleft()
+            self._counts[old_idx] -= 1
+
+    def __len__(self):
+        return len(self._samples)
+
+    ##\brief Upper bound of the bucket holding the given percentile (0-100),
+    ## capped at the largest sample
+    def percentile(self, pct):
+        if not self._samples:
+            return 0.0
+        target = max(1, int(math.ceil(len(self._samples) * pct / 100.0)))
+        seen = 0
+        for idx, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(self._upper_bound(idx), self.max())
+        return self.max()
+
+    def max(self):
+        if not self._samples:
+            return 0.0
+        return max(latency for idx, latency in self._samples)
+
+    def last(self):
+        if not self._samples:
+            return 0.0
+        return self._samples[-1][1]
+
+##\brief Rates the latency in a histogram against warn and error thresholds
+##
+## The last sample alone can make it very slow. The last sample or the
+## 99th percentile can make it slow.
+def latency_level(hist, warn, error):
+    if len(hist) == 0:
+        return OK
+    if hist.last() > error:
+        return VERY_SLOW
+    if hist.percentile(99) > warn or hist.last() > warn:
+        return SLOW
+    return OK
+
+##\brief Times a small write followed by fdatasync in one directory
+##
+## The probe file is kept open and rewritten in place, so each probe is a
+## single block write and flush, with no file creation or metadata update.
+## Times come from the monotonic clock, so clock steps don't show up as
+## latency.
+class WriteLatencyProbe(object):
+    def __init__(self, directory, window = 720):
+        self.directory = directory
+        self.path = os.path.join(os.path.expanduser(directory), PROBE_FILE)
+        self._fd = None
+        self._buf = '\0' * PROBE_SIZE
+        self.write_hist = LatencyHistogram(window)
+        self.total_hist = LatencyHistogram(window)
+        self.errors = 0
+        self._removed = False
+
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0644)
+
+    ##\brief Runs one probe. Raises OSError if the write fails.
+    ##\return (write time, write+fsync time) in seconds
+    def probe(self):
+        if self._removed:
+            raise OSError(errno.EBADF, 'Probe file has been removed', self.path)
+        try:
+            self._open()
+            start = monotonic()
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, self._buf)
+            written = monotonic()
+            os.fdatasync(self._fd)
+            done = monotonic()
+        except OSError:
+            self.errors += 1
+            self.close()
+            raise
+
+        self.write_hist.add(written - start)
+        self.total_hist.add(done - start)
+        return written - start, done - start
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    ##\brief Closes and deletes the probe file, for shutdown. The probe
+    ## can't be used afterwards.
+    def remove(self):
+        self._removed = True
+        self.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import ClockSentinel
+from pr2_computer_monitor import clock_sentinel
+from pr2_computer_monitor.clock import CLOCK_REALTIME, CLOCK_MONOTONIC, CLOCK_MONOTONIC_RAW, CLOCK_BOOTTIME
+
+import sys
+
+##\brief Kernel clocks that can be stepped, slewed and suspended
+class FakeClocks(object):
+    def __init__(self):
+        self.raw = 1000.0
+        self.mono = 1000.0
+        self.real = 1300000000.0
+        self.suspended = 0.0
+        self.freq = 0.0 # Frequency correction applied to mono and real, ppm
+
+    def advance(self, dt):
+        self.raw += dt
+        self.mono += dt * (1 + self.freq * 1e-6)
+        self.real += dt * (1 + self.freq * 1e-6)
+
+    def read(self, clock_id):
+        if clock_id == CLOCK_REALTIME:
+            return self.real
+        if clock_id == CLOCK_MONOTONIC:
+            return self.mono
+        if clock_id == CLOCK_MONOTONIC_RAW:
+            return self.raw
+        if clock_id == CLOCK_BOOTTIME:
+            return self.mono + self.suspended
+        raise OSError(22, 'Invalid argument')
+
+class TestClockSentinel(unittest.TestCase):
+    def setUp(self):
+        self.clocks = FakeClocks()
+        self.sentinel = ClockSentinel(step_threshold = 0.001, slew_threshold = 200.0,
+                                      slew_window = 10.0, read_clock = self.clocks.read)
+
+    def run_for(self, duration, period = 0.1):
+        events = []
+        for i in range(int(round(duration / period))):
+            self.clocks.advance(period)
+            events.extend(self.sentinel.sample())
+        return events
+
+    def test_quiet(self):
+        self.assertEqual(self.run_for(20.0), [])
+        self.assertEqual(self.sentinel.steps, 0)
+        self.assert_(abs(self.sentinel.slew_rate) < 1e-3, "Wrong slew rate: %f" % self.sentinel.slew_rate)
+
+    def test_step(self):
+        self.run_for(1.0)
+        self.clocks.real -= 0.25
+        events = self.run_for(1.0)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][0], clock_sentinel.STEP)
+        self.assert_(abs(events[0][1] + 0.25) < 1e-6, "Wrong step size: %f" % events[0][1])
+        self.assertEqual(self.sentinel.steps, 1)
+        self.assert_(abs(self.sentinel.largest_step + 0.25) < 1e-6)
+
+    def test_small_step_ignored(self):
+        self.run_for(1.0)
+        self.clocks.real += 0.0005
+        self.assertEqual(self.run_for(1.0), [])
+
+    def test_suspend_is_not_step(self):
+        self.run_for(1.0)
+        self.clocks.suspended += 30.0
+        self.clocks.real += 30.0
+        events = self.run_for(1.0)
+
+        self.assertEqual([ e[0] for e in events ], [ clock_sentinel.SUSPEND ])
+        self.assertEqual(self.sentinel.steps, 0)
+        self.assert_(abs(self.sentinel.last_suspend - 30.0) < 1e-6)
+
+    def test_slew(self):
+        self.run_for(10.0)
+        self.clocks.freq = 500.0
+        events = self.run_for(20.0)
+
+        self.assertEqual([ e[0] for e in events ], [ clock_sentinel.SLEW ])
+        self.assert_(abs(self.sentinel.slew_rate - 500.0) < 1.0, "Wrong slew rate: %f" % self.sentinel.slew_rate)
+        self.assert_(self.sentinel.slewing)
+        self.assertEqual(self.sentinel.steps, 0)
+
+        self.clocks.freq = 0.0
+        self.run_for(20.0)
+        self.assert_(not self.sentinel.slewing)
+        self.assertEqual(self.sentinel.slews, 1)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestClockSentinel)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'clock_sentinel', TestClockSentinel)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import OffsetHistory
+
+import math
+import random
+import sys
+
+def fill(history, offsets, interval = 1.0, start = 1000.0):
+    for i, offset in enumerate(offsets):
+        history.add(start + i * interval, offset)
+
+##\brief Slope of log(ADEV) against log(tau) between two averaging times
+def adev_slope(history, tau1, tau2):
+    t1, a1 = history.allan_deviation(tau1)
+    t2, a2 = history.allan_deviation(tau2)
+    return math.log(a2 / a1) / math.log(t2 / t1)
+
+class TestOffsetHistory(unittest.TestCase):
+    def test_too_few_samples(self):
+        history = OffsetHistory()
+        self.assertEqual(history.frequency_ppm(), None)
+        self.assertEqual(history.jitter(), None)
+        self.assertEqual(history.allan_deviation(1), None)
+        fill(history, [ 0.0, 0.001 ])
+        self.assertEqual(history.frequency_ppm(), None)
+        self.assertEqual(history.allan_deviation(1), None)
+
+    def test_ring_buffer(self):
+        history = OffsetHistory(size = 5)
+        fill(history, range(8))
+        self.assertEqual(len(history), 5)
+        times, offsets = history.samples()
+        self.assertEqual(offsets, [ 3, 4, 5, 6, 7 ])
+        self.assertEqual(times, [ 1003.0, 1004.0, 1005.0, 1006.0, 1007.0 ])
+
+    def test_linear_drift(self):
+        # 12.5 ppm, sampled every 2 s, with a constant offset
+        history = OffsetHistory()
+        fill(history, [ 0.003 + 12.5e-6 * 2 * i for i in range(100) ], interval = 2.0)
+        self.assertAlmostEqual(history.frequency_ppm(), 12.5, 6)
+        self.assertAlmostEqual(history.jitter(), 25e-6, 9)
+        self.assertEqual(history.sample_interval(), 2.0)
+
+        # A pure frequency error is removed by the second difference
+        tau, adev = history.allan_deviation(10)
+        self.assertEqual(tau, 10.0)
+        self.assert_(adev < 1e-12, "ADEV of a linear drift: %g" % adev)
+
+    def test_noisy_drift(self):
+        rand = random.Random(1)
+        history = OffsetHistory()
+        fill(history, [ -3e-6 * i + rand.gauss(0, 1e-4) for i in range(300) ])
+        self.assert_(abs(history.frequency_ppm() + 3.0) < 0.5, "Wrong frequency: %f" % history.frequency_ppm())
+
+    def test_tau_rounding(self):
+        history = OffsetHistory()
+        fill(history, [ 0.0 ] * 20, interval = 2.0)
+        self.assertEqual(history.allan_deviation(5)[0], 6.0)
+        self.assertEqual(history.allan_deviation(0.1)[0], 2.0)
+        self.assertEqual(history.allan_deviation(100), None) # Needs 2 * 50 + 1 samples
+
+    def test_white_phase_noise(self):
+        # ADEV of white phase noise falls as 1/tau, with ADEV(tau0) = sqrt(3) sigma / tau0
+        rand = random.Random(2)
+        sigma = 1e-4
+        history = OffsetHistory(size = 3000)
+        fill(history, [ rand.gauss(0, sigma) for i in range(3000) ])
+        tau, adev = history.allan_deviation(1)
+        self.assert_(abs(adev / (math.sqrt(3) * sigma) - 1) < 0.1, "Wrong ADEV: %g" % adev)
+        slope = adev_slope(history, 1, 10)
+        self.assert_(abs(slope + 1.0) < 0.1, "Wrong ADEV slope: %f" % slope)
+
+    def test_white_frequency_noise(self):
+        # Offsets that random walk: ADEV falls as 1/sqrt(tau), and equals
+        # the frequency noise at tau0
+        rand = random.Random(3)
+        sigma = 1e-6
+        offsets = [ 0.0 ]
+        for i in range(2999):
+            offsets.append(offsets[-1] + rand.gauss(0, sigma))
+        history = OffsetHistory(size = 3000)
+        fill(history, offsets)
+        tau, adev = history.allan_deviation(1)
+        self.assert_(abs(adev / sigma - 1) < 0.1, "Wrong ADEV: %g" % adev)
+        slope = adev_slope(history, 1, 10)
+        self.assert_(abs(slope + 0.5) < 0.15, "Wrong ADEV slope: %f" % slope)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestOffsetHistory)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'clock_stats', TestOffsetHistory)
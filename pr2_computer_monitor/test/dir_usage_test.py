@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor.dir_usage import DirUsageIndex
+
+import os
+import shutil
+import tempfile
+import sys
+import time
+
+def write_file(path, size):
+    with open(path, 'wb') as f:
+        f.write('x' * size)
+        f.flush()
+        os.fsync(f.fileno())
+
+class TestDirUsage(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'old'))
+        write_file(os.path.join(self.root, 'old', 'data'), 1 << 20)
+        os.mkdir(os.path.join(self.root, 'new'))
+        self.index = DirUsageIndex([ self.root ])
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def size(self, name):
+        return dict(self.index.largest(10)).get(self.path(name), 0)
+
+    def test_scan_is_not_growth(self):
+        self.index.update()
+        self.assert_(self.size('old') >= 1 << 20, "Wrong size: %d" % self.size('old'))
+        self.assertEqual(self.index.fastest_growing(5), [])
+
+    def test_write_is_growth(self):
+        self.index.update()
+        write_file(self.path('new', 'data'), 1 << 20)
+        self.index.update()
+
+        growing = self.index.fastest_growing(5)
+        self.assertEqual([ d for d, r in growing ], [ self.path('new') ])
+        self.assert_(self.size('new') >= 1 << 20, "Wrong size: %d" % self.size('new'))
+
+        # Nothing written since the last update
+        self.index.update()
+        self.assertEqual(self.index.fastest_growing(5), [])
+
+    def test_move_is_not_growth(self):
+        self.index.update()
+        old_size = self.size('old')
+        os.rename(self.path('old', 'data'), self.path('new', 'data'))
+        self.index.update()
+
+        self.assertEqual(self.index.fastest_growing(5), [])
+        self.assertEqual(self.size('old'), 0)
+        self.assertEqual(self.size('new'), old_size)
+
+    def test_moved_in_directory_is_not_growth(self):
+        outside = tempfile.mkdtemp()
+        try:
+            write_file(os.path.join(outside, 'data'), 1 << 20)
+            self.index.update()
+            os.rename(outside, self.path('moved'))
+            self.index.update()
+        finally:
+            shutil.rmtree(outside, ignore_errors = True)
+
+        self.assertEqual(self.index.fastest_growing(5), [])
+        self.assert_(self.size('moved') >= 1 << 20, "Wrong size: %d" % self.size('moved'))
+
+    def test_delete(self):
+        self.index.update()
+        total = self.index.total(self.root)
+        os.unlink(self.path('old', 'data'))
+        self.index.update()
+
+        self.assertEqual(self.size('old'), 0)
+        self.assert_(self.index.total(self.root) <= total - (1 << 20))
+        self.assertEqual(self.index.fastest_growing(5), [])
+
+    def test_remove_subtree(self):
+        # run1 shares a prefix with run10, only run10 goes
+        for run in [ 'run1', 'run10' ]:
+            os.makedirs(self.path('logs', run, 'sub'))
+            write_file(self.path('logs', run, 'log'), 1 << 16)
+            write_file(self.path('logs', run, 'sub', 'log'), 1 << 16)
+        self.index.update()
+        total = self.index.total(self.root)
+        run_size = self.index.total(self.path('logs', 'run10'))
+        self.assert_(run_size >= 2 << 16, "Wrong size: %d" % run_size)
+
+        shutil.rmtree(self.path('logs', 'run10'))
+        self.index.update()
+        self.assertEqual(self.index.total(self.root), total - run_size)
+        self.assertEqual(self.index.total(self.path('logs')), run_size)
+        self.assertEqual(self.index.total(self.path('logs', 'run1', 'sub')), run_size // 2)
+
+        # Nothing is left of the removed directories
+        removed = self.path('logs', 'run10')
+        for table in [ self.index._file_sizes, self.index._dir_sizes, self.index._dir_files, self.index._subdirs ]:
+            self.assertEqual([ p for p in table if p.startswith(removed) ], [])
+        self.assertEqual(self.index._subdirs[self.path('logs')], set([ self.path('logs', 'run1') ]))
+        self.assertEqual(self.index.get_stats()['files'], 3)
+
+    def test_wall_clock_step(self):
+        self.index.update()
+        write_file(self.path('new', 'data'), 1 << 20)
+        wall_time = time.time
+        try:
+            time.time = lambda: wall_time() - 3600 # Clock stepped back
+            self.index.update()
+        finally:
+            time.time = wall_time
+        growing = self.index.fastest_growing(5)
+        self.assertEqual(len(growing), 1)
+        self.assert_(0 < growing[0][1] < float('inf'), "Wrong growth rate: %f" % growing[0][1])
+
+    def test_rescan_is_not_growth(self):
+        self.index.update()
+        self.index.rescan()
+        self.index.update()
+        self.assertEqual(self.index.fastest_growing(5), [])
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestDirUsage)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'dir_usage', TestDirUsage)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+##\brief Stand-in for 'nvidia-smi --query-gpu=... --format=csv,noheader,nounits -lms N'
+## used by the streaming tests. --query-compute-apps lists this process on
+## every GPU, and so does 'pmon -s u -d N', with an idle row for the GPU
+## first. Prints one row per GPU per period, for as many
+## GPUs as FAKE_SMI_GPUS (default 1). Exits after FAKE_SMI_LINES periods if
+## that's set, to test restarts. FAKE_SMI_THROTTLE sets the throttle reasons.
+## FAKE_SMI_UNSUPPORTED makes it exit straight away like a driver without
+## the query interface.
+
+import os
+import sys
+import time
+
+ROW = {
+    'index': '%(index)d',
+    'name': 'Quadro 600',
+    'pci.device_id': '0x0DF810DE',
+    'pci.bus_id': '0000:0%(index)d:00.0',
+    'display_mode': 'Enabled',
+    'driver_version': '270.41.06',
+    'temperature.gpu': '%(temp)d',
+    'fan.speed': '40',
+    'utilization.gpu': '3',
+    'utilization.memory': '1',
+    'clocks.sm': '1354',
+    'clocks.max.sm': '1721',
+    'clocks.mem': '2505',
+    'clocks.max.mem': '2505',
+    'power.draw': '12.31',
+    'power.limit': '40.00',
+    'clocks_throttle_reasons.active': '0x%(throttle)016x',
+    'gpu_bus_id': '00000000:0%(index)d:00.0',
+    'pid': '%(pid)d',
+    'process_name': 'python',
+    'used_memory': '%(memory)d',
+}
+
+if __name__ == '__main__':
+    fields = []
+    period = 1.0
+    for i, arg in enumerate(sys.argv):
+        if arg.startswith('--query-gpu=') or arg.startswith('--query-compute-apps='):
+            fields = arg.split('=', 1)[1].split(',')
+        if arg == '-lms':
+            period = int(sys.argv[i + 1]) / 1000.0
+
+    if os.environ.get('FAKE_SMI_UNSUPPORTED'):
+        sys.stderr.write('Invalid combination of input arguments. Please run \'nvidia-smi -h\' for help.\n')
+        sys.exit(2)
+
+    gpus = int(os.environ.get('FAKE_SMI_GPUS', '1'))
+    lines = int(os.environ.get('FAKE_SMI_LINES', '0'))
+    throttle = int(os.environ.get('FAKE_SMI_THROTTLE', '0'), 0)
+    pmon = 'pmon' in sys.argv
+    if pmon:
+        period = float(sys.argv[sys.argv.index('-d') + 1])
+        sys.stdout.write('# gpu        pid  type    sm   mem   enc   dec   command\n'
+                         '# Idx          #   C/G     %     %     %     %   name\n')
+
+    count = 0
+    while lines == 0 or count < lines:
+        for index in range(gpus):
+            if pmon:
+                sys.stdout.write('    %d          -     -     -     -     -     -   -\n' % index)
+                sys.stdout.write('    %d %10d     C    %2d     %d     -     -   python\n' %
+                                 (index, os.getpid(), 10 * (index + 1), index + 1))
+                continue
+            vals = [ ROW.get(f, '[Not Supported]') % { 'index': index, 'temp': 50 + count, 'throttle': throttle,
+                                                         'pid': os.getpid(), 'memory': 100 * (index + 1) } for f in fields ]
+            sys.stdout.write(', '.join(vals) + '\n')
+        sys.stdout.flush()
+        count += 1
+        time.sleep(period)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+import pr2_computer_monitor
+from pr2_computer_monitor.gpu_processes import node_name_from_cmdline
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+FAKE_SMI = os.path.join(roslib.packages.get_pkg_dir(PKG), 'test', 'fake_nvidia_smi.py')
+
+def app_row(pid, memory, bus_id = '00000000:01:00.0', name = '/usr/bin/python'):
+    return { 'gpu_bus_id': bus_id, 'pid': str(pid), 'process_name': name, 'used_memory': str(memory) }
+
+class TestGPUProcesses(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+        self.stream = None
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_root)
+        if self.stream:
+            self.stream.stop()
+
+    def write_cmdline(self, pid, args, start = 1000):
+        os.mkdir(os.path.join(self.proc_root, str(pid)))
+        with open(os.path.join(self.proc_root, str(pid), 'cmdline'), 'w') as f:
+            f.write('\0'.join(args) + '\0')
+        with open(os.path.join(self.proc_root, str(pid), 'stat'), 'w') as f:
+            f.write('%d (%s) S 1 %d' % (pid, os.path.basename(args[0])[:15], pid) + ' 0' * 16 + ' %d 0\n' % start)
+
+    def test_node_names(self):
+        self.assertEqual(node_name_from_cmdline(
+            [ '/opt/ros/bin/stereo_image_proc', '__name:=stereo_proc', '__log:=/tmp/x.log' ]), '/stereo_proc')
+        self.assertEqual(node_name_from_cmdline(
+            [ '/opt/ros/bin/detector', '__name:=detector', '__ns:=/wide_stereo' ]), '/wide_stereo/detector')
+        self.assertEqual(node_name_from_cmdline([ '/usr/bin/python', '-u', '/opt/ros/lib/pkg/tracker.py' ]), 'tracker.py')
+        self.assertEqual(node_name_from_cmdline([ '/usr/bin/Xorg', ':0' ]), 'Xorg')
+        self.assertEqual(node_name_from_cmdline([]), '')
+
+    def test_names_cached(self):
+        self.write_cmdline(100, [ '/opt/ros/bin/detector', '__name:=detector' ])
+        names = pr2_computer_monitor.ProcessNames(self.proc_root)
+        self.assertEqual(names.name(100), '/detector')
+        self.assertEqual(names.name(100), '/detector')
+        self.assertEqual(names.reads, 1)
+
+        # Missing process falls back to the default, and isn't cached
+        self.assertEqual(names.name(200, 'python'), 'python')
+        self.write_cmdline(200, [ '/opt/ros/bin/tracker', '__name:=tracker' ])
+        self.assertEqual(names.name(200, 'python'), '/tracker')
+
+        # Pid reused after the process exited
+        names.prune([ 200 ])
+        shutil.rmtree(os.path.join(self.proc_root, '100'))
+        self.write_cmdline(100, [ '/opt/ros/bin/segmenter', '__name:=segmenter' ])
+        self.assertEqual(names.name(100), '/segmenter')
+
+    def test_pid_reused(self):
+        # A new process with the same pid is read again even before it's pruned
+        self.write_cmdline(100, [ '/opt/ros/bin/detector', '__name:=detector' ], start = 1000)
+        names = pr2_computer_monitor.ProcessNames(self.proc_root)
+        self.assertEqual(names.start_time(100), 1000)
+        self.assertEqual(names.name(100), '/detector')
+        shutil.rmtree(os.path.join(self.proc_root, '100'))
+        self.write_cmdline(100, [ '/opt/ros/bin/segmenter', '__name:=segmenter' ], start = 2500)
+        self.assertEqual(names.name(100), '/segmenter')
+        self.assertEqual(names.name(100), '/segmenter')
+        self.assertEqual(names.reads, 2)
+
+    def test_process_usage(self):
+        names = pr2_computer_monitor.ProcessNames(self.proc_root)
+        rows = [ app_row(100, 900), app_row(101, 50), app_row(100, 200, bus_id = '00000000:02:00.0') ]
+        procs = pr2_computer_monitor.rows_to_gpu_processes(rows, names)
+        pmon = [ { 'gpu': '0', 'pid': '100', 'sm': '35', 'mem': '4' },
+                 { 'gpu': '1', 'pid': '100', 'sm': '-', 'mem': '-' },
+                 { 'gpu': '2', 'pid': '101', 'sm': '80', 'mem': '9' } ] # GPU that isn't listed
+        pr2_computer_monitor.add_process_usage(procs, pmon, { '0': '0000:01:00.0', '1': '0000:02:00.0' })
+        self.assertEqual([ (p.sm_usage, p.memory_usage) for p in procs ], [ (35, 4), (None, None), (None, None) ])
+
+    def test_pmon_lines(self):
+        stream = pr2_computer_monitor.PmonStream(1.0)
+        self.assertEqual(stream.args(), [ 'nvidia-smi', 'pmon', '-s', 'u', '-d', '1' ])
+        row = stream.parse_line('    0       4321     C    12     3     -     -   stereo_proc\n')
+        self.assertEqual((row['gpu'], row['pid'], row['sm'], row['command']), ('0', '4321', '12', 'stereo_proc'))
+        self.assertEqual(stream.parse_line('    0          -     -     -     -     -     -   -'), {})
+        self.assertEqual(stream.parse_line('garbage'), None)
+
+    def test_top_processes(self):
+        self.write_cmdline(100, [ '/opt/ros/bin/detector', '__name:=detector' ])
+        names = pr2_computer_monitor.ProcessNames(self.proc_root)
+        rows = [ app_row(100, 900), app_row(101, 50), app_row(102, 400),
+                 app_row(103, 2000, bus_id = '00000000:02:00.0') ]
+        procs = pr2_computer_monitor.rows_to_gpu_processes(rows, names)
+        self.assertEqual(len(procs), 4)
+
+        top = pr2_computer_monitor.top_processes(procs, '0000:01:00.0', 2)
+        self.assertEqual([ p.pid for p in top ], [ 100, 102 ])
+        self.assertEqual(top[0].node, '/detector')
+        self.assertEqual(top[1].node, 'python')
+        self.assertEqual(top[0].used_memory, 900)
+
+    def test_stream(self):
+        self.stream = pr2_computer_monitor.SmiStream(0.05, FAKE_SMI, pr2_computer_monitor.COMPUTE_APP_FIELDS,
+                                                     query = 'compute-apps', key = ('gpu_bus_id', 'pid'),
+                                                     expire = 0.25)
+        self.stream.start()
+        deadline = time.time() + 5.0
+        while time.time() < deadline and not self.stream.rows():
+            time.sleep(0.02)
+        rows = self.stream.rows()
+        self.assertEqual(len(rows), 1, "Expected one process, got %d" % len(rows))
+
+        procs = pr2_computer_monitor.rows_to_gpu_processes(rows, pr2_computer_monitor.ProcessNames())
+        self.assertEqual(procs[0].node, 'fake_nvidia_smi.py')
+        self.assertEqual(procs[0].used_memory, 100)
+
+        # Rows that stop being printed expire
+        self.stream.stop()
+        time.sleep(0.3)
+        self.assertEqual(self.stream.rows(), [])
+
+    def test_pmon_stream(self):
+        self.stream = pr2_computer_monitor.PmonStream(1.0, FAKE_SMI)
+        self.stream.start()
+        deadline = time.time() + 5.0
+        while time.time() < deadline and not self.stream.rows():
+            time.sleep(0.02)
+        rows = self.stream.rows()
+        self.assertEqual(len(rows), 1, "Expected one process, got %d" % len(rows))
+        self.assertEqual((rows[0]['gpu'], rows[0]['sm'], rows[0]['mem']), ('0', '10', '1'))
+        self.assertEqual(self.stream.bad_lines, 0) # Headings and idle rows are skipped
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestGPUProcesses)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'gpu_processes', TestGPUProcesses)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+import pr2_computer_monitor
+from pr2_computer_monitor import nvidia_smi_util
+from pr2_computer_monitor.gpu_throttle import POWER, THERMAL
+
+import sys
+
+SW_POWER_CAP = 0x004
+HW_THERMAL_SLOWDOWN = 0x040
+
+class TestThrottleTracker(unittest.TestCase):
+    def test_events_counted_once_per_period(self):
+        tracker = pr2_computer_monitor.ThrottleTracker(sustain_time = 10.0, window = 60.0)
+        for t, mask in enumerate([ 0, SW_POWER_CAP, SW_POWER_CAP, 0, SW_POWER_CAP, 0 ]):
+            tracker.update(mask, t)
+        self.assertEqual(tracker.events(POWER), 2)
+        self.assertEqual(tracker.events(THERMAL), 0)
+        self.assertEqual(tracker.sustained(), [])
+
+    def test_events_leave_window(self):
+        tracker = pr2_computer_monitor.ThrottleTracker(window = 5.0)
+        tracker.update(HW_THERMAL_SLOWDOWN, 0)
+        tracker.update(0, 1)
+        self.assertEqual(tracker.events(THERMAL), 1)
+        tracker.update(0, 10)
+        self.assertEqual(tracker.events(THERMAL), 0)
+        self.assertEqual(tracker.total_events(THERMAL), 1)
+
+    def test_sustained(self):
+        tracker = pr2_computer_monitor.ThrottleTracker(sustain_time = 10.0)
+        for t in range(0, 12):
+            tracker.update(SW_POWER_CAP | HW_THERMAL_SLOWDOWN if t < 5 else SW_POWER_CAP, t)
+        self.assertEqual(tracker.sustained(), [ POWER ])
+        self.assertEqual(tracker.duration(POWER), 11)
+        self.assertEqual(tracker.duration(THERMAL), 0)
+
+    def test_unknown_mask_keeps_state(self):
+        tracker = pr2_computer_monitor.ThrottleTracker(sustain_time = 2.0)
+        tracker.update(SW_POWER_CAP, 0)
+        tracker.update(None, 3)
+        self.assertEqual(tracker.sustained(), [ POWER ])
+        self.assertEqual(tracker.events(POWER), 1)
+
+    def test_idle_not_reported(self):
+        self.assertEqual(nvidia_smi_util.throttle_names(0x001 | SW_POWER_CAP), [ 'SW Power Cap' ])
+        self.assertEqual(nvidia_smi_util.throttle_mask([ 'SW Power Cap', 'HW Thermal Slowdown' ]),
+                         SW_POWER_CAP | HW_THERMAL_SLOWDOWN)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestThrottleTracker)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'gpu_throttle', TestThrottleTracker)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import RollingStats, WifiLinkStats, RoamTimeline, parse_rate
+from pr2_computer_monitor import link_stats
+
+import sys
+
+class TestLinkStats(unittest.TestCase):
+    def test_summary(self):
+        stats = RollingStats(100)
+        for i in range(10):
+            stats.add(float(i), float(i + 1))
+        s = stats.summary(100, 9.0)
+        self.assertEqual(s['count'], 10)
+        self.assertEqual(s['min'], 1.0)
+        self.assertEqual(s['max'], 10.0)
+        self.assertAlmostEqual(s['mean'], 5.5)
+        self.assertAlmostEqual(s['p10'], 1.9)
+        self.assertAlmostEqual(s['variance'], 8.25)
+
+    def test_window(self):
+        stats = RollingStats(100)
+        for i in range(10):
+            stats.add(float(i), float(i))
+        s = stats.summary(2.5, 9.0)
+        self.assertEqual(s['count'], 3)
+        self.assertEqual(s['min'], 7.0)
+        self.assertEqual(stats.summary(1.0, 100.0), None)
+
+    def test_ring_wraps(self):
+        stats = RollingStats(5)
+        for i in range(12):
+            stats.add(float(i), float(i))
+        self.assertEqual(len(stats), 5)
+        self.assertEqual(stats.values_since(0), [ 7.0, 8.0, 9.0, 10.0, 11.0 ])
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('54 Mb/s'), 54.0)
+        self.assertEqual(parse_rate('130.0 Mbps'), 130.0)
+        self.assertEqual(parse_rate(''), None)
+        self.assertEqual(parse_rate('N/A'), None)
+
+    def test_drops(self):
+        link = WifiLinkStats()
+        link.add(0.0, True, snr = 30)
+        link.add(1.0, False)
+        link.add(2.0, False)
+        link.add(3.0, True, snr = 30)
+        link.add(4.0, False)
+        self.assertEqual(link.drops, 2)
+        self.assertEqual(link.last_drop_time, 4.0)
+
+    def test_sustained_low_snr(self):
+        link = WifiLinkStats()
+        # One bad sample among good ones isn't sustained
+        for i in range(10):
+            link.add(float(i), True, snr = (5 if i == 5 else 30))
+        self.assert_(not link.low_snr(15, 30.0, 9.0))
+
+        for i in range(10, 20):
+            link.add(float(i), True, snr = 8)
+        self.assert_(link.low_snr(15, 10.0, 19.0))
+
+    def test_roam_timeline(self):
+        timeline = RoamTimeline(rate_change_min = 0.25)
+        self.assertEqual(timeline.update(0.0, True, 'aa', 'pr2lan', 1, 54.0), [])
+        self.assertEqual(timeline.update(1.0, True, 'aa', 'pr2lan', 1, 48.0), [],
+                         "Small rate change shouldn't be an event")
+
+        events = timeline.update(2.0, True, 'bb', 'pr2lan', 6, 54.0)
+        self.assertEqual([ e.kind for e in events ], [ link_stats.ROAM ])
+        self.assertEqual((events[0].old, events[0].new), ('aa', 'bb'))
+
+        events = timeline.update(3.0, True, 'bb', 'pr2lan', 11, 12.0)
+        self.assertEqual([ e.kind for e in events ], [ link_stats.CHANNEL_CHANGE, link_stats.RATE_CHANGE ])
+
+        events = timeline.update(4.0, True, 'cc', 'guest', 11, 12.0)
+        self.assertEqual([ e.kind for e in events ], [ link_stats.ESSID_CHANGE ])
+
+        self.assertEqual([ e.kind for e in timeline.update(5.0, False, '', '', 0, None) ],
+                         [ link_stats.DISCONNECT ])
+        self.assertEqual([ e.kind for e in timeline.update(6.0, True, 'cc', 'guest', 11, 12.0) ],
+                         [ link_stats.CONNECT ])
+
+        self.assertEqual(timeline.counts[link_stats.ROAM], 1)
+        self.assertEqual(timeline.last_roam_time, 2.0)
+        self.assertEqual(timeline.roams_last_hour(100.0), 1)
+        self.assertEqual(timeline.roams_last_hour(4000.0), 0)
+        self.assertEqual(len(timeline.recent()), 6)
+        self.assertEqual(len(timeline.recent(2)), 2)
+
+    def test_timeline_bounded(self):
+        timeline = RoamTimeline(size = 5)
+        for i in range(20):
+            timeline.update(float(i), True, 'ap%d' % (i % 2), 'pr2lan', 1, 54.0)
+        self.assertEqual(len(timeline.recent()), 5)
+        self.assertEqual(timeline.counts[link_stats.ROAM], 19)
+        self.assertEqual(timeline.recent()[-1].t, 19.0)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestLinkStats)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'link_stats', TestLinkStats)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import LogCleaner
+from pr2_computer_monitor.log_cleaner import DELETE_COST
+
+import os
+import gzip
+import shutil
+import tempfile
+import time
+import sys
+
+DAY = 86400
+
+class TestLogCleaner(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    ##\brief Makes a run directory holding one log file, last written age seconds ago
+    def make_run(self, name, size, age):
+        run = os.path.join(self.root, name)
+        os.mkdir(run)
+        path = os.path.join(run, 'rosout.log')
+        with open(path, 'w') as f:
+            f.write('log line\n' * (size // 9))
+        mtime = self.now - age
+        os.utime(path, (mtime, mtime))
+        os.utime(run, (mtime, mtime))
+        return run
+
+    def cleaner(self, max_size = 1e9, max_age = 14 * DAY, min_idle = 300):
+        # No rate limit or busy check, so the tests don't wait on the disk
+        return LogCleaner(max_size, max_age, min_idle, 0, 0)
+
+    def remaining(self):
+        return sorted(n for n in os.listdir(self.root) if n != 'latest')
+
+    def test_list_runs(self):
+        self.make_run('b', 9000, 2 * DAY)
+        self.make_run('a', 9000, 1 * DAY)
+        active = self.make_run('c', 4500, 3 * DAY)
+        os.symlink(active, os.path.join(self.root, 'latest'))
+
+        runs, active_size = self.cleaner()._list_runs(self.root)
+        self.assertEqual([ os.path.basename(r[1]) for r in runs ], [ 'b', 'a' ])
+        self.assertEqual([ r[2] for r in runs ], [ 9000, 9000 ])
+        self.assertEqual(active_size, 4500)
+
+    def test_size_budget_deletes_oldest(self):
+        self.make_run('old', 9000, 3 * DAY)
+        self.make_run('mid', 9000, 2 * DAY)
+        self.make_run('new', 9000, 1 * DAY)
+
+        cleaner = self.cleaner(max_size = 20000)
+        cleaner.clean_root(self.root)
+        self.assertEqual(self.remaining(), [ 'mid', 'new' ])
+        self.assertEqual(cleaner.get_stats()['runs_deleted'], 1)
+        self.assertEqual(cleaner.get_stats()['bytes_deleted'], 9000)
+
+    def test_active_run_kept(self):
+        active = self.make_run('active', 9000, 3 * DAY)
+        os.symlink(active, os.path.join(self.root, 'latest'))
+        self.make_run('other', 9000, 1 * DAY)
+
+        self.cleaner(max_size = 1000).clean_root(self.root)
+        self.assertEqual(self.remaining(), [ 'active' ])
+
+    def test_age_budget(self):
+        self.make_run('expired', 900, 20 * DAY)
+        self.make_run('recent', 900, 1 * DAY)
+
+        self.cleaner().clean_root(self.root)
+        self.assertEqual(self.remaining(), [ 'recent' ])
+
+    def test_live_run_not_deleted(self):
+        self.make_run('old', 9000, 2 * DAY)
+        self.make_run('live', 9000, 10)
+
+        cleaner = self.cleaner(max_size = 1000)
+        cleaner.clean_root(self.root)
+        self.assertEqual(self.remaining(), [ 'live' ])
+        self.assertEqual(cleaner.get_stats()['root_sizes'][self.root], 9000)
+
+    def test_deletion_throttled(self):
+        run = self.make_run('old', 900, 20 * DAY)
+        for i in range(4):
+            path = os.path.join(run, 'extra%d.log' % i)
+            open(path, 'w').close()
+            os.utime(path, (self.now - 20 * DAY, self.now - 20 * DAY))
+        os.utime(run, (self.now - 20 * DAY, self.now - 20 * DAY))
+
+        # 20 deletions per second
+        cleaner = LogCleaner(1e9, 14 * DAY, 300, DELETE_COST * 20, 0)
+        start = time.time()
+        cleaner.clean_root(self.root)
+        elapsed = time.time() - start
+        self.assertEqual(self.remaining(), [])
+        self.assert_(elapsed > 0.2, "Deletion wasn't rate limited: %f" % elapsed)
+
+    def test_compress_idle_files(self):
+        idle = self.make_run('idle', 9000, 1 * DAY)
+        live = self.make_run('live', 9000, 10)
+
+        cleaner = self.cleaner()
+        cleaner.clean_root(self.root)
+        self.assertEqual(os.listdir(idle), [ 'rosout.log.gz' ])
+        self.assertEqual(os.listdir(live), [ 'rosout.log' ])
+        with gzip.open(os.path.join(idle, 'rosout.log.gz')) as f:
+            self.assertEqual(len(f.read()), 9000)
+
+        stats = cleaner.get_stats()
+        self.assertEqual(stats['files_compressed'], 1)
+        self.assertEqual(stats['root_sizes'][self.root], 18000 - stats['bytes_compressed'])
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestLogCleaner)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'log_cleaner', TestLogCleaner)
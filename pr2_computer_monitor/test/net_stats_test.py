@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import net_stats
+
+import os
+import shutil
+import sys
+import tempfile
+
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: %d    10    0    0    0     0          0         0 100    10    0    0    0     0       0          0
+  eth0: %d    %d    %d    0    0     0          0         0 %d    %d    0    %d    0     0       0          0
+"""
+
+SNMP = """Ip: Forwarding DefaultTTL
+Ip: 1 64
+Tcp: RtoAlgorithm RtoMin OutSegs RetransSegs
+Tcp: 1 200 %d %d
+"""
+
+class TestNetStats(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'proc', 'net'))
+        eth0 = os.path.join(self.root, 'sys', 'eth0')
+        os.makedirs(os.path.join(eth0, 'statistics'))
+        for name, value in [ ('operstate', 'up'), ('speed', '1000'), ('mtu', '1500'),
+                             ('statistics/rx_crc_errors', '3') ]:
+            with open(os.path.join(eth0, name), 'w') as f:
+                f.write(value + '\n')
+        self.collector = net_stats.NetCollector(os.path.join(self.root, 'proc'),
+                                                os.path.join(self.root, 'sys'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, rx_bytes, rx_packets, rx_errs, tx_bytes, tx_packets, tx_drop, out_segs, retrans):
+        with open(os.path.join(self.root, 'proc', 'net', 'dev'), 'w') as f:
+            f.write(NET_DEV % (100, rx_bytes, rx_packets, rx_errs, tx_bytes, tx_packets, tx_drop))
+        with open(os.path.join(self.root, 'proc', 'net', 'snmp'), 'w') as f:
+            f.write(SNMP % (out_segs, retrans))
+
+    def test_rates(self):
+        self.write(0, 0, 0, 0, 0, 0, 1000, 10)
+        rates, tcp = self.collector.sample(10.0)
+        self.assertEqual(rates['eth0'].rx_mbps, None, "No rates on the first sample")
+
+        self.write(250000000, 2000, 4, 125000000, 1000, 6, 3000, 30)
+        rates, tcp = self.collector.sample(12.0)
+        eth0 = rates['eth0']
+        self.assertAlmostEqual(eth0.rx_mbps, 1000.0)
+        self.assertAlmostEqual(eth0.tx_mbps, 500.0)
+        self.assertAlmostEqual(eth0.rx_pps, 1000.0)
+        self.assertAlmostEqual(eth0.errors_per_sec, 2.0)
+        self.assertAlmostEqual(eth0.drops_per_sec, 3.0)
+        self.assertAlmostEqual(eth0.utilisation, 1.0)
+        self.assertEqual(eth0.speed, 1000)
+        self.assertEqual(eth0.counters['rx_crc_errors'], 3)
+
+        self.assertEqual(rates['lo'].speed, None)
+        self.assertEqual(rates['lo'].utilisation, None)
+
+        self.assertAlmostEqual(tcp.retrans_per_sec, 10.0)
+        self.assertAlmostEqual(tcp.retrans_percent, 1.0)
+
+    def test_counter_reset(self):
+        self.write(5000, 50, 0, 5000, 50, 0, 1000, 10)
+        self.collector.sample(1.0)
+        self.write(100, 1, 0, 100, 1, 0, 1000, 10)
+        rates, tcp = self.collector.sample(2.0)
+        self.assertEqual(rates['eth0'].rx_mbps, None, "Counter reset shouldn't give a rate")
+
+    def test_parse_snmp(self):
+        stats = net_stats.parse_proc_net_snmp(SNMP % (5, 1))
+        self.assertEqual(stats['Tcp']['OutSegs'], 5)
+        self.assertEqual(stats['Ip']['DefaultTTL'], 64)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestNetStats)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'net_stats', TestNetStats)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import ntp_daemon
+from pr2_computer_monitor.ntp_daemon import chrony_float, parse_ntpq_vars, NTPDaemonError
+
+import os
+import shutil
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import sys
+
+# chrony floats: 7 bit exponent, 25 bit signed coefficient
+def chrony_encode(exp, coef):
+    return ((exp & 0x7f) << 25) | (coef & 0x1ffffff)
+
+def chrony_ipaddr(ip):
+    return struct.pack('!16sHH', socket.inet_aton(ip), ntp_daemon._CHRONY_IPADDR_INET4, 0)
+
+# chronyd's view of a local clock that is ahead of true time
+def tracking_reply():
+    floats = [ chrony_encode(-2, -(1 << 20)),  # correction, -1/128 s to go
+               chrony_encode(-4, 1 << 20),     # last offset, 1/512 s fast
+               chrony_encode(-5, 1 << 20),     # RMS offset
+               chrony_encode(5, 5 << 20),      # frequency, 5 ppm
+               0, 0,
+               chrony_encode(0, 1 << 20),      # root delay
+               chrony_encode(-1, 1 << 20),     # root dispersion
+               0 ]
+    return struct.pack('!I', 0x0a44ff01) + chrony_ipaddr('10.68.255.1') + \
+        struct.pack('!HH', 3, 0) + '\0' * 12 + struct.pack('!9I', *floats)
+
+def source_reply(ip, state, reach):
+    return chrony_ipaddr(ip) + struct.pack('!hHHHHH', 6, 2, state, 0, 0, reach) + '\0' * 16
+
+##\brief Answers chrony command requests on a Unix socket
+class FakeChronyd(threading.Thread):
+    def __init__(self, path, sources):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sources = sources
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.sock.settimeout(0.1)
+        self.running = True
+        self.start()
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.sock.close()
+
+    def reply_data(self, command, data):
+        if command == ntp_daemon._CHRONY_REQ_TRACKING:
+            return tracking_reply()
+        if command == ntp_daemon._CHRONY_REQ_N_SOURCES:
+            return struct.pack('!I', len(self.sources))
+        index = struct.unpack_from('!i', data, 0)[0]
+        return source_reply(*self.sources[index])
+
+    def run(self):
+        hdr = ntp_daemon._CHRONY_REQ_HDR
+        while self.running:
+            try:
+                req, addr = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            version, pkt_type, res1, res2, command, attempt, seq, pad1, pad2 = hdr.unpack_from(req)
+            reply = ntp_daemon._CHRONY_RPY_HDR.pack(version, ntp_daemon._CHRONY_PKT_REPLY, 0, 0,
+                                                    command, 0, ntp_daemon._CHRONY_STT_SUCCESS,
+                                                    0, 0, 0, seq, 0, 0)
+            self.sock.sendto(reply + self.reply_data(command, req[hdr.size:]), addr)
+
+##\brief Answers a mode 6 READVAR with the given fragments, last one first
+class FakeNtpd(threading.Thread):
+    def __init__(self, fragments):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fragments = fragments
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(2.0)
+        self.port = self.sock.getsockname()[1]
+        self.start()
+
+    def run(self):
+        req, addr = self.sock.recvfrom(512)
+        seq = ntp_daemon._NTPQ_HDR.unpack_from(req)[2]
+        offsets = [ sum(len(f) for f in self.fragments[:i]) for i in range(len(self.fragments)) ]
+        for i in reversed(range(len(self.fragments))):
+            op = ntp_daemon._NTPQ_OP_READVAR | ntp_daemon._NTPQ_RESPONSE
+            if i < len(self.fragments) - 1:
+                op |= ntp_daemon._NTPQ_MORE
+            self.sock.sendto(ntp_daemon._NTPQ_HDR.pack((2 << 3) | 6, op, seq, 0, 0, offsets[i],
+                                                       len(self.fragments[i])) + self.fragments[i], addr)
+        self.sock.close()
+
+class TestNTPDaemon(unittest.TestCase):
+    def test_chrony_float(self):
+        self.assertEqual(chrony_float(0), 0.0)
+        self.assertEqual(chrony_float(chrony_encode(2, 1 << 23)), 1.0)
+        self.assertEqual(chrony_float(chrony_encode(1, 1 << 24)), -1.0) # Coefficient sign bit
+        self.assertEqual(chrony_float(chrony_encode(-1, 1 << 23)), 0.125)
+        self.assertEqual(chrony_float(chrony_encode(1, -(1 << 23))), -0.5)
+        self.assertEqual(chrony_float(chrony_encode(63, 1)), 2.0 ** 38)
+        self.assertEqual(chrony_float(chrony_encode(-64, 1)), 2.0 ** -89)
+
+    def test_parse_tracking(self):
+        status = ntp_daemon.DaemonStatus()
+        ntp_daemon.parse_chrony_tracking(tracking_reply(), status)
+        self.assertEqual(status.ref_id, '0A44FF01')
+        self.assertEqual(status.selected_source, '10.68.255.1')
+        self.assertEqual(status.stratum, 3)
+        self.assert_(status.synchronised)
+        self.assertEqual(status.system_time_offset, -1 / 128.0)
+        self.assertEqual(status.offset, -1 / 512.0)
+        self.assertEqual(status.rms_offset, 1 / 1024.0)
+        self.assertEqual(status.freq_ppm, 5.0)
+        self.assertEqual(status.root_delay, 1 / 32.0)
+        self.assertEqual(status.root_dispersion, 1 / 64.0)
+
+        self.assertRaises(NTPDaemonError, ntp_daemon.parse_chrony_tracking,
+                          tracking_reply()[:60], status)
+
+    def test_offset_sign(self):
+        # A local clock 1/512 s fast is a negative offset, the server minus
+        # local time that the SNTP backend measures, whichever daemon runs
+        chrony = ntp_daemon.DaemonStatus()
+        ntp_daemon.parse_chrony_tracking(tracking_reply(), chrony)
+        ntpd = ntp_daemon.ntpd_status('leap=00, stratum=2, offset=-1.953125')
+        self.assert_(chrony.offset < 0)
+        self.assertEqual(chrony.offset, ntpd.offset)
+        self.assert_(chrony.system_time_offset < 0)
+
+    def test_parse_source(self):
+        self.assertEqual(ntp_daemon.parse_chrony_source(source_reply('10.0.0.2', 0, 0377)),
+                         ('10.0.0.2', 0, 0377))
+        self.assertRaises(NTPDaemonError, ntp_daemon.parse_chrony_source, '\0' * 20)
+
+    def test_parse_ntpq_vars(self):
+        vals = parse_ntpq_vars('version="ntpd 4.2.6p5", leap=00,\r\nstratum=2, offset=-0.125,\r\n'
+                               'refid=10.68.255.1, sys_jitter=0.031, rootdisp=12.5')
+        self.assertEqual(vals['version'], 'ntpd 4.2.6p5')
+        self.assertEqual(vals['leap'], '00')
+        self.assertEqual(vals['refid'], '10.68.255.1')
+        self.assertEqual(vals['offset'], '-0.125')
+
+        status = ntp_daemon.ntpd_status('leap=00, stratum=2, offset=-0.125, sys_jitter=0.031, '
+                                        'rootdelay=4.0, rootdisp=12.5, frequency=-3.5, refid=GPS')
+        self.assertEqual(status.leap, 0)
+        self.assert_(status.synchronised)
+        self.assertEqual(status.offset, -0.000125)
+        self.assertEqual(status.root_dispersion, 0.0125)
+        self.assertEqual(status.freq_ppm, -3.5)
+        self.assertEqual(status.selected_source, 'GPS')
+
+        self.assertEqual(ntp_daemon.ntpd_status('leap=11, stratum=16').leap, 3)
+        self.assertRaises(NTPDaemonError, ntp_daemon.ntpd_status, 'offset=bogus')
+
+    def test_query_ntpd_fragments(self):
+        server = FakeNtpd([ 'leap=00, stratum=2, ', 'offset=1.5, refid=10.68.255.1' ])
+        status = ntp_daemon.query_ntpd(port = server.port, timeout = 1.0)
+        self.assertEqual(status.stratum, 2)
+        self.assertEqual(status.offset, 0.0015)
+        self.assertEqual(status.ref_id, '10.68.255.1')
+
+    def test_query_chrony(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'chronyd.sock')
+            server = FakeChronyd(path, [ ('10.0.0.1', 1, 0), ('10.68.255.1', 0, 0377) ])
+            try:
+                client = ntp_daemon.ChronyClient(path, timeout = 1.0)
+                try:
+                    # Our reply socket is only open to chronyd's group
+                    local_dir = client._local_dir
+                    self.assertEqual(stat.S_IMODE(os.stat(local_dir).st_mode), 0711)
+                    sock_path = os.path.join(local_dir, os.listdir(local_dir)[0])
+                    self.assertEqual(stat.S_IMODE(os.stat(sock_path).st_mode), 0660)
+                finally:
+                    client.close()
+                self.assert_(not os.path.exists(local_dir))
+
+                status = ntp_daemon.query_chrony(path, timeout = 1.0)
+            finally:
+                server.stop()
+        finally:
+            shutil.rmtree(tmp)
+
+        self.assertEqual(status.daemon, 'chronyd')
+        self.assertEqual(status.offset, -1 / 512.0)
+        self.assertEqual(status.num_sources, 2)
+        self.assertEqual(status.reachable_sources, 1)
+        self.assertEqual(status.selected_source, '10.68.255.1')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestNTPDaemon)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'ntp_daemon', TestNTPDaemon)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import NTPPeer, SNTPError
+from diagnostic_msgs.msg import DiagnosticStatus
+
+import socket
+import threading
+import time
+import sys
+
+##\brief Peer whose SNTP queries are answered locally. An unreachable
+## peer takes its whole timeout to fail.
+class FakePeer(NTPPeer):
+    def __init__(self, host, reachable = True, **kwargs):
+        NTPPeer.__init__(self, None, 'NTP offset to ' + host, host, 'test', **kwargs)
+        self.reachable = reachable
+        self.queries = 0
+        self.published = 0
+
+    def _query_sntp(self):
+        self.queries += 1
+        if not self.reachable:
+            time.sleep(self.timeout)
+            raise SNTPError('Timeout waiting for NTP response from %s' % self.host)
+        return 0.0001, [], DiagnosticStatus.OK, "OK"
+
+    def publish(self):
+        self.published += 1
+
+class TestNTPPeer(unittest.TestCase):
+    def setUp(self):
+        self.peers = []
+
+    def tearDown(self):
+        for peer in self.peers:
+            peer.stop()
+        for peer in self.peers:
+            peer.join(2.0)
+
+    def start(self, *peers):
+        self.peers.extend(peers)
+        for peer in peers:
+            peer.start()
+
+    def test_backoff(self):
+        peer = FakePeer('down', reachable = False, interval = 1.0, timeout = 0.0, max_backoff = 10.0)
+        self.assertEqual(peer._next_delay(), 1.0)
+        delays = []
+        for i in range(5):
+            peer.check()
+            delays.append(peer._next_delay())
+        self.assertEqual(delays, [ 2.0, 4.0, 8.0, 10.0, 10.0 ])
+        self.assertEqual(peer._stat.level, DiagnosticStatus.ERROR)
+
+        peer.reachable = True
+        peer.check()
+        self.assertEqual(peer._next_delay(), 1.0)
+        self.assertEqual(peer._stat.level, DiagnosticStatus.OK)
+
+    def test_daemon_backend_local_only(self):
+        NTPPeer(None, 'self', 'localhost', 'test', backend = 'chrony')
+        NTPPeer(None, 'self', socket.gethostname(), 'test', backend = 'ntpd')
+        NTPPeer(None, 'remote', '10.68.255.1', 'test', backend = 'sntp')
+        self.assertRaises(ValueError, NTPPeer, None, 'remote', '10.68.255.1', 'test', backend = 'chrony')
+        self.assertRaises(ValueError, NTPPeer, None, 'remote', '10.68.255.1', 'test', backend = 'ntpd')
+
+    def test_unreachable_peer_does_not_delay_others(self):
+        down = FakePeer('down', reachable = False, interval = 0.05, timeout = 0.5)
+        up = FakePeer('up', interval = 0.05)
+        self.start(down, up)
+        time.sleep(1.0)
+
+        self.assert_(up.queries >= 10, "Reachable peer only queried %d times" % up.queries)
+        self.assert_(down.queries <= 3, "Unreachable peer queried %d times" % down.queries)
+
+    def test_wall_clock_step(self):
+        peer = FakePeer('up', interval = 0.05)
+        self.start(peer)
+        time.sleep(0.1)
+        # Wall clock steps back an hour
+        real_time = time.time
+        time.time = lambda: real_time() - 3600
+        try:
+            queries = peer.queries
+            time.sleep(0.5)
+        finally:
+            time.time = real_time
+        self.assert_(peer.queries >= queries + 5,
+                     "Queries stopped after a clock step: %d then %d" % (queries, peer.queries))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestNTPPeer)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'ntp_peer', TestNTPPeer)
@@ -47,6 +47,7 @@ import os, sys
 
 TEXT_PATH = 'test/sample_output/nvidia_smi_out.txt'
 TEXT_HIGH_TEMP_PATH = 'test/sample_output/nvidia_smi_high_temp.txt'
+TEXT_MULTI_GPU_PATH = 'test/sample_output/nvidia_smi_multi_gpu.txt'
 
 
 ##\brief Parses launch, tests.xml and configs.xml files in qualification
@@ -58,6 +59,9 @@ class TestNominalParser(unittest.TestCase):
         with open(os.path.join(roslib.packages.get_pkg_dir('pr2_computer_monitor'), TEXT_HIGH_TEMP_PATH), 'r') as f:
             self.high_temp_data = f.read()
 
+        with open(os.path.join(roslib.packages.get_pkg_dir('pr2_computer_monitor'), TEXT_MULTI_GPU_PATH), 'r') as f:
+            self.multi_gpu_data = f.read()
+
     def test_parse(self):
         gpu_stat = pr2_computer_monitor.parse_smi_output(self.data)
         
@@ -108,6 +112,48 @@ class TestNominalParser(unittest.TestCase):
         
         self.assert_(diag_stat.level == 2, "Diagnostics didn't reports an error for empty input. Level: %d, Message: %s" % (diag_stat.level, diag_stat.message))
 
+    def test_multi_gpu_parse(self):
+        gpus = pr2_computer_monitor.parse_smi_gpus(self.multi_gpu_data)
+        self.assertEqual(len(gpus), 2, "Expected 2 GPUs, found %d" % len(gpus))
+
+        first, second = gpus
+        self.assertEqual(first.status.product_name, 'Quadro P600')
+        self.assertEqual(first.status.pci_device_id, '0x1CB310DE')
+        self.assertEqual(first.status.pci_location, '00000000:01:00.0')
+        self.assertEqual(second.status.pci_location, '00000000:02:00.0')
+        self.assertEqual(first.status.driver_version, '440.64')
+        self.assertEqual(second.status.driver_version, '440.64')
+        self.assertEqual(first.status.display, 'Enabled')
+
+        self.assertEqual(first.status.temperature, 48)
+        self.assertEqual(second.status.temperature, 93)
+        self.assertEqual(first.status.gpu_usage, 7)
+        self.assertEqual(second.status.memory_usage, 12)
+        self.assert_(first.status.fan_speed > 0 and first.status.fan_speed < 471, "Invalid fan speed readings. Fan Speed %f" % first.status.fan_speed)
+
+        self.assertAlmostEqual(second.power_draw, 39.87)
+        self.assertAlmostEqual(second.power_limit, 40.0)
+        self.assertEqual(second.clocks['Graphics'], 1012)
+        self.assertEqual(second.max_clocks['Graphics'], 1721)
+        self.assertEqual(first.throttle_reasons, [])
+        self.assertEqual(second.throttle_reasons, [ 'SW Power Cap' ])
+        self.assertEqual(second.memory_used, 3900)
+        self.assertEqual(second.memory_total, 4096)
+
+        # First GPU is also what the single GPU parser reports
+        self.assertEqual(pr2_computer_monitor.parse_smi_output(self.multi_gpu_data).pci_location, '00000000:01:00.0')
+
+        self.assertEqual(pr2_computer_monitor.gpu_info_to_diag(first, 'GPU Status (0)').level, 0)
+        diag_stat = pr2_computer_monitor.gpu_info_to_diag(second, 'GPU Status (1)')
+        self.assertEqual(diag_stat.name, 'GPU Status (1)')
+        self.assert_(diag_stat.level == 1, "Diagnostics didn't report warning for high temp input. Level %d, Message: %s" % (diag_stat.level, diag_stat.message))
+
+    def test_tree_parse(self):
+        tree = pr2_computer_monitor.parse_smi_tree(self.data)
+        self.assertEqual(tree['Driver Version'], '260.24')
+        self.assertEqual(tree['GPU 0']['Product Name'], 'Quadro 600')
+        self.assertEqual(tree['GPU 0']['Utilization']['GPU'], '0%')
+
         
 
 if __name__ == '__main__':
@@ -117,6 +163,8 @@ if __name__ == '__main__':
         suite.addTest(TestNominalParser('test_parse'))
         suite.addTest(TestNominalParser('test_empty_parse'))
         suite.addTest(TestNominalParser('test_high_temp_parse'))
+        suite.addTest(TestNominalParser('test_multi_gpu_parse'))
+        suite.addTest(TestNominalParser('test_tree_parse'))
         
         unittest.TextTestRunner(verbosity = 2).run(suite)
     else:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import SkewEstimator
+
+import random
+import sys
+
+MIN_DELAY = 0.0002
+
+##\brief Feeds messages sent every 20ms from a remote clock with the given
+## offset (s) and skew (ppm) relative to local time, with random queueing
+def feed(est, offset, skew_ppm, duration, start = 1000.0):
+    rand = random.Random(42)
+    t = start
+    while t < start + duration:
+        remote = t - offset - skew_ppm * 1e-6 * (t - start)
+        delay = MIN_DELAY + rand.expovariate(1 / 0.002)
+        est.add(remote, t + delay, t + delay)
+        t += 0.02
+    return t
+
+class TestSkewEstimator(unittest.TestCase):
+    def test_offset_and_skew(self):
+        est = SkewEstimator(window = 60.0, bin_size = 1.0)
+        end = feed(est, 0.003, 20.0, 60.0)
+
+        skew = est.skew_ppm()
+        self.assert_(abs(skew - 20.0) < 2.0, "Wrong skew: %f" % skew)
+
+        expected = 0.003 + MIN_DELAY + 20e-6 * 60.0
+        apparent = est.apparent_delay()
+        self.assert_(abs(apparent - expected) < 0.0001, "Wrong delay: %f, expected %f" % (apparent, expected))
+
+    def test_remote_ahead(self):
+        est = SkewEstimator()
+        feed(est, -0.010, 0.0, 20.0)
+        self.assert_(est.apparent_delay() < 0, "Remote clock ahead should give negative delay")
+        self.assert_(abs(est.skew_ppm()) < 2.0, "Wrong skew: %f" % est.skew_ppm())
+
+    def test_window(self):
+        est = SkewEstimator(window = 10.0, bin_size = 1.0)
+        feed(est, 0.0, 0.0, 30.0)
+        self.assert_(est.num_bins() <= 10, "Window not enforced: %d bins" % est.num_bins())
+
+    def test_too_few_samples(self):
+        est = SkewEstimator()
+        self.assertEqual(est.skew_ppm(), None)
+        self.assertEqual(est.apparent_delay(), None)
+        est.add(100.0, 100.001, 5.0)
+        self.assertEqual(est.skew_ppm(), None)
+        self.assert_(abs(est.apparent_delay() - 0.001) < 1e-9)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestSkewEstimator)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'skew_estimator', TestSkewEstimator)
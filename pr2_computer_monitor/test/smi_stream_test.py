@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+import pr2_computer_monitor
+from pr2_computer_monitor import nvidia_smi_stream
+
+import os
+import sys
+import time
+
+FAKE_SMI = os.path.join(roslib.packages.get_pkg_dir(PKG), 'test', 'fake_nvidia_smi.py')
+
+def wait_for(cond, timeout = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+class TestSmiStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = None
+        os.environ.pop('FAKE_SMI_LINES', None)
+        os.environ.pop('FAKE_SMI_GPUS', None)
+        os.environ.pop('FAKE_SMI_THROTTLE', None)
+        os.environ.pop('FAKE_SMI_UNSUPPORTED', None)
+
+    def tearDown(self):
+        if self.stream:
+            self.stream.stop()
+
+    def start(self, **kwargs):
+        self.stream = pr2_computer_monitor.SmiStream(command = FAKE_SMI, **kwargs)
+        self.stream.start()
+
+    def test_parse_line(self):
+        row = nvidia_smi_stream.parse_csv_line(
+            '0, Quadro 600, 0x0DF810DE, 0000:03:00.0, Enabled, 270.41.06, 54, 38, 7, [Not Supported], '
+            '1354, 1721, 1354, 1721, 2505, 2505, 39.87, 40.00, 0x0000000000000044\n')
+        gpu_stat = pr2_computer_monitor.csv_to_gpu_status(row)
+        self.assertEqual(gpu_stat.product_name, 'Quadro 600')
+        self.assertEqual(gpu_stat.pci_location, '0000:03:00.0')
+        self.assertEqual(gpu_stat.temperature, 54)
+        self.assertEqual(gpu_stat.gpu_usage, 7)
+        self.assertEqual(gpu_stat.memory_usage, 0)
+        self.assert_(gpu_stat.fan_speed > 0 and gpu_stat.fan_speed < 471, "Invalid fan speed %f" % gpu_stat.fan_speed)
+
+        self.assertEqual(nvidia_smi_stream.parse_csv_line('garbage'), None)
+
+        info = pr2_computer_monitor.csv_to_gpu_info(row)
+        self.assertEqual(info.index, 0)
+        self.assertEqual(info.clocks['SM'], 1354)
+        self.assertEqual(info.max_clocks['Memory'], 2505)
+        self.assertAlmostEqual(info.power_draw, 39.87)
+        self.assertAlmostEqual(info.power_limit, 40.0)
+        self.assertEqual(info.throttle_mask, 0x44)
+        self.assertEqual(info.throttle_reasons, [ 'SW Power Cap', 'HW Thermal Slowdown' ])
+
+    def test_stream(self):
+        self.start(period = 0.05)
+        self.assert_(wait_for(lambda: len(self.stream.rows()) == 1), "No rows from fake nvidia-smi")
+
+        first = self.stream.rows()[0]['temperature.gpu']
+        self.assert_(wait_for(lambda: self.stream.rows()[0]['temperature.gpu'] != first),
+                     "Rows not updated as they're printed")
+        self.assert_(self.stream.age() < 1.0)
+        self.assertEqual(self.stream.restarts, 0)
+        self.assertEqual(self.stream.bad_lines, 0)
+
+        gpu_stat = pr2_computer_monitor.csv_to_gpu_status(self.stream.rows()[0])
+        diag = pr2_computer_monitor.gpu_status_to_diag(gpu_stat)
+        self.assertEqual(diag.level, 0, "Error for nominal stream: %s" % diag.message)
+
+    def test_throttle_reasons(self):
+        os.environ['FAKE_SMI_THROTTLE'] = '0x4'
+        self.start(period = 0.05)
+        self.assert_(wait_for(lambda: len(self.stream.rows()) == 1), "No rows from fake nvidia-smi")
+        info = pr2_computer_monitor.csv_to_gpu_info(self.stream.rows()[0])
+        self.assertEqual(info.throttle_reasons, [ 'SW Power Cap' ])
+        self.assert_('Graphics' not in info.clocks, "Unsupported field parsed as a clock")
+
+    def test_multiple_gpus(self):
+        os.environ['FAKE_SMI_GPUS'] = '2'
+        self.start(period = 0.05)
+        self.assert_(wait_for(lambda: len(self.stream.rows()) == 2), "Expected two GPUs")
+        self.assertEqual([ r['index'] for r in self.stream.rows() ], [ '0', '1' ])
+
+    def test_restart(self):
+        os.environ['FAKE_SMI_LINES'] = '2'
+        self.start(period = 0.05, min_backoff = 0.05, max_backoff = 0.1, max_failed_starts = 1)
+        self.assert_(wait_for(lambda: self.stream.restarts >= 2), "nvidia-smi not restarted")
+        self.assert_('exited' in self.stream.last_error)
+        self.assert_(len(self.stream.rows()) == 1)
+        self.assert_(not self.stream.unavailable()) # It worked before, keep trying
+
+    def test_unsupported_query(self):
+        os.environ['FAKE_SMI_UNSUPPORTED'] = '1'
+        self.start(min_backoff = 0.05, max_backoff = 0.1, max_failed_starts = 3)
+        self.assert_(wait_for(self.stream.unavailable), "Stream didn't give up")
+        self.assertEqual(self.stream.failed_starts, 3)
+        self.assertEqual(self.stream.restarts, 2)
+        self.assert_('exited with code 2' in self.stream.last_error)
+        self.stream._thread.join(1.0)
+        self.assert_(not self.stream._thread.is_alive())
+        self.assertEqual(self.stream.rows(), [])
+
+    def test_missing_command(self):
+        self.stream = pr2_computer_monitor.SmiStream(command = '/nonexistent/nvidia-smi',
+                                                     min_backoff = 0.05, max_backoff = 0.1)
+        self.stream.start()
+        self.assert_(wait_for(lambda: self.stream.restarts >= 2))
+        self.assertEqual(self.stream.rows(), [])
+        self.assertEqual(self.stream.age(), None)
+        self.assert_('Unable to run' in self.stream.last_error)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestSmiStream)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'smi_stream', TestSmiStream)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import sntp
+
+import socket
+import struct
+import threading
+import time
+import sys
+
+##\brief Stand-in NTP server on localhost, with a configurable clock offset
+class FakeNTPServer(threading.Thread):
+    def __init__(self, offset = 0.0, delay = 0.0, stratum = 2, leap = 0, respond = True):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.offset = offset
+        self.delay = delay
+        self.stratum = stratum
+        self.leap = leap
+        self.respond = respond
+        self.requests = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.start()
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.sock.close()
+
+    def run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            self.requests += 1
+            if not self.respond:
+                continue
+
+            recv = time.time() + self.offset
+            time.sleep(self.delay)
+            fields = struct.unpack('!BBbbiI4sIIIIIIII', data)
+            rsecs, rfrac = sntp.to_ntp_time(recv)
+            tsecs, tfrac = sntp.to_ntp_time(time.time() + self.offset)
+            reply = struct.pack('!BBbbiI4sIIIIIIII',
+                                (self.leap << 6) | (4 << 3) | sntp.MODE_SERVER,
+                                self.stratum, 6, -20, 0, 0, socket.inet_aton('10.68.255.1'),
+                                rsecs, rfrac,
+                                fields[13], fields[14], # Origin is the client's transmit time
+                                rsecs, rfrac, tsecs, tfrac)
+            self.sock.sendto(reply, addr)
+
+class TestSNTP(unittest.TestCase):
+    def tearDown(self):
+        self.server.stop()
+
+    def test_offset(self):
+        self.server = FakeNTPServer(offset = 0.25)
+        results = sntp.sntp_query('127.0.0.1', port = self.server.port, timeout = 1.0, samples = 3)
+
+        self.assertEqual(len(results), 3, "Expected 3 samples, got %d" % len(results))
+        sample = sntp.best_sample(results)
+        self.assert_(abs(sample.offset - 0.25) < 0.01, "Wrong offset: %f" % sample.offset)
+        self.assert_(sample.delay >= 0 and sample.delay < 0.05, "Wrong delay: %f" % sample.delay)
+        self.assertEqual(sample.stratum, 2)
+        self.assertEqual(sample.ref_id, '10.68.255.1')
+
+    def test_negative_offset(self):
+        self.server = FakeNTPServer(offset = -1.5)
+        sample = sntp.best_sample(sntp.sntp_query('127.0.0.1', port = self.server.port))
+        self.assert_(abs(sample.offset + 1.5) < 0.01, "Wrong offset: %f" % sample.offset)
+
+    def test_server_processing_not_in_delay(self):
+        self.server = FakeNTPServer(delay = 0.05)
+        sample = sntp.best_sample(sntp.sntp_query('127.0.0.1', port = self.server.port))
+        self.assert_(sample.delay < 0.02, "Server hold time counted as delay: %f" % sample.delay)
+        self.assert_(abs(sample.offset) < 0.01, "Wrong offset: %f" % sample.offset)
+
+    def test_timeout(self):
+        self.server = FakeNTPServer(respond = False)
+        start = time.time()
+        self.assertRaises(sntp.SNTPError, sntp.sntp_query, '127.0.0.1',
+                          port = self.server.port, timeout = 0.2, samples = 2)
+        elapsed = time.time() - start
+        self.assert_(elapsed < 1.0, "Query took too long to time out: %f" % elapsed)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_unsynchronized(self):
+        self.server = FakeNTPServer(leap = sntp.LEAP_ALARM)
+        self.assertRaises(sntp.SNTPError, sntp.sntp_query, '127.0.0.1',
+                          port = self.server.port, timeout = 0.2)
+
+    def test_kiss_of_death(self):
+        self.server = FakeNTPServer(stratum = 0)
+        self.assertRaises(sntp.SNTPError, sntp.sntp_query, '127.0.0.1',
+                          port = self.server.port, timeout = 0.2)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestSNTP)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'sntp', TestSNTP)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import EchoResponder, EchoProber
+
+import sys
+import time
+
+class TestUDPEcho(unittest.TestCase):
+    def setUp(self):
+        self.responder = EchoResponder(port = 0, host = '127.0.0.1')
+        self.responder.start()
+        self.prober = None
+
+    def tearDown(self):
+        if self.prober:
+            self.prober.stop()
+        self.responder.stop()
+
+    def probe(self, duration, **kwargs):
+        self.prober = EchoProber('127.0.0.1', self.responder.port, **kwargs)
+        self.prober.start()
+        time.sleep(duration)
+        return self.prober.get_stats()
+
+    def test_rtt(self):
+        stats = self.probe(0.5, rate = 100.0, timeout = 0.2)
+
+        self.assert_(stats.sent >= 20, "Too few probes sent: %d" % stats.sent)
+        self.assert_(stats.received >= stats.sent - 1, "Lost probes on loopback: %d/%d" % (stats.received, stats.sent))
+        self.assertEqual(stats.lost, 0)
+        self.assertEqual(stats.loss_percent, 0)
+        self.assert_(0 < stats.p50 <= stats.p95 <= stats.p99 <= stats.max, "Percentiles out of order")
+        self.assert_(stats.p99 < 0.05, "Loopback RTT too high: %f" % stats.p99)
+
+    def test_loss(self):
+        # Drop every other probe
+        self.responder.drop = lambda data: ord(data[11]) % 2 == 0
+        stats = self.probe(0.6, rate = 100.0, timeout = 0.1)
+
+        self.assert_(stats.lost > 0, "No loss counted")
+        self.assert_(abs(stats.loss_percent - 50) < 10, "Wrong loss: %f" % stats.loss_percent)
+
+    def test_no_responder(self):
+        self.responder.drop = lambda data: True
+        stats = self.probe(0.4, rate = 50.0, timeout = 0.1)
+
+        self.assertEqual(stats.received, 0)
+        self.assert_(stats.lost > 0)
+        self.assertEqual(stats.loss_percent, 100)
+        self.assertEqual(stats.p50, None)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestUDPEcho)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'udp_echo', TestUDPEcho)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import wireless
+from pr2_computer_monitor.wireless import pack_attr
+
+import struct
+import sys
+
+PROC_WIRELESS = """Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+ face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+  wlan0: 0000   58.  -52.  -256        0      0      0      3      0        0
+   wlan1: 0000   40.  -70.  -92.        0      0      0      0      0        0
+"""
+
+class TestWireless(unittest.TestCase):
+    def test_proc_wireless(self):
+        wlan0 = wireless.parse_proc_wireless(PROC_WIRELESS, 'wlan0')
+        self.assertEqual(wlan0['quality'], 58)
+        self.assertEqual(wlan0['signal'], -52)
+        self.assertEqual(wlan0['noise'], None, "-256 means the driver has no noise value")
+
+        wlan1 = wireless.parse_proc_wireless(PROC_WIRELESS, 'wlan1')
+        self.assertEqual(wlan1['noise'], -92)
+
+        self.assertEqual(wireless.parse_proc_wireless(PROC_WIRELESS, 'wlan2'), None)
+
+    def test_station_info(self):
+        bitrate = pack_attr(wireless.NL80211_RATE_INFO_BITRATE32, struct.pack('=I', 1300)) + \
+            pack_attr(wireless.NL80211_RATE_INFO_BITRATE, struct.pack('=H', 1300))
+        info = pack_attr(wireless.NL80211_STA_INFO_SIGNAL, struct.pack('=b', -61)) + \
+            pack_attr(wireless.NL80211_STA_INFO_TX_BITRATE | 0x8000, bitrate) + \
+            pack_attr(wireless.NL80211_STA_INFO_TX_PACKETS, struct.pack('=I', 1000)) + \
+            pack_attr(wireless.NL80211_STA_INFO_TX_RETRIES, struct.pack('=I', 120)) + \
+            pack_attr(wireless.NL80211_STA_INFO_TX_FAILED, struct.pack('=I', 4))
+
+        sta = wireless.parse_station_info(info)
+        self.assertEqual(sta['signal'], -61)
+        self.assertEqual(sta['tx_bitrate'], 130.0)
+        self.assertEqual(sta['tx_packets'], 1000)
+        self.assertEqual(sta['tx_retries'], 120)
+        self.assertEqual(sta['tx_failed'], 4)
+        self.assert_('beacon_loss' not in sta)
+
+    def test_attr_padding(self):
+        attrs = wireless.parse_attrs(pack_attr(1, 'abc') + pack_attr(2, 'defgh') + pack_attr(3, ''))
+        self.assertEqual(attrs, { 1: 'abc', 2: 'defgh', 3: '' })
+
+    def test_channels(self):
+        self.assertEqual(wireless.freq_to_channel(2412), 1)
+        self.assertEqual(wireless.freq_to_channel(2484), 14)
+        self.assertEqual(wireless.freq_to_channel(5180), 36)
+        self.assertEqual(wireless.freq_to_channel(0), 0)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        suite = unittest.TestLoader().loadTestsFromTestCase(TestWireless)
+        unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'wireless', TestWireless)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the Willow Garage nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import division
+
+PKG = 'pr2_computer_monitor'
+
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from pr2_computer_monitor import WriteLatencyProbe, LatencyHistogram
+from pr2_computer_monitor import write_latency
+from pr2_computer_monitor.write_latency import latency_level
+
+import os
+import shutil
+import tempfile
+import time
+import sys
+
+# Buckets are a quarter octave wide
+BUCKET_RATIO = 2 ** 0.25
+
+class TestLatencyHistogram(unittest.TestCase):
+    def assertInBucket(self, value, expected):
+        self.assert_(expected <= value <= expected * BUCKET_RATIO,
+                     "%g is not in the bucket of %g" % (value, expected))
+
+    def test_empty(self):
+        hist = LatencyHistogram()
+        self.assertEqual(len(hist), 0)
+        self.assertEqual(hist.percentile(99), 0.0)
+        self.assertEqual(hist.max(), 0.0)
+        self.assertEqual(hist.last(), 0.0)
+
+    def test_percentiles(self):
+        hist = LatencyHistogram()
+        for i in range(98):
+            hist.add(0.001)
+        hist.add(0.010)
+        hist.add(0.500)
+
+        self.assertInBucket(hist.percentile(50), 0.001)
+        self.assertInBucket(hist.percentile(98), 0.001)
+        self.assertInBucket(hist.percentile(99), 0.010)
+        self.assertEqual(hist.percentile(100), 0.500) # Capped at the largest sample
+        self.assertEqual(hist.max(), 0.500)
+        self.assertEqual(hist.last(), 0.500)
+
+    def test_window(self):
+        hist = LatencyHistogram(window = 10)
+        for i in range(10):
+            hist.add(1.0)
+        for i in range(10):
+            hist.add(0.002)
+
+        self.assertEqual(len(hist), 10)
+        self.assertEqual(hist.total_count, 20)
+        self.assertEqual(hist.max(), 0.002)
+        self.assertInBucket(hist.percentile(100), 0.002)
+
+    def test_out_of_range(self):
+        hist = LatencyHistogram()
+        hist.add(0.0)
+        hist.add(1000.0)
+        self.assertEqual(hist.percentile(50), LatencyHistogram.MIN_LATENCY)
+        # The top bucket holds everything above about 20s
+        self.assert_(hist.percentile(100) > 10.0)
+        self.assertEqual(hist.max(), 1000.0)
+
+    def test_level(self):
+        warn, error = 0.1, 1.0
+        hist = LatencyHistogram()
+        self.assertEqual(latency_level(hist, warn, error), write_latency.OK)
+        for i in range(200):
+            hist.add(0.005)
+        self.assertEqual(latency_level(hist, warn, error), write_latency.OK)
+
+        hist.add(0.2) # Last sample over the warn threshold
+        self.assertEqual(latency_level(hist, warn, error), write_latency.SLOW)
+        hist.add(0.005) # One slow sample in 200 is below the 99th percentile
+        self.assertEqual(latency_level(hist, warn, error), write_latency.OK)
+        for i in range(3):
+            hist.add(0.2)
+            hist.add(0.005)
+        self.assertEqual(latency_level(hist, warn, error), write_latency.SLOW)
+
+        hist.add(2.0)
+        self.assertEqual(latency_level(hist, warn, error), write_latency.VERY_SLOW)
+
+class TestWriteLatencyProbe(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.probe = WriteLatencyProbe(self.dir)
+
+    def tearDown(self):
+        self.probe.close()
+        shutil.rmtree(self.dir)
+
+    def test_probe(self):
+        write, total = self.probe.probe()
+        self.assert_(0 <= write <= total, "Bad latencies: %f, %f" % (write, total))
+        self.assertEqual(len(self.probe.total_hist), 1)
+        self.assert_(os.path.exists(self.probe.path))
+
+    def test_clock_step_ignored(self):
+        # A wall clock that runs backwards by an hour on every read
+        real_time = time.time
+        steps = [ 0 ]
+        def stepping_time():
+            steps[0] += 1
+            return real_time() - 3600 * steps[0]
+        time.time = stepping_time
+        try:
+            write, total = self.probe.probe()
+        finally:
+            time.time = real_time
+        self.assert_(0 <= write <= total < 60, "Bad latencies: %f, %f" % (write, total))
+
+    def test_remove(self):
+        self.probe.probe()
+        self.probe.remove()
+        self.assert_(not os.path.exists(self.probe.path))
+        self.assertRaises(OSError, self.probe.probe)
+        self.assert_(not os.path.exists(self.probe.path))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '-v':
+        for test in [ TestLatencyHistogram, TestWriteLatencyProbe ]:
+            suite = unittest.TestLoader().loadTestsFromTestCase(test)
+            unittest.TextTestRunner(verbosity = 2).run(suite)
+    else:
+        import rostest
+        rostest.unitrun(PKG, 'latency_histogram', TestLatencyHistogram)
+        rostest.unitrun(PKG, 'write_latency_probe', TestWriteLatencyProbe)